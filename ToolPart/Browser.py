@@ -1,10 +1,51 @@
 import random
+import socket
+import time
+from typing import Any, Callable, Optional, Dict, Set, List
+
 from DrissionPage import ChromiumPage, ChromiumOptions
 
+# 单次阻塞等待的最长时间，期间由浏览器端事件决定何时返回，到点后回到调用方检查暂停/停止
+WAIT_STEP = 0.5
+
+# 解析各阶段只需要页面 DOM，以下请求一律拦截（Cloudflare 验证相关域名不在其中）
+BLOCKED_MEDIA_PATTERNS = [
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp4", "*.webm", "*.m3u8", "*.ts", "*.vtt",
+]
+BLOCKED_THIRD_PARTY_PATTERNS = [
+    "*googletagmanager.com*", "*google-analytics.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*fonts.googleapis.com*", "*fonts.gstatic.com*",
+    "*exoclick.com*", "*exosrv.com*", "*juicyads.com*", "*trafficjunky.net*",
+    "*realsrv.com*", "*magsrv.com*",
+]
+BLOCKED_PATTERNS: List[str] = BLOCKED_MEDIA_PATTERNS + BLOCKED_THIRD_PARTY_PATTERNS
+# 可以单独开关拦截的解析阶段，各阶段使用相同的拦截规则
+RESOURCE_STAGES = ("playlist", "video", "download")
+
+
+def find_free_port() -> int:
+    """向系统申请一个空闲端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_browser(headless: bool = True, block_resources: bool = False,
+                user_data_dir: Optional[str] = None, cache_size: int = 0):
+    """创建并配置浏览器实例
 
-def get_browser(headless: bool = True):
-    """创建并配置浏览器实例"""
-    options = ChromiumOptions().auto_port()
+    指定 user_data_dir 时使用持久化用户目录（保留 HTTP 缓存），否则每次使用临时目录。
+    """
+    options = ChromiumOptions()
+    if user_data_dir:
+        options.set_user_data_path(user_data_dir)
+        options.set_local_port(find_free_port())
+        if cache_size > 0:
+            options.set_argument(f'--disk-cache-size={cache_size}')
+    else:
+        options.auto_port()
     options.set_argument('--no-sandbox')
     options.set_argument('--disable-gpu')
     options.set_argument('--disable-dev-shm-usage')
@@ -25,6 +66,11 @@ def get_browser(headless: bool = True):
         # 非无头模式下，可以添加一些优化参数
         options.set_argument('--start-maximized')
 
+    # 拦截模式下静音并禁止自动播放，避免视频预览占用解码资源
+    if block_resources:
+        options.mute(True)
+        options.set_argument('--autoplay-policy=user-gesture-required')
+
     # 设置用户代理
     user_agents = [
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
@@ -33,4 +79,57 @@ def get_browser(headless: bool = True):
     ]
     options.set_user_agent(random.choice(user_agents))
 
-    return ChromiumPage(addr_or_opts=options)
\ No newline at end of file
+    return ChromiumPage(addr_or_opts=options)
+
+
+def resource_blocking_stages(settings: Dict[str, Any], headless: bool) -> Set[str]:
+    """根据设置计算需要拦截资源的解析阶段，非无头模式默认不拦截以便调试"""
+    if not settings.get("BlockResources", True):
+        return set()
+    if not headless and not settings.get("BlockResourcesWhenVisible", False):
+        return set()
+    stages = str(settings.get("BlockStages", ""))
+    return {stage.strip() for stage in stages.split(",") if stage.strip() in RESOURCE_STAGES}
+
+
+def apply_resource_profile(browser, stage: str, blocked_stages: Set[str]) -> None:
+    """为即将打开的页面设置请求拦截规则，未启用的阶段清空规则"""
+    if not blocked_stages:
+        return
+    patterns = BLOCKED_PATTERNS if stage in blocked_stages else []
+    browser.run_cdp('Network.enable')
+    browser.run_cdp('Network.setBlockedURLs', urls=patterns)
+
+
+def wait_for(condition: Callable[[float], Any], timeout: float,
+             checkpoint: Optional[Callable[[], bool]] = None, step: float = WAIT_STEP) -> Any:
+    """等待条件成立，条件满足时立即返回其结果
+
+    condition 接收本轮允许阻塞的秒数，应在条件成立时立刻返回真值；
+    checkpoint 返回 False 表示任务已停止，此时放弃等待并返回 None；超时同样返回 None。
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        if checkpoint and not checkpoint():
+            return None
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+
+        result = condition(min(step, remaining))
+        if result:
+            return result
+
+
+def wait_ele(browser, locator: str, timeout: float,
+             checkpoint: Optional[Callable[[], bool]] = None):
+    """等待元素出现并返回该元素，超时或停止时返回 None"""
+    return wait_for(lambda t: browser.ele(locator, timeout=t), timeout, checkpoint)
+
+
+def wait_title_excludes(browser, text: str, timeout: float,
+                        checkpoint: Optional[Callable[[], bool]] = None) -> bool:
+    """等待页面标题不再包含指定文本（如 Cloudflare 的 "Just a moment"）"""
+    return bool(wait_for(lambda t: browser.wait.title_change(text, exclude=True, timeout=t),
+                         timeout, checkpoint))
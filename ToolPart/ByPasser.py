@@ -1,14 +1,17 @@
-import time
 from typing import Optional
 
+from ToolPart.Browser import wait_title_excludes
 from ToolPart.Logger import LogEmitter
+from ToolPart.RetryPolicy import ErrorClass, RetryPolicy
 
 
 class CloudflareByPasser:
-    def __init__(self, driver, max_retries: int = -1, log_emitter: Optional[LogEmitter] = None):
+    def __init__(self, driver, max_retries: int = -1, log_emitter: Optional[LogEmitter] = None,
+                 retry_policy: Optional[RetryPolicy] = None):
         self.driver = driver
         self.max_retries = max_retries
         self.log_emitter = log_emitter
+        self.retry_policy = retry_policy or RetryPolicy()
 
     def search_recursively_shadow_root_with_iframe(self, ele):
         if ele.shadow_root:
@@ -86,11 +89,9 @@ class CloudflareByPasser:
             self.click_verification_button()
 
             try_count += 1
-            start_time = time.time()
-            while time.time() - start_time < 10:
-                if self.is_bypassed():
-                    break
-                time.sleep(0.5)
+            # 等待时间按验证失败的退避规则逐次增加，通过后立即返回
+            wait_title_excludes(self.driver, "Just a moment",
+                                max(self.retry_policy.backoff(ErrorClass.CHALLENGE, try_count), 5))
 
         if self.is_bypassed():
             self.log_message("成功绕过Cloudflare验证")
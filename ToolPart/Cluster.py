@@ -0,0 +1,531 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import requests
+
+from ToolPart.EventLog import set_process_tag
+from ToolPart.RetryPolicy import ErrorClass
+from ToolPart.SourcePolicy import SourcePolicy
+
+# 租约过期后重新分配的最多次数，超过后视为失败交给下载线程按重试策略处理
+MAX_REASSIGN = 3
+# 工作节点没有任务时再次申请的间隔（秒）
+IDLE_POLL_INTERVAL = 2
+# 工作节点请求协调节点的超时（秒）
+REQUEST_TIMEOUT = 10
+# 每次心跳最多带回的日志条数
+MAX_LOG_BATCH = 200
+
+# （是否成功，错误信息，文件名，失败类型，文件信息，暂停或停止时保存的断点）
+JobResult = Tuple[bool, str, Optional[str], str, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+class ClusterJob:
+    """协调节点上的一个视频下载任务"""
+
+    def __init__(self, task_id: str, video_url: str, download_dir: str, policy: Dict[str, Any]):
+        self.job_id = uuid.uuid4().hex
+        self.task_id = task_id
+        self.video_url = video_url
+        self.download_dir = download_dir
+        self.policy = policy
+        self.future: Future = Future()
+        self.worker_id: Optional[str] = None
+        self.lease_until = 0.0
+        self.assignments = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "task_id": self.task_id,
+            "video_url": self.video_url,
+            "download_dir": self.download_dir,
+            "source_policy": self.policy,
+        }
+
+
+class Coordinator:
+    """持有视频下载队列，通过 HTTP/JSON 把任务租给各工作节点
+
+    工作节点定期发送心跳续租；租约过期（节点崩溃或断网）的任务重新放回队列分配给其他节点。
+    任务记录仍由本机的下载线程维护，工作节点只负责解析和下载单个视频并回报结果。
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8770, lease_seconds: float = 60,
+                 token: str = "", log: Optional[Callable[[str], None]] = None):
+        self.lease_seconds = lease_seconds
+        self.token = token
+        self.log = log or print
+        self.lock = threading.Lock()
+        self.queue: Deque[ClusterJob] = deque()
+        self.jobs: Dict[str, ClusterJob] = {}  # job_id -> 未完成的任务
+        self.workers: Dict[str, Dict[str, Any]] = {}  # worker_id -> 名称、最后心跳时间
+        self.paused_tasks = set()
+        self.stopped_tasks = set()
+        self.discarded_tasks = set()  # 已删除的任务，工作节点停止时不保留断点
+        self.listeners: Dict[str, Callable[[str], None]] = {}
+
+        coordinator = self
+
+        class Handler(CoordinatorHandler):
+            pass
+
+        Handler.coordinator = coordinator
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = "%s:%d" % self.server.server_address[:2]
+        threading.Thread(target=self.server.serve_forever, name="coordinator-http", daemon=True).start()
+        threading.Thread(target=self._reap_loop, name="coordinator-reaper", daemon=True).start()
+
+    def submit(self, task_id: str, video_url: str, download_dir: str, policy: SourcePolicy) -> Future:
+        """加入队列，返回结果 Future（结果格式与工作进程相同）"""
+        job = ClusterJob(task_id, video_url, download_dir, policy.to_dict())
+        with self.lock:
+            if task_id in self.stopped_tasks:
+                job.future.set_result((False, "任务已停止", None, ErrorClass.STOPPED, None, None))
+                return job.future
+            self.jobs[job.job_id] = job
+            self.queue.append(job)
+        return job.future
+
+    def register(self, task_id: str, log: Callable[[str], None]) -> None:
+        with self.lock:
+            self.listeners[task_id] = log
+            self.stopped_tasks.discard(task_id)
+            self.discarded_tasks.discard(task_id)
+            self.paused_tasks.discard(task_id)
+
+    def unregister(self, task_id: str) -> None:
+        with self.lock:
+            self.listeners.pop(task_id, None)
+            self._prune_tasks()
+
+    def _prune_tasks(self) -> None:
+        """已结束的任务（没有注册、也没有排队或分配中的视频）不再保留暂停/停止状态，调用时需持有锁"""
+        live = set(self.listeners) | {job.task_id for job in self.jobs.values()}
+        for tasks in (self.paused_tasks, self.stopped_tasks, self.discarded_tasks):
+            tasks &= live
+
+    def pause_task(self, task_id: str, paused: bool) -> None:
+        """暂停时不再分配该任务的视频，已分配的视频在下次心跳时通知工作节点暂停"""
+        with self.lock:
+            if paused:
+                self.paused_tasks.add(task_id)
+            else:
+                self.paused_tasks.discard(task_id)
+
+    def stop_task(self, task_id: str, discard: bool = False) -> None:
+        """取消该任务排队中的视频，已分配的视频在下次心跳时通知工作节点停止；
+        discard 为 True 时（删除任务）工作节点同时删除未完成的文件"""
+        with self.lock:
+            self.stopped_tasks.add(task_id)
+            if discard:
+                self.discarded_tasks.add(task_id)
+            cancelled = [job for job in self.queue if job.task_id == task_id]
+            for job in cancelled:
+                self.queue.remove(job)
+                self.jobs.pop(job.job_id, None)
+        for job in cancelled:
+            job.future.set_result((False, "任务已停止", None, ErrorClass.STOPPED, None, None))
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self.lock:
+            return {
+                "queued": len(self.queue),
+                "leased": len(self.jobs) - len(self.queue),
+                "workers": [{"worker_id": worker_id, "name": info["name"],
+                             "idle_seconds": round(now - info["last_seen"], 1),
+                             "jobs": sum(1 for job in self.jobs.values() if job.worker_id == worker_id)}
+                            for worker_id, info in self.workers.items()],
+            }
+
+    # ---- 工作节点请求 ----
+
+    def handle_register(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        worker_id = uuid.uuid4().hex
+        name = str(data.get("name") or worker_id[:8])
+        with self.lock:
+            self.workers[worker_id] = {"name": name, "last_seen": time.monotonic()}
+        self.log(f"工作节点已连接: {name}")
+        return {"worker_id": worker_id, "lease_seconds": self.lease_seconds}
+
+    def handle_lease(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        worker_id = data.get("worker_id")
+        with self.lock:
+            if worker_id not in self.workers:
+                return {"error": "unknown worker"}
+            self.workers[worker_id]["last_seen"] = time.monotonic()
+            for job in list(self.queue):
+                if job.task_id in self.paused_tasks:
+                    continue
+                self.queue.remove(job)
+                job.worker_id = worker_id
+                job.lease_until = time.monotonic() + self.lease_seconds
+                job.assignments += 1
+                return {"job": job.to_dict()}
+        return {"job": None}
+
+    def handle_heartbeat(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """续租工作节点正在执行的任务，转发日志，返回需要暂停或停止的任务"""
+        worker_id = data.get("worker_id")
+        self._route_logs(data.get("logs") or [])
+        lost: List[str] = []
+        pause: List[str] = []
+        stop: List[str] = []
+        discard: List[str] = []
+        with self.lock:
+            if worker_id not in self.workers:
+                return {"error": "unknown worker"}
+            self.workers[worker_id]["last_seen"] = time.monotonic()
+            for job_id in data.get("job_ids") or []:
+                job = self.jobs.get(job_id)
+                if job is None or job.worker_id != worker_id:
+                    # 租约已过期并重新分配，或任务已结束
+                    lost.append(job_id)
+                    continue
+                job.lease_until = time.monotonic() + self.lease_seconds
+                if job.task_id in self.stopped_tasks:
+                    stop.append(job_id)
+                    if job.task_id in self.discarded_tasks:
+                        discard.append(job_id)
+                elif job.task_id in self.paused_tasks:
+                    pause.append(job_id)
+        return {"lost": lost, "pause": pause, "stop": stop, "discard": discard}
+
+    def handle_result(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        self._route_logs(data.get("logs") or [])
+        with self.lock:
+            job = self.jobs.get(data.get("job_id"))
+            if job is None or job.worker_id != data.get("worker_id"):
+                return {"accepted": False}
+            del self.jobs[job.job_id]
+        result = (bool(data.get("success")), data.get("error") or "", data.get("filename"),
+                  data.get("error_class") or ErrorClass.UNKNOWN, data.get("file_info"), data.get("partial"))
+        job.future.set_result(result)
+        return {"accepted": True}
+
+    def _route_logs(self, logs: List[List[str]]) -> None:
+        for task_id, message in logs:
+            with self.lock:
+                listener = self.listeners.get(task_id)
+            if listener:
+                listener(message)
+
+    def _reap_loop(self) -> None:
+        while True:
+            time.sleep(min(5.0, self.lease_seconds / 4))
+            try:
+                self._reap()
+            except Exception as e:
+                print(f"回收租约出错: {str(e)}")
+
+    def _reap(self) -> None:
+        """回收过期的租约，工作节点长时间无心跳时移除"""
+        now = time.monotonic()
+        failed: List[ClusterJob] = []
+        with self.lock:
+            for job in self.jobs.values():
+                if job.worker_id is None or job.lease_until > now:
+                    continue
+                worker = self.workers.get(job.worker_id, {}).get("name", job.worker_id)
+                job.worker_id = None
+                if job.task_id in self.stopped_tasks or job.assignments >= MAX_REASSIGN:
+                    failed.append(job)
+                else:
+                    self.log(f"工作节点 {worker} 的租约已过期，重新分配: {job.video_url}")
+                    self.queue.appendleft(job)
+            for job in failed:
+                del self.jobs[job.job_id]
+            for worker_id, info in list(self.workers.items()):
+                if now - info["last_seen"] > self.lease_seconds * 3:
+                    del self.workers[worker_id]
+                    self.log(f"工作节点已断开: {info['name']}")
+        for job in failed:
+            if job.future.done():
+                continue
+            if job.task_id in self.stopped_tasks:
+                job.future.set_result((False, "任务已停止", None, ErrorClass.STOPPED, None, None))
+            else:
+                # 租约多次过期都没有结果，按超时处理，由下载线程按重试策略决定是否再试
+                job.future.set_result((False, f"已分配 {job.assignments} 次，工作节点均未回报结果",
+                                       None, ErrorClass.TIMEOUT, None, None))
+        with self.lock:
+            self._prune_tasks()
+
+    def shutdown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    coordinator: Coordinator
+
+    routes = {
+        "/register": "handle_register",
+        "/lease": "handle_lease",
+        "/heartbeat": "handle_heartbeat",
+        "/result": "handle_result",
+    }
+
+    def do_GET(self) -> None:
+        if not self._authorized():
+            return
+        if self.path == "/status":
+            self._reply(200, self.coordinator.status())
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        if not self._authorized():
+            return
+        name = self.routes.get(self.path)
+        if name is None:
+            self._reply(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._reply(400, {"error": "invalid json"})
+            return
+        reply = getattr(self.coordinator, name)(data)
+        self._reply(403 if reply.get("error") == "unknown worker" else 200, reply)
+
+    def _authorized(self) -> bool:
+        if self.coordinator.token and self.headers.get("X-Cluster-Token") != self.coordinator.token:
+            self._reply(401, {"error": "unauthorized"})
+            return False
+        return True
+
+    def _reply(self, code: int, data: Dict[str, Any]) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # 不在控制台输出每个请求
+        pass
+
+
+_coordinator: Optional[Coordinator] = None
+_coordinator_lock = threading.Lock()
+
+
+def get_coordinator(settings: Dict[str, Any], log: Optional[Callable[[str], None]] = None) -> Coordinator:
+    """获取进程内的协调节点，首次调用时按设置启动 HTTP 服务"""
+    global _coordinator
+    with _coordinator_lock:
+        if _coordinator is None:
+            _coordinator = Coordinator(settings["CoordinatorHost"], settings["CoordinatorPort"],
+                                       settings["LeaseSeconds"], settings["ClusterToken"], log)
+        return _coordinator
+
+
+class WorkerJobControl:
+    """工作节点上单个视频的暂停/停止状态，由心跳结果更新"""
+
+    def __init__(self, shutdown: threading.Event):
+        self.shutdown = shutdown
+        self.stop_event = threading.Event()
+        self.discard_event = threading.Event()  # 任务已删除，停止时不保留断点
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+
+    def is_running(self) -> bool:
+        return not (self.stop_event.is_set() or self.shutdown.is_set())
+
+    def is_paused(self) -> bool:
+        return not self.resume_event.is_set()
+
+    def is_discarded(self) -> bool:
+        return self.discard_event.is_set()
+
+    def checkpoint(self) -> bool:
+        while not self.resume_event.wait(1):
+            if not self.is_running():
+                return False
+        return self.is_running()
+
+    def sleep(self, seconds: float) -> None:
+        self.stop_event.wait(seconds)
+
+
+class ClusterWorker:
+    """工作节点：向协调节点申请视频、下载并回报结果
+
+    下载使用本机配置文件中的高级设置（浏览器、暂存目录、磁盘空间等）；
+    指定 download_root 时文件保存到 download_root 下与协调节点下载目录同名的子目录，
+    否则直接使用协调节点给出的下载目录（本机或共享盘）。
+    """
+
+    def __init__(self, url: str, jobs: int = 1, settings: Optional[Dict[str, Any]] = None,
+                 headless: bool = True, download_root: str = "", token: str = "", name: str = ""):
+        self.url = url.rstrip("/")
+        self.jobs = max(1, jobs)
+        self.settings = settings or {}
+        self.headless = headless
+        self.download_root = download_root
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.session = requests.Session()
+        if token:
+            self.session.headers["X-Cluster-Token"] = token
+        self.worker_id: Optional[str] = None
+        self.heartbeat_interval = 10.0
+        self.shutdown = threading.Event()
+        self.lock = threading.Lock()
+        self.active: Dict[str, WorkerJobControl] = {}  # job_id -> 控制状态
+        self.logs: List[List[str]] = []
+
+    def log(self, message: str) -> None:
+        print(message, flush=True)
+
+    def _post(self, path: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        response = self.session.post(self.url + path, json=data, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 403:
+            # 协调节点已重启或已移除本节点，重新注册
+            self.worker_id = None
+        response.raise_for_status()
+        return response.json()
+
+    def _register(self) -> None:
+        while not self.shutdown.is_set():
+            try:
+                reply = self._post("/register", {"name": self.name})
+                self.worker_id = reply["worker_id"]
+                # 每个租约周期内至少发送三次心跳
+                self.heartbeat_interval = max(1.0, float(reply.get("lease_seconds", 60)) / 3)
+                self.log(f"已连接协调节点 {self.url}，节点名称: {self.name}")
+                return
+            except (requests.RequestException, ValueError, KeyError) as e:
+                self.log(f"连接协调节点失败，稍后重试: {str(e)}")
+                self.shutdown.wait(5)
+
+    def run(self) -> None:
+        """主循环，直到 stop() 被调用"""
+        threading.Thread(target=self._heartbeat_loop, name="worker-heartbeat", daemon=True).start()
+        while not self.shutdown.is_set():
+            if self.worker_id is None:
+                self._register()
+                continue
+            with self.lock:
+                busy = len(self.active)
+            if busy >= self.jobs:
+                self.shutdown.wait(0.5)
+                continue
+            try:
+                job = self._post("/lease", {"worker_id": self.worker_id}).get("job")
+            except (requests.RequestException, ValueError) as e:
+                self.log(f"申请任务失败: {str(e)}")
+                self.shutdown.wait(IDLE_POLL_INTERVAL)
+                continue
+            if not job:
+                self.shutdown.wait(IDLE_POLL_INTERVAL)
+                continue
+            control = WorkerJobControl(self.shutdown)
+            with self.lock:
+                self.active[job["job_id"]] = control
+            threading.Thread(target=self._run_job, args=(job, control),
+                             name=f"job-{job['job_id'][:8]}", daemon=True).start()
+
+    def stop(self) -> None:
+        self.shutdown.set()
+
+    def _local_dir(self, download_dir: str) -> str:
+        if not self.download_root:
+            return download_dir
+        name = os.path.basename(os.path.normpath(download_dir.replace("\\", "/"))) or "downloads"
+        return os.path.join(self.download_root, name)
+
+    def _run_job(self, job: Dict[str, Any], control: WorkerJobControl) -> None:
+        from ToolPart.VideoJob import VideoJob
+
+        task_id = job["task_id"]
+
+        def log(message: str) -> None:
+            self.log(message)
+            with self.lock:
+                self.logs.append([task_id, message])
+
+        try:
+            video_job = VideoJob(self._local_dir(job["download_dir"]), self.headless, self.settings,
+                                 SourcePolicy.from_dict(job["source_policy"]), log,
+                                 control.checkpoint, control.is_running, control.sleep, control.is_paused,
+                                 control.is_discarded)
+            success, error, filename, error_class = video_job.attempt(job["video_url"])
+            file_info = video_job.file_records.pop(filename, None) if filename else None
+            partial = video_job.partials.pop(job["video_url"], None)
+        except Exception as e:
+            success, error, filename, error_class, file_info, partial = False, f"工作节点出错: {str(e)}", None, \
+                ErrorClass.UNKNOWN, None, None
+
+        result = {"worker_id": self.worker_id, "job_id": job["job_id"], "success": success, "error": error,
+                  "filename": filename, "error_class": error_class, "file_info": file_info, "partial": partial}
+        # 回报失败时保留结果重试，直到协调节点收到或租约被收回
+        while not self.shutdown.is_set():
+            try:
+                result["logs"] = self._take_logs()
+                self._post("/result", result)
+                break
+            except (requests.RequestException, ValueError) as e:
+                self.log(f"回报结果失败，稍后重试: {str(e)}")
+                self.shutdown.wait(5)
+        with self.lock:
+            self.active.pop(job["job_id"], None)
+
+    def _take_logs(self) -> List[List[str]]:
+        with self.lock:
+            logs, self.logs = self.logs[:MAX_LOG_BATCH], self.logs[MAX_LOG_BATCH:]
+        return logs
+
+    def _heartbeat_loop(self) -> None:
+        while not self.shutdown.wait(self.heartbeat_interval):
+            if self.worker_id is None:
+                continue
+            with self.lock:
+                job_ids = list(self.active)
+            try:
+                reply = self._post("/heartbeat", {"worker_id": self.worker_id, "job_ids": job_ids,
+                                                  "logs": self._take_logs()})
+            except (requests.RequestException, ValueError) as e:
+                self.log(f"发送心跳失败: {str(e)}")
+                continue
+            with self.lock:
+                for job_id in job_ids:
+                    control = self.active.get(job_id)
+                    if control is None:
+                        continue
+                    if job_id in reply.get("stop", []) or job_id in reply.get("lost", []):
+                        # 任务已停止，或租约已被收回分配给其他节点
+                        if job_id in reply.get("discard", []):
+                            control.discard_event.set()
+                        control.stop_event.set()
+                    elif job_id in reply.get("pause", []):
+                        control.resume_event.clear()
+                    else:
+                        control.resume_event.set()
+
+
+def run_worker(url: str, jobs: int = 1, headless: bool = True, download_root: str = "",
+               token: str = "", name: str = "", config_file: str = "./config.ini") -> None:
+    """以工作节点方式运行，直到按 Ctrl+C"""
+    from ToolPart.Settings import load_advanced_settings
+
+    # 同一台机器上可能运行多个工作节点，各自写单独的事件日志文件
+    set_process_tag(f"node{os.getpid()}")
+    worker = ClusterWorker(url, jobs, load_advanced_settings(config_file), headless, download_root, token, name)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
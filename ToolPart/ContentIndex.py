@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from ToolPart.Integrity import check_mp4
+
+# Linux 下 FICLONE ioctl，在 Btrfs/XFS 等文件系统上创建共享数据块的副本
+FICLONE = 0x40049409
+DEFAULT_METHODS = ("hardlink", "reflink", "copy")
+
+
+def video_id_from_url(url: str) -> str:
+    """视频页面 URL 中的视频ID（v 参数），没有时使用 URL 的摘要"""
+    values = parse_qs(urlparse(url).query).get("v")
+    if values and values[0]:
+        return values[0]
+    return hashlib.md5(url.encode()).hexdigest()[:16]
+
+
+def reflink(src: str, dst: str) -> None:
+    """创建写时复制副本，不支持时抛出 OSError"""
+    if not sys.platform.startswith("linux"):
+        raise OSError("当前平台不支持 reflink")
+    import fcntl
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+
+def clone_file(src: str, dst: str, methods=DEFAULT_METHODS) -> str:
+    """按 methods 的顺序尝试硬链接、reflink、复制，返回实际使用的方式
+
+    先生成临时文件再改名，失败时不会留下不完整的目标文件。
+    """
+    temp_path = dst + ".part"
+    errors: List[str] = []
+    for method in methods:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        try:
+            if method == "hardlink":
+                os.link(src, temp_path)
+            elif method == "reflink":
+                reflink(src, temp_path)
+            elif method == "copy":
+                shutil.copyfile(src, temp_path)
+            else:
+                continue
+            os.replace(temp_path, dst)
+            return method
+        except OSError as e:
+            errors.append(f"{method}: {str(e)}")
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    raise OSError("无法复用已有文件（" + "；".join(errors) + "）")
+
+
+class ContentIndex:
+    """跨下载目录共享的内容索引：视频ID -> 大小、摘要和所有已知副本的路径
+
+    同一视频出现在多个播放列表中时，用已有副本生成新文件，而不是重新下载。
+    """
+
+    def __init__(self, index_file: str = "./logger/content_index.json"):
+        self.index_file = index_file
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(index_file) or ".", exist_ok=True)
+
+    def record(self, video_id: str, path: str, size: int, digest: Optional[str] = None) -> None:
+        """记录视频的一个副本"""
+        path = os.path.abspath(path)
+        with self.lock:
+            index = self._load()
+            entry = index.get(video_id)
+            if entry is None or entry.get("size") != size:
+                # 大小不同说明源文件已变化，旧副本不再可信
+                entry = {"size": size, "sha256": digest, "paths": []}
+            if digest:
+                entry["sha256"] = digest
+            if path not in entry["paths"]:
+                entry["paths"].append(path)
+            entry["updated_at"] = datetime.now().isoformat()
+            index[video_id] = entry
+            self._save(index)
+
+    def lookup(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """查找可复用的副本，返回 {path, size, sha256}
+
+        大小已改变的副本从索引中移除；暂时不存在的路径（等待移动、网络盘未连接）保留。
+        """
+        with self.lock:
+            index = self._load()
+            entry = index.get(video_id)
+            if not entry:
+                return None
+
+            found = None
+            valid: List[str] = []
+            for path in entry["paths"]:
+                if not os.path.isfile(path):
+                    valid.append(path)
+                    continue
+                if os.path.getsize(path) != entry["size"]:
+                    continue
+                valid.append(path)
+                if found is None and check_mp4(path)[0]:
+                    found = path
+
+            if valid != entry["paths"]:
+                if valid:
+                    entry["paths"] = valid
+                else:
+                    del index[video_id]
+                self._save(index)
+        if found is None:
+            return None
+        return {"path": found, "size": entry["size"], "sha256": entry.get("sha256")}
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            if os.path.exists(self.index_file):
+                with open(self.index_file, "r", encoding="utf-8") as f:
+                    content = f.read().strip()
+                    if content:
+                        return json.loads(content)
+        except Exception as e:
+            print(f"加载内容索引失败: {str(e)}")
+        return {}
+
+    def _save(self, index: Dict[str, Any]) -> None:
+        try:
+            with open(self.index_file, "w", encoding="utf-8") as f:
+                json.dump(index, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"保存内容索引失败: {str(e)}")
+
+
+_index: Optional[ContentIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_content_index(index_file: str = "./logger/content_index.json") -> ContentIndex:
+    """获取进程内共享的内容索引"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ContentIndex(index_file)
+        return _index
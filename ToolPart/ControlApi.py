@@ -0,0 +1,253 @@
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+# 等待界面线程执行命令的最长时间（秒）
+COMMAND_TIMEOUT = 60
+# 每个事件订阅者最多缓存的事件数，超出时丢弃最早的事件
+SUBSCRIBER_QUEUE_SIZE = 1000
+# 事件流没有新事件时发送保活注释的间隔（秒）
+KEEPALIVE_INTERVAL = 15
+# 单次请求体的最大字节数
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+
+class ApiError(Exception):
+    """返回给调用方的错误，status 为 HTTP 状态码"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiCommand:
+    """交给界面线程执行的一条命令，HTTP 线程等待 done 后读取结果"""
+
+    def __init__(self, action: str, payload: Dict[str, Any]):
+        self.action = action
+        self.payload = payload
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class ApiBridge(QObject):
+    """把 HTTP 线程收到的命令转到界面线程执行
+
+    任务队列和任务框都属于界面线程，命令经信号排队执行，与点击按钮走同一套逻辑。
+    """
+    command_signal = pyqtSignal(object)  # type: ignore
+
+    def __init__(self, handler: Callable[[str, Dict[str, Any]], Any]):
+        super().__init__()
+        self.handler = handler
+        self.command_signal.connect(self._execute)  # type: ignore
+
+    def call(self, action: str, payload: Optional[Dict[str, Any]] = None) -> Any:
+        command = ApiCommand(action, payload or {})
+        self.command_signal.emit(command)
+        if not command.done.wait(COMMAND_TIMEOUT):
+            raise ApiError(504, "界面线程未在规定时间内响应")
+        if command.error is not None:
+            raise command.error
+        return command.result
+
+    def _execute(self, command: ApiCommand) -> None:
+        try:
+            command.result = self.handler(command.action, command.payload)
+        except BaseException as e:
+            command.error = e
+        finally:
+            command.done.set()
+
+
+class EventHub:
+    """进度事件的发布与订阅，每个订阅者一个有界队列，慢的订阅者不会阻塞发布方"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers: List["queue.Queue[Dict[str, Any]]"] = []
+
+    def subscribe(self) -> "queue.Queue[Dict[str, Any]]":
+        subscriber: "queue.Queue[Dict[str, Any]]" = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: "queue.Queue[Dict[str, Any]]") -> None:
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        item = {"event": event, "data": data}
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            while True:
+                try:
+                    subscriber.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+
+
+class ControlServer:
+    """本地 HTTP/JSON 控制接口
+
+    GET    /status                 队列概况
+    GET    /tasks                  所有任务的状态和进度
+    GET    /tasks/<id>             单个任务的详细记录（包括每个视频的状态）
+    POST   /tasks                  添加任务：{"url": ...} 或 {"urls": [...]}，可选 "type": "playlist" | "video"
+    POST   /tasks/<id>/pause       暂停任务
+    POST   /tasks/<id>/resume      继续任务
+    DELETE /tasks/<id>             删除任务
+    GET    /events                 进度事件流（Server-Sent Events）
+    """
+
+    def __init__(self, bridge: ApiBridge, task_logger, events: EventHub,
+                 host: str = "127.0.0.1", port: int = 8780, token: str = ""):
+        self.bridge = bridge
+        self.task_logger = task_logger
+        self.events = events
+        self.token = token
+        self.stopping = threading.Event()
+
+        class Handler(ControlHandler):
+            pass
+
+        Handler.server_ref = self
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = "%s:%d" % self.server.server_address[:2]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="control-api", daemon=True)
+        self.thread.start()
+
+    def list_tasks(self) -> List[Dict[str, Any]]:
+        states = self.bridge.call("snapshot")
+        tasks = []
+        for task_id, task in self.task_logger.get_all_tasks().items():
+            tasks.append({
+                "task_id": task_id,
+                "url": task.get("url"),
+                "task_type": task.get("task_type", "playlist"),
+                "status": task.get("status"),
+                "state": states.get(task_id, "idle"),
+                "total_videos": task.get("total_videos", 0),
+                "completed_videos": len(task.get("completed_videos", [])),
+                "failed_videos": len(task.get("failed_videos", [])),
+                "updated_at": task.get("updated_at"),
+            })
+        return tasks
+
+    def get_task(self, task_id: str) -> Dict[str, Any]:
+        task = self.task_logger.get_task_info(task_id)
+        if task is None:
+            raise ApiError(404, f"任务不存在: {task_id}")
+        return {**task, "state": self.bridge.call("snapshot").get(task_id, "idle")}
+
+    def shutdown(self) -> None:
+        self.stopping.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ControlHandler(BaseHTTPRequestHandler):
+    server_ref: ControlServer
+
+    def do_GET(self) -> None:
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:
+        self._dispatch("POST")
+
+    def do_DELETE(self) -> None:
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method: str) -> None:
+        api = self.server_ref
+        if api.token and self.headers.get("Authorization") != f"Bearer {api.token}":
+            self._reply(401, {"error": "未授权"})
+            return
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        try:
+            if method == "GET" and parts == ["events"]:
+                self._stream_events()
+                return
+            if method == "GET" and parts == ["status"]:
+                result = api.bridge.call("status")
+            elif method == "GET" and parts == ["tasks"]:
+                result = {"tasks": api.list_tasks()}
+            elif method == "GET" and len(parts) == 2 and parts[0] == "tasks":
+                result = api.get_task(parts[1])
+            elif method == "POST" and parts == ["tasks"]:
+                result = api.bridge.call("enqueue", self._read_json())
+            elif method == "POST" and len(parts) == 3 and parts[0] == "tasks" and parts[2] in ("pause", "resume"):
+                result = api.bridge.call(parts[2], {"task_id": parts[1]})
+            elif method == "DELETE" and len(parts) == 2 and parts[0] == "tasks":
+                result = api.bridge.call("delete", {"task_id": parts[1]})
+            else:
+                raise ApiError(404, "接口不存在")
+        except ApiError as e:
+            self._reply(e.status, {"error": str(e)})
+            return
+        except Exception as e:
+            self._reply(500, {"error": str(e)})
+            return
+        self._reply(200, result)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise ApiError(413, "请求体过大")
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ApiError(400, "请求体不是有效的 JSON")
+        if not isinstance(data, dict):
+            raise ApiError(400, "请求体必须是 JSON 对象")
+        return data
+
+    def _stream_events(self) -> None:
+        api = self.server_ref
+        subscriber = api.events.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(b": connected\n\n")
+            self.wfile.flush()
+            while not api.stopping.is_set():
+                try:
+                    item = subscriber.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+                    continue
+                data = json.dumps(item["data"], ensure_ascii=False)
+                self.wfile.write(f"event: {item['event']}\ndata: {data}\n\n".encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            api.events.unsubscribe(subscriber)
+
+    def _reply(self, code: int, data: Any) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # 不在控制台输出每个请求
+        pass
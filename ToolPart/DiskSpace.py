@@ -0,0 +1,121 @@
+import os
+import shutil
+import threading
+from typing import Callable, Dict, Optional
+
+from ToolPart.RetryPolicy import DownloadError, ErrorClass
+from ToolPart.Writer import volume_id
+
+# 空间不足时重新检查的间隔（秒）
+SPACE_POLL_INTERVAL = 5.0
+
+
+def free_bytes(path: str) -> int:
+    """路径所在磁盘卷的剩余空间"""
+    directory = os.path.abspath(path)
+    while not os.path.isdir(directory):
+        directory = os.path.dirname(directory)
+    return shutil.disk_usage(directory).free
+
+
+class Reservation:
+    """一个下载预留的空间，已写入的部分不再重复计入"""
+
+    def __init__(self, tracker: "SpaceTracker", volume: int, size: int):
+        self.tracker = tracker
+        self.volume = volume
+        self.size = size
+        self.written = 0
+        self.released = False
+
+    def outstanding(self) -> int:
+        return 0 if self.released else max(0, self.size - self.written)
+
+    def update(self, written: int) -> None:
+        with self.tracker.lock:
+            self.written = written
+
+    def release(self) -> None:
+        with self.tracker.lock:
+            if not self.released:
+                self.released = True
+                self.tracker.reservations[self.volume].remove(self)
+                self.tracker.lock.notify_all()
+
+
+class SpaceTracker:
+    """统计所有并发下载在各磁盘卷上尚未写入的预留空间
+
+    预留时扣除其他下载尚未写入的部分，空间不够时等待其他下载完成，
+    而不是开始下载后在中途因磁盘写满失败。
+    """
+
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.reservations: Dict[int, list] = {}
+
+    def outstanding(self, volume: int) -> int:
+        with self.lock:
+            return sum(r.outstanding() for r in self.reservations.get(volume, []))
+
+    def available(self, path: str) -> int:
+        """剩余空间减去其他下载尚未写入的预留"""
+        return free_bytes(path) - self.outstanding(volume_id(path))
+
+    def reserve(self, path: str, size: int, min_free: int, checkpoint: Callable[[], bool],
+                log: Optional[Callable[[str], None]] = None,
+                before_wait: Optional[Callable[[], None]] = None) -> Reservation:
+        """为 path 预留 size 字节，保证写入后剩余空间不低于 min_free
+
+        其他下载仍在进行时等待空间释放，开始等待前调用一次 before_wait（例如断开已打开的连接）；
+        没有其他下载可等时抛出 DISK_FULL 错误。
+        """
+        volume = volume_id(path)
+        logged = False
+        while True:
+            if not checkpoint():
+                raise DownloadError("任务已停止", ErrorClass.STOPPED)
+            with self.lock:
+                others = self.reservations.setdefault(volume, [])
+                outstanding = sum(r.outstanding() for r in others)
+                if free_bytes(path) - outstanding - size >= min_free:
+                    reservation = Reservation(self, volume, size)
+                    others.append(reservation)
+                    return reservation
+                if not outstanding:
+                    raise DownloadError(f"磁盘空间不足，需要 {size / 1024 / 1024:.1f} MB", ErrorClass.DISK_FULL)
+                if not logged:
+                    if log:
+                        log(f"磁盘空间不足，等待其他下载完成后再开始 ({size / 1024 / 1024:.1f} MB)")
+                    if before_wait:
+                        before_wait()
+                    logged = True
+                self.lock.wait(SPACE_POLL_INTERVAL)
+
+    def wait_for_space(self, path: str, min_free: int, checkpoint: Callable[[], bool],
+                       wait: Callable[[float], None], log: Optional[Callable[[str], None]] = None) -> bool:
+        """剩余空间低于 min_free 时暂停，直到空间恢复；任务停止时返回 False"""
+        logged = False
+        while self.available(path) < min_free:
+            if not checkpoint():
+                return False
+            if not logged and log:
+                log(f"磁盘剩余空间低于 {min_free // 1024 // 1024} MB，暂停开始新的下载")
+                logged = True
+            wait(SPACE_POLL_INTERVAL)
+        if logged and log:
+            log("磁盘空间已恢复，继续下载")
+        return checkpoint()
+
+
+_tracker: Optional[SpaceTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_space_tracker() -> SpaceTracker:
+    """获取进程内共享的空间统计，所有下载任务共同预留"""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = SpaceTracker()
+        return _tracker
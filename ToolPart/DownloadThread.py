@@ -1,14 +1,29 @@
 import os
-import random
-import re
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Optional, List, Tuple
-import requests
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, TimeoutError, wait
+from typing import Optional, List, Tuple, Dict, Any, Iterator, Set
+from urllib.parse import urlparse
+
 from PyQt5.QtCore import QThread, pyqtSignal
-from ToolPart.Browser import get_browser
+from ToolPart.Browser import apply_resource_profile, wait_ele
+from ToolPart.Cluster import Coordinator, JobResult, get_coordinator
+from ToolPart.ContentIndex import ContentIndex, clone_file, get_content_index, video_id_from_url
+from ToolPart.DiskSpace import get_space_tracker
+from ToolPart.Estimator import SCHEDULE_ORDERS, format_duration, get_speed_estimator
+from ToolPart.Extractor import extract_playlist, scroll_playlist
 from ToolPart.Logger import log_failure, TaskLogger
+from ToolPart.Lookahead import Lookahead
+from ToolPart.RetryPolicy import ErrorClass, RetryPolicy, classify_error
+from ToolPart.Settings import ADVANCED_DEFAULTS
+from ToolPart.Sharding import JobControl, ProcessShards, get_process_shards
+from ToolPart.SourcePolicy import SourcePolicy
+from ToolPart.VideoJob import VideoJob
+
+# 滚动播放列表后等待新条目出现的最长时间（秒）
+PLAYLIST_IDLE_TIMEOUT = 3
+# 等待已提交视频完成时检查停止的间隔（秒）
+COLLECT_INTERVAL = 1
 
 
 class VideoDownloadThread(QThread):
@@ -16,46 +31,80 @@ class VideoDownloadThread(QThread):
     log_signal = pyqtSignal(str)
     progress_signal = pyqtSignal(str, float)
     finished_signal = pyqtSignal(str, list)  # task_id, failed_urls
+    video_signal = pyqtSignal(str, str, bool)  # task_id, 视频URL, 是否成功
 
     def __init__(self, list_url: str, download_dir: str, task_id: str,
                  task_logger: Optional[TaskLogger] = None, is_retry: bool = False,
-                 headless: bool = True):  # 添加headless参数
+                 headless: bool = True,  # 添加headless参数
+                 settings: Optional[Dict[str, Any]] = None):
         super().__init__()
         self.list_url = list_url
         self.download_dir = download_dir
         self.task_id = task_id
         self.task_logger = task_logger
         self.is_retry = is_retry  # 是否是重试任务
+        self.playlist_title: Optional[str] = None
+        self.skipped_videos = 0  # 之前运行中已完成而跳过的视频数
         self.headless = headless  # 保存headless参数
+        self.settings = {**ADVANCED_DEFAULTS, **(settings or {})}
+        self.retry_policy = RetryPolicy()
+        # 下载源选择策略，优先使用任务记录中保存的策略
+        task_info = task_logger.get_task_info(task_id) if task_logger else None
+        self.task_type = (task_info or {}).get("task_type", "playlist")  # playlist 或 video（单个视频）
+        policy = (task_info or {}).get("source_policy")
+        self.source_policy = SourcePolicy.from_dict(policy) if policy else SourcePolicy.from_settings(self.settings)
+        # 内容索引：其他目录中已有的同一视频直接复用，不再重新下载
+        self.content_index: Optional[ContentIndex] = None
+        if self.settings["Dedup"]:
+            self.content_index = get_content_index(os.path.join("./logger", "content_index.json"))
+        self.dedup_methods = [m.strip() for m in self.settings["DedupMethods"].split(",") if m.strip()]
+        self.indexed: Dict[str, bool] = {}  # 视频URL -> 内容索引中是否有副本，预解析时跳过有副本的视频
         self.running = True
         self.paused = False
         self.pause_cond = threading.Condition(threading.Lock())
+        self.stop_event = threading.Event()  # 停止时唤醒正在退避等待的线程
+        self.discard = False  # 任务被删除：停止时删除未完成的 .part 文件，不保留断点
         self.max_workers = 2  # 减少并发数，避免资源冲突
-        os.makedirs(self.download_dir, exist_ok=True)
+        # 单个视频的解析和下载；播放列表枚举也使用它的浏览器和熔断器
+        self.job = VideoJob(download_dir, headless, self.settings, self.source_policy, self.log_message,
+                            self.checkpoint, lambda: self.running, self.stop_event.wait, lambda: self.paused,
+                            lambda: self.discard)
+        # 配置了 ProcessWorkers 时视频在工作进程中下载，主进程只负责枚举、调度和记录
+        self.shards: Optional[ProcessShards] = None
+        self.control: Optional[JobControl] = None
+        # 配置了 CoordinatorPort 时视频交给连接到本机协调节点的工作节点下载
+        self.coordinator: Optional[Coordinator] = None
+        if self.settings["CoordinatorPort"] > 0:
+            try:
+                self.coordinator = get_coordinator(self.settings)
+                self.max_workers = self.settings["ClusterJobs"]
+            except OSError as e:
+                print(f"启动协调节点失败，改为在本机下载: {str(e)}")
+        if self.coordinator is None and self.settings["ProcessWorkers"] > 0:
+            self.shards = get_process_shards(self.settings["ProcessWorkers"])
+            self.control = self.shards.new_control(task_id)
+            self.max_workers = self.settings["ProcessWorkers"]
+
+        # 速度和剩余时间估计；已枚举的视频先进入等待列表，按调度策略在并发上限内逐个提交
+        self.estimator = get_speed_estimator(self.settings)
+        self.schedule_order = self.settings["ScheduleOrder"]
+        if self.schedule_order not in SCHEDULE_ORDERS:
+            print(f"未知的调度顺序 {self.schedule_order}，使用 fifo")
+            self.schedule_order = "fifo"
+        self.queued: List[str] = []
+        self.in_flight: Dict[Future, str] = {}  # future -> 视频URL
+        self.started_at: Dict[str, float] = {}  # 视频URL -> 提交时间
+        self.done_count = 0
+        # 本机下载时预先解析排在前面的 LookaheadVideos 个视频，传输槽位空出时直接开始传输
+        self.lookahead: Optional[Lookahead] = None
+        if self.coordinator is None and self.shards is None and self.settings["LookaheadVideos"] > 0:
+            self.lookahead = Lookahead(self.job.prefetch, self.job.resolutions,
+                                       self.settings["LookaheadVideos"], self.settings["LookaheadWorkers"])
 
         # 确保日志目录存在
         self.logger_dir = "./logger"
         os.makedirs(self.logger_dir, exist_ok=True)
 
-        # 定义非法字符的正则表达式模式
-        self.illegal_chars_pattern = re.compile(r'[\\/*?:"<>|]')
-
-    def sanitize_filename(self, filename: str) -> str:
-        """清洗文件名，移除非法字符"""
-        clean_name = self.illegal_chars_pattern.sub('_', filename)
-        clean_name = clean_name.strip()
-
-        max_length = 200
-        if len(clean_name) > max_length:
-            name_part, ext = os.path.splitext(clean_name)
-            name_part = name_part[:max_length - len(ext)]
-            clean_name = name_part + ext
-
-        if not clean_name:
-            clean_name = "unnamed_video"
-
-        return clean_name
-
     def log_message(self, message: str) -> None:
         """通过信号发送日志消息"""
         self.log_signal.emit(message)
@@ -63,6 +112,10 @@ class VideoDownloadThread(QThread):
     def pause(self) -> None:
         """暂停下载任务"""
         self.paused = True
+        if self.control is not None:
+            self.control.pause_event.set()
+        if self.coordinator is not None:
+            self.coordinator.pause_task(self.task_id, True)
         self.log_message(f"下载任务已暂停: {self.list_url}")
 
         # 更新任务状态
@@ -74,376 +127,502 @@ class VideoDownloadThread(QThread):
         with self.pause_cond:
             self.paused = False
             self.pause_cond.notify()
+        if self.control is not None:
+            self.control.pause_event.clear()
+        if self.coordinator is not None:
+            self.coordinator.pause_task(self.task_id, False)
         self.log_message(f"下载任务已继续: {self.list_url}")
 
         # 更新任务状态
         if self.task_logger:
             self.task_logger.update_task_status(self.task_id, "running")
 
-    def stop(self) -> None:
-        """停止下载任务"""
-        self.running = False
-        with self.pause_cond:
-            self.paused = False
-            self.pause_cond.notify_all()
+    def stop(self, discard: bool = False) -> None:
+        """停止下载任务，discard 为 True 时（删除任务）不保留未完成视频的断点"""
+        self.discard = discard
+        if discard and self.control is not None:
+            self.control.discard_event.set()
+        self.halt()
         self.log_message(f"下载任务已停止: {self.list_url}")
 
         # 更新任务状态
         if self.task_logger:
             self.task_logger.update_task_status(self.task_id, "paused")
 
+    def shutdown(self) -> None:
+        """程序退出时停止任务：进行中的下载保存断点后退出，账本中的任务状态保持不变，下次启动时继续"""
+        self.halt()
+        self.log_message(f"程序退出，下载任务已中断: {self.list_url}")
+
+    def halt(self) -> None:
+        """停止提交新视频，唤醒所有等待中的线程"""
+        self.running = False
+        self.stop_event.set()
+        if self.control is not None:
+            self.control.stop_event.set()
+        if self.coordinator is not None:
+            self.coordinator.stop_task(self.task_id, self.discard)
+        with self.pause_cond:
+            self.paused = False
+            self.pause_cond.notify_all()
+
     def wait_if_paused(self) -> None:
         """如果任务被暂停，则等待直到继续"""
         with self.pause_cond:
             while self.paused and self.running:
                 self.pause_cond.wait()
 
-    def get_video_links(self) -> Tuple[Optional[List[str]], Optional[str]]:
-        """获取列表页中的所有视频链接和播放列表标题"""
+    def checkpoint(self) -> bool:
+        """暂停时阻塞等待，返回任务是否仍在运行，供浏览器等待函数调用"""
+        self.wait_if_paused()
+        return self.running
+
+    def iter_video_links(self) -> Iterator[str]:
+        """逐步加载播放列表，按列表顺序产出去重后的视频链接
+
+        每发现一批新链接立即产出，调用方可以边枚举边提交下载；
+        滚动后在 PLAYLIST_IDLE_TIMEOUT 秒内没有新条目出现即视为枚举结束。
+        暂停时关闭浏览器，继续后重新打开播放列表，滚动到暂停前的位置接着枚举。
+        """
         self.log_message(f"正在从 {self.list_url} 获取视频列表...")
         browser = None
-        links: Optional[List[str]] = None
-        playlist_title: Optional[str] = None
+        slot = None
+        seen: Set[str] = set()
+        found = 0
+        known = 0  # 已枚举的链接元素数量
+        titled = False
 
         try:
-            browser = get_browser(self.headless)  # 使用headless参数
-            browser.get(self.list_url)
-
-            # 如果不是无头模式，记录日志
-            if not self.headless:
-                self.log_message("非无头模式：浏览器窗口已打开，请查看浏览器界面")
-
-            # 使用条件等待替代固定等待
-            start_time = time.time()
-            playlist = None
-            while time.time() - start_time < 30:
-                self.wait_if_paused()
-                if not self.running:
-                    return None, None
-
-                playlist = browser.ele('#playlist-scroll', timeout=1)
-                if playlist:
-                    break
-                time.sleep(1)
-            else:
-                self.log_message("等待播放列表加载超时")
-                return None, None
-
-            # 获取播放列表标题
-            try:
-                title_element = browser.ele('xpath://*[@id="video-playlist-wrapper"]/div[1]/h4[1]', timeout=5)
-                if title_element:
-                    playlist_title = title_element.text.strip()
-                    self.log_message(f"播放列表标题: {playlist_title}")
-                    # 发送标题更新信号
-                    self.log_message(f"[TITLE_UPDATE]|||{self.task_id}|||{playlist_title}")
-                else:
-                    self.log_message("未找到播放列表标题")
-            except Exception as e:
-                self.log_message(f"获取播放列表标题时出错: {str(e)}")
+            while self.running:
+                if self.paused:
+                    if browser is not None:
+                        self.job.close_browser(browser, slot)
+                        browser, slot = None, None
+                        self.log_message("播放列表枚举已暂停，浏览器已关闭")
+                    self.wait_if_paused()
+                    continue
+
+                if browser is None:
+                    browser, slot = self.job.open_browser()  # 使用headless参数
+                    if self.open_playlist(browser, known) is None:
+                        if self.paused:
+                            continue
+                        return
+                    # 重新打开后从头提取一次，已产出的链接按 seen 跳过
+                    known = 0
+
+                # 一次脚本调用取出标题和新出现的链接
+                data = extract_playlist(browser, known)
+                if not titled:
+                    titled = True
+                    self.playlist_title = data["title"]
+                    if self.playlist_title:
+                        self.log_message(f"播放列表标题: {self.playlist_title}")
+                        # 发送标题更新信号
+                        self.log_message(f"[TITLE_UPDATE]|||{self.task_id}|||{self.playlist_title}")
+                    else:
+                        self.log_message("未找到播放列表标题")
+                known = data["count"]
 
-            # 获取所有视频链接
-            if playlist:
-                link_elements = playlist.eles('tag:a', timeout=10)
-                if link_elements:
-                    found_links = [a.attr('href') for a in link_elements if a.attr('href')]
-                    unique_links = list(set(found_links))
-                    self.log_message(f"找到 {len(unique_links)} 个唯一视频")
-                    links = unique_links
+                new_links = []
+                for link in data["links"]:
+                    if link in seen:
+                        continue
+                    seen.add(link)
+                    if 'search?query' in link:
+                        self.log_message(f"链接: {link} 不是视频链接，跳过")
+                        continue
+                    new_links.append(link)
 
+                if new_links:
+                    found += len(new_links)
                     # 更新任务总视频数
                     if self.task_logger:
-                        self.task_logger.update_task_total_videos(self.task_id, len(unique_links))
+                        self.task_logger.update_task_total_videos(self.task_id, found)
+                    for link in new_links:
+                        yield link
+
+                # 滚动加载更多条目，没有新条目出现则枚举结束
+                if scroll_playlist(browser, known, PLAYLIST_IDLE_TIMEOUT) <= known:
+                    break
+
+            if self.running:
+                self.log_message(f"找到 {found} 个唯一视频")
 
         except Exception as e:
             self.log_message(f"获取视频链接时出错: {str(e)}")
         finally:
-            if browser:
-                try:
-                    browser.quit()
-                except Exception as e:
-                    self.log_message(f"关闭浏览器时出错: {str(e)}")
-
-        return links, playlist_title
-
-    def download_video(self, video_url: str) -> bool:
-        """下载单个视频，增加失败重试机制"""
-        if not self.running:
-            return False
-
-        # 记录视频任务开始
-        if self.task_logger:
-            self.task_logger.log_video_task_start(self.task_id, video_url)
-
-        max_retries = 2  # 减少重试次数
-        retry_count = 0
-        success = False
-        last_error = ""
-        filename = None
-
-        while retry_count <= max_retries and not success and self.running:
-            retry_count += 1
-            self.log_message(f"尝试下载视频: {video_url} (尝试 {retry_count}/{max_retries + 1})")
-            try:
-                success, error, file = self._download_video_attempt(video_url)
-                if not success:
-                    last_error = error
-                    if retry_count <= max_retries:
-                        self.log_message(f"第 {retry_count} 次下载失败，稍后重试...")
-                        time.sleep(1 + random.random())  # 减少等待时间
-                else:
-                    filename = file
-            except Exception as e:
-                last_error = str(e)
-                self.log_message(f"下载过程中发生异常: {str(e)}")
-                time.sleep(2)
+            self.job.close_browser(browser, slot)
+
+    def open_playlist(self, browser, resume_at: int) -> Optional[int]:
+        """打开播放列表页并滚动到已加载 resume_at 个条目，返回已加载的条目数
+
+        加载超时、停止或暂停时返回 None；等待期间暂停立即返回，不在原地占用浏览器。
+        """
+        apply_resource_profile(browser, "playlist", self.job.blocked_stages)
+        browser.get(self.list_url)
+
+        # 如果不是无头模式，记录日志
+        if not self.headless:
+            self.log_message("非无头模式：浏览器窗口已打开，请查看浏览器界面")
+
+        # 等待播放列表出现，元素加载后立即返回
+        playlist = wait_ele(browser, '#playlist-scroll', 30, self.job.keep_going)
+        if not self.job.keep_going():
+            return None
+        if not playlist:
+            self.log_message("等待播放列表加载超时")
+            return None
+
+        count = 0
+        while count < resume_at and self.job.keep_going():
+            loaded = scroll_playlist(browser, count, PLAYLIST_IDLE_TIMEOUT)
+            if loaded <= count:
+                break
+            count = loaded
+        if resume_at:
+            self.log_message(f"播放列表已重新打开，滚动到第 {count} 个条目")
+        return count if self.job.keep_going() else None
+
+    def iter_task_videos(self) -> Iterator[str]:
+        """产出本次运行需要下载的视频
+
+        重试任务只产出上次失败的视频，不再加载播放列表；单视频任务直接产出任务链接；
+        其他情况先产出上次运行中断的视频，再逐步枚举播放列表，并跳过之前运行中已完成的视频。
+        """
+        if self.is_retry and self.task_logger:
+            retry_videos = self.task_logger.get_retry_videos(self.task_id)
+            if retry_videos:
+                self.log_message(f"重试任务：仅重新下载 {len(retry_videos)} 个失败视频")
+                yield from retry_videos
+                return
 
-        if success:
-            self.log_message(f"成功下载视频: {video_url}")
-            # 记录视频任务完成
+        completed = set(self.task_logger.get_completed_videos(self.task_id)) if self.task_logger else set()
+        if self.task_type == "video":
             if self.task_logger:
-                self.task_logger.log_video_task_complete(self.task_id, video_url)
-            return True
-        else:
-            self.log_message(f"下载失败: {video_url} (超过最大重试次数)")
-            if last_error:
-                log_filename = filename if filename else video_url
-                log_failure(self.logger_dir, log_filename, video_url, last_error)
+                self.task_logger.update_task_total_videos(self.task_id, 1)
+            if self.list_url in completed:
+                self.skipped_videos += 1
+            else:
+                yield self.list_url
+            return
+
+        # 上次运行中断的视频先下载，从保存的断点继续
+        interrupted = self.task_logger.get_interrupted_videos(self.task_id) if self.task_logger else []
+        if interrupted:
+            self.log_message(f"继续上次中断的 {len(interrupted)} 个视频")
+            yield from interrupted
+        resumed = set(interrupted)
+
+        for link in self.iter_video_links():
+            if link in resumed:
+                continue
+            if link in completed:
+                self.skipped_videos += 1
+                continue
+            yield link
+
+        if self.skipped_videos:
+            self.log_message(f"跳过 {self.skipped_videos} 个已完成的视频")
+
+    def download_video(self, video_url: str) -> Optional[bool]:
+        """下载单个视频，按失败类型决定是否重试以及退避时间
+
+        任务暂停时正在进行的尝试保存进度后退出，返回 None，由调度重新排队。
+        """
+        try:
+            if not self.running:
+                return False
 
-            # 记录视频任务失败
+            # 记录视频任务开始
             if self.task_logger:
-                self.task_logger.log_video_task_failed(self.task_id, video_url, last_error)
-
-            return False
-
-    def _download_video_attempt(self, video_url: str) -> Tuple[bool, str, Optional[str]]:
-        """单个视频下载尝试，返回（是否成功，错误信息，文件名）"""
-        self.log_message(f"处理视频: {video_url}")
-        browser = None
-        filename = None
+                self.task_logger.log_video_task_start(self.task_id, video_url)
+
+            attempt = 0
+            success = False
+            last_error = ""
+            last_class = ""
+            filename = self.reuse_existing_copy(video_url)
+            if filename:
+                success = True
+
+            while self.running and not success:
+                if not self.job.wait_for_host(video_url) or not self.wait_for_disk_space():
+                    break
 
-        try:
-            browser = get_browser(self.headless)  # 使用headless参数
-            browser.get(video_url)
-
-            # 如果不是无头模式，记录日志
-            if not self.headless:
-                self.log_message("非无头模式：正在打开视频页面...")
-
-            # 使用条件等待替代固定等待
-            start_time = time.time()
-            download_btn = None
-            while time.time() - start_time < 20:
-                self.wait_if_paused()
-                if not self.running:
-                    return False, "任务已停止", None
+                attempt += 1
+                self.log_message(f"尝试下载视频: {video_url} (第 {attempt} 次)")
+                try:
+                    success, error, file, error_class = self.run_attempt(video_url)
+                except Exception as e:
+                    success, error, file, error_class = False, str(e), None, classify_error(e)
+                    self.log_message(f"下载过程中发生异常: {str(e)}")
 
-                download_btn = browser.ele('#downloadBtn', timeout=1)
-                if download_btn:
+                if success:
+                    filename = file
                     break
-                time.sleep(1)
-            else:
-                error_msg = "等待下载按钮加载超时"
-                self.log_message(error_msg)
-                return False, error_msg, None
-
-            download_page_url = download_btn.attr('href')
-            if not download_page_url:
-                error_msg = "下载按钮没有有效的链接"
-                self.log_message(error_msg)
-                return False, error_msg, None
-
-            self.log_message(f"找到下载页面: {download_page_url}")
-            browser.get(download_page_url)
-
-            # 如果不是无头模式，记录日志
-            if not self.headless:
-                self.log_message("非无头模式：正在打开下载页面...")
-
-            # 等待Cloudflare验证
-            start_time = time.time()
-            while time.time() - start_time < 30:
-                self.wait_if_paused()
-                if not self.running:
-                    return False, "任务已停止", None
+                if error_class in (ErrorClass.PAUSED, ErrorClass.STOPPED):
+                    return self.interrupt_video(video_url, error_class)
 
-                if "just a moment" not in browser.title.lower():
+                last_error, last_class = error, error_class
+                filename = file or filename
+                if not self.retry_policy.should_retry(error_class, attempt):
+                    self.log_message(f"第 {attempt} 次下载失败（{error_class}），不再重试")
                     break
-                time.sleep(1)
-            else:
-                error_msg = "等待Cloudflare验证完成超时"
-                self.log_message(error_msg)
-                return False, error_msg, None
-
-            # 定位下载链接
-            download_table = browser.ele('#content-div', timeout=10)
-            if not download_table:
-                error_msg = "未找到下载表格"
-                self.log_message(error_msg)
-                return False, error_msg, None
-
-            download_link_ele = download_table.ele('xpath:.//tr[2]/td[5]/a', timeout=10)
-            if not download_link_ele:
-                error_msg = "未找到下载链接元素"
-                self.log_message(error_msg)
-                return False, error_msg, None
-
-            video_download_url = download_link_ele.attr('data-url')
-            raw_filename = download_link_ele.attr('download') + '.mp4'
-
-            filename = self.sanitize_filename(raw_filename)
-            self.log_message(f"原始文件名: {raw_filename} -> 清洗后: {filename}")
-
-            # 检查文件是否已存在
-            filepath = os.path.join(self.download_dir, filename)
-            if os.path.exists(filepath) and os.path.isfile(filepath):
-                self.log_message(f"文件已存在，跳过下载: {filename}")
-                return True, "文件已存在，跳过下载", filename
-
-            if not video_download_url or not filename:
-                error_msg = "未找到下载URL或文件名"
-                self.log_message(error_msg)
-                return False, error_msg, None
-
-            self.log_message(f"找到视频URL: {video_download_url}")
-            self.log_message(f"正在下载: {filename}")
-
-            success, error = self.save_video(video_download_url, filename)
-            return success, error, filename
 
-        except Exception as e:
-            error_msg = f"处理视频时出错: {str(e)}"
-            self.log_message(error_msg)
-            return False, error_msg, filename
-        finally:
-            if browser:
-                try:
-                    browser.quit()
-                except Exception as e:
-                    self.log_message(f"关闭浏览器时出错: {str(e)}")
-
-    def save_video(self, url: str, filename: str) -> Tuple[bool, str]:
-        """保存视频文件，返回（是否成功，错误信息）"""
-        clean_filename = self.sanitize_filename(filename)
-        filepath = os.path.join(self.download_dir, clean_filename)
+                delay = self.retry_policy.backoff(error_class, attempt)
+                self.log_message(f"第 {attempt} 次下载失败（{error_class}），{delay:.1f} 秒后重试...")
+                self.stop_event.wait(delay)
+
+            if not success and not self.running:
+                return self.interrupt_video(video_url, ErrorClass.STOPPED)
+
+            if success:
+                self.log_message(f"成功下载视频: {video_url}")
+                file_info = self.job.file_records.pop(filename, None) if filename else None
+                if filename and not file_info:
+                    file_info = {"filename": filename}
+                if file_info and file_info.get("size"):
+                    self.estimator.learn_size(video_url, file_info["size"])
+                    # 工作进程或工作节点上的传输没有进度回调，完成时按下载源的主机计入吞吐量
+                    if (self.coordinator is not None or self.shards is not None) and video_url in self.started_at:
+                        host = file_info.get("host") or urlparse(video_url).netloc
+                        self.estimator.record_completion(file_info["size"], time.monotonic() - self.started_at[video_url],
+                                                         host)
+                # 记录视频任务完成，同时记录文件名和校验信息供完整性检查使用
+                if self.task_logger:
+                    self.task_logger.log_video_task_complete(self.task_id, video_url, file_info=file_info)
+                # 记入内容索引，其他任务遇到同一视频时可以直接复用
+                if self.content_index is not None and file_info and file_info.get("size"):
+                    self.content_index.record(video_id_from_url(video_url),
+                                              os.path.join(self.download_dir, filename),
+                                              file_info["size"], file_info.get("sha256"))
+                self.video_signal.emit(self.task_id, video_url, True)
+                return True
+            else:
+                self.log_message(f"下载失败: {video_url}")
+                if last_error:
+                    log_filename = filename if filename else video_url
+                    log_failure(self.logger_dir, log_filename, video_url, last_error,
+                                error_class=last_class, task_id=self.task_id, attempts=attempt)
 
-        if not self.running:
-            return False, "任务已停止"
+                # 记录视频任务失败
+                if self.task_logger:
+                    self.task_logger.log_video_task_failed(self.task_id, video_url, last_error)
 
+                self.video_signal.emit(self.task_id, video_url, False)
+                return False
+        finally:
+            if self.lookahead is not None:
+                # 视频已结束（完成、复用已有文件、放弃或中断），丢弃没有被下载取走的预解析结果
+                self.lookahead.discard(video_url)
+
+    def interrupt_video(self, video_url: str, error_class: str) -> None:
+        """视频因暂停或停止而中断：不计为失败，记录已保存的断点，返回 None 由调度重新排队"""
+        partial = self.job.partials.pop(video_url, None)
+        if error_class == ErrorClass.PAUSED:
+            self.log_message(f"视频已暂停，继续后从断点下载: {video_url}")
+        else:
+            self.log_message(f"视频已中断，下次运行时继续: {video_url}")
+        if self.task_logger:
+            self.task_logger.log_video_task_interrupted(self.task_id, video_url, partial)
+        return None
+
+    def run_attempt(self, video_url: str) -> Tuple[bool, str, Optional[str], str]:
+        """执行一次下载尝试，配置了协调节点或工作进程时交给它们执行"""
+        if self.coordinator is not None:
+            future = self.coordinator.submit(self.task_id, video_url, self.download_dir, self.source_policy)
+        elif self.shards is not None:
+            future = self.shards.submit(self.task_id, video_url, self.download_dir, self.headless,
+                                        self.settings, self.source_policy, self.control)
+        else:
+            if self.lookahead is not None:
+                # 正在预解析的视频等预解析完成后使用其结果，不重复打开页面
+                self.lookahead.wait_for(video_url)
+            return self.job.attempt(video_url)
+
+        success, error, filename, error_class, file_info, partial = self.wait_result(future)
+        if filename and file_info:
+            self.job.file_records[filename] = file_info
+        if partial:
+            # 工作进程或工作节点保存的断点，中断时记入任务记录
+            self.job.partials[video_url] = partial
+        # 工作进程或工作节点的熔断器只在其内部生效，主进程按结果同步记录，暂停提交新视频
+        host = urlparse(video_url).netloc
+        if success:
+            self.job.circuit_breaker.record_success(host)
+        elif self.job.circuit_breaker.record_failure(host, error_class):
+            self.log_message(f"主机 {host} 连续失败，已暂停对其的请求")
+        return success, error, filename, error_class
+
+    def wait_result(self, future: Future) -> JobResult:
+        """等待工作进程或工作节点的结果；任务停止后最多再等 ShutdownTimeout 秒，
+        让进行中的传输保存断点，仍未返回的按已停止处理，不阻塞下载线程退出"""
+        stop_deadline = None
+        while True:
+            try:
+                return future.result(timeout=COLLECT_INTERVAL)
+            except TimeoutError:
+                if self.running:
+                    continue
+                if stop_deadline is None:
+                    stop_deadline = time.monotonic() + self.settings["ShutdownTimeout"]
+                elif time.monotonic() >= stop_deadline:
+                    return False, "任务已停止", None, ErrorClass.STOPPED, None, None
+
+    def submit_queued(self, executor: ThreadPoolExecutor) -> bool:
+        """在并发上限内按调度策略提交等待中的视频，返回任务是否仍在运行"""
+        if self.paused:
+            return self.running
+        if len(self.in_flight) >= self.max_workers or not self.queued:
+            if self.lookahead is not None and self.running:
+                self.lookahead.prefetch(url for url in self.queued if self.worth_prefetching(url))
+            return self.running
+        if self.schedule_order != "fifo":
+            self.queued = self.estimator.order(self.queued, self.schedule_order)
+        while self.queued and len(self.in_flight) < self.max_workers:
+            link = self.queued[0]
+            # 主机熔断或磁盘空间不足期间暂停提交新视频
+            if not self.running or not self.job.wait_for_host(link) or not self.wait_for_disk_space():
+                return False
+            self.queued.pop(0)
+            self.log_message(f"提交下载任务: 视频 {self.done_count + len(self.in_flight) + 1}")
+            self.started_at[link] = time.monotonic()
+            self.in_flight[executor.submit(self.download_video, link)] = link
+        if self.lookahead is not None:
+            self.lookahead.prefetch(url for url in self.queued if self.worth_prefetching(url))
+        return True
+
+    def collect_finished(self, failed_downloads: List[str]) -> None:
+        """处理已完成的视频，记录失败并输出本任务的剩余时间"""
+        requeued = 0
+        for future in [f for f in self.in_flight if f.done()]:
+            link = self.in_flight.pop(future)
+            self.started_at.pop(link, None)
+            try:
+                result = future.result()
+            except Exception as e:
+                self.log_message(f"视频下载出错: {link} - {str(e)}")
+                result = False
+            if result is None:
+                # 暂停时退出的视频按原顺序回到等待列表最前面，继续后先提交
+                self.queued.insert(requeued, link)
+                requeued += 1
+                continue
+            self.done_count += 1
+            total = self.done_count + len(self.in_flight) + len(self.queued)
+            if result:
+                self.log_message(f"视频 {self.done_count}/{total} 下载成功: {link}")
+            else:
+                self.log_message(f"视频 {self.done_count}/{total} 下载失败: {link}")
+                failed_downloads.append(link)
+            eta = self.eta()
+            if eta is not None:
+                self.log_message(f"本任务预计剩余 {format_duration(eta)}（还有 {total - self.done_count} 个视频）")
+
+    def remaining_videos(self) -> List[str]:
+        """已枚举但尚未完成的视频"""
+        return list(self.in_flight.values()) + list(self.queued)
+
+    def eta(self) -> Optional[float]:
+        """本任务剩余时间（秒）；播放列表仍在枚举时只包含已发现的视频"""
+        return self.estimator.eta(self.remaining_videos())
+
+    def reuse_existing_copy(self, video_url: str) -> Optional[str]:
+        """内容索引中有该视频的完好副本时，通过硬链接、reflink 或复制生成到下载目录，返回文件名"""
+        if self.content_index is None:
+            return None
+        entry = self.content_index.lookup(video_id_from_url(video_url))
+        if entry is None:
+            return None
+
+        filename = os.path.basename(entry["path"])
+        filepath = os.path.join(self.download_dir, filename)
         try:
-            # 最终检查文件是否存在
-            if os.path.exists(filepath) and os.path.isfile(filepath):
-                self.log_message(f"文件已存在，跳过下载: {clean_filename}")
-                return True, "文件已存在，跳过下载"
-
-            headers = {
-                'Referer': 'https://hanime1.me/',
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-
-            session = requests.Session()
-            response = session.get(url, headers=headers, stream=True, timeout=60)
-            response.raise_for_status()
-
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            last_percent = -1
-
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    self.wait_if_paused()
+            if not self.job.file_exists(filepath):
+                method = clone_file(entry["path"], filepath, self.dedup_methods)
+                self.log_message(f"复用已有文件（{method}）: {entry['path']} -> {filepath}")
+            self.job.file_records[filename] = {"filename": filename, "size": entry["size"],
+                                           "sha256": entry.get("sha256")}
+            return filename
+        except OSError as e:
+            self.log_message(f"复用已有文件失败，改为重新下载: {str(e)}")
+            return None
+
+    def worth_prefetching(self, video_url: str) -> bool:
+        """内容索引中有完好副本的视频会直接复用，不必预解析"""
+        if self.content_index is None:
+            return True
+        if video_url not in self.indexed:
+            self.indexed[video_url] = self.content_index.lookup(video_id_from_url(video_url)) is not None
+        return not self.indexed[video_url]
 
-                    if not self.running:
-                        if os.path.exists(filepath):
-                            try:
-                                os.remove(filepath)
-                            except:
-                                pass
-                        return False, "任务已停止"
-
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        if total_size > 0:
-                            percent = (downloaded / total_size) * 100
-                            if abs(percent - last_percent) > 1 or percent == 100:
-                                self.log_message(f"下载进度: {clean_filename} - {percent:.1f}%")
-                                last_percent = percent
-
-            self.log_message(f"成功保存: {filepath}")
-            return True, ""
-
-        except Exception as e:
-            error_msg = str(e)
-            self.log_message(f"下载失败: {clean_filename} - {error_msg}")
-            if os.path.exists(filepath):
-                try:
-                    os.remove(filepath)
-                except Exception:
-                    pass
-            return False, error_msg
+    def wait_for_disk_space(self) -> bool:
+        """下载所在磁盘剩余空间低于 MinFreeMB 时暂停开始新的下载，返回任务是否仍在运行"""
+        return get_space_tracker().wait_for_space(self.job.staging_dir or self.download_dir,
+                                                  self.settings["MinFreeMB"] * 1024 * 1024,
+                                                  self.checkpoint, self.stop_event.wait, self.log_message)
 
     def run(self) -> None:
         """运行下载任务"""
         failed_downloads: List[str] = []
 
+        if self.coordinator is not None:
+            self.coordinator.register(self.task_id, self.log_message)
+        if self.shards is not None:
+            self.shards.register(self.task_id, self.log_message)
         try:
             self.log_message(f"开始下载任务: {self.list_url}")
-            video_links, playlist_title = self.get_video_links()
-
-            if not video_links:
-                self.log_message("未找到视频链接，任务失败")
-                # 标记任务失败
-                if self.task_logger:
-                    self.task_logger.mark_task_failed(self.task_id, "未找到视频链接")
+            self.log_message(f"下载源策略: {self.source_policy.describe()}")
+            if self.schedule_order != "fifo":
+                self.log_message(f"调度顺序: {self.schedule_order}")
+            # 使用线程池并发下载视频，边枚举边提交；提交数不超过并发数，其余按调度策略排队
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                links = self.iter_task_videos()
+                try:
+                    for link in links:
+                        if not self.running:
+                            break
+                        self.queued.append(link)
+                        self.collect_finished(failed_downloads)
+                        if not self.submit_queued(executor):
+                            break
+                finally:
+                    links.close()
+
+                if not self.in_flight and not self.queued and not self.done_count and not self.skipped_videos:
+                    self.log_message("未找到视频链接，任务失败")
+                    # 标记任务失败
+                    if self.task_logger:
+                        self.task_logger.mark_task_failed(self.task_id, "未找到视频链接")
 
-                # 发送失败信号
-                if self.running:
-                    self.finished_signal.emit(self.task_id, [self.list_url])
-                return
+                    # 发送失败信号
+                    if self.running:
+                        self.finished_signal.emit(self.task_id, [self.list_url])
+                    return
 
-            self.log_message(f"找到 {len(video_links)} 个视频")
+                self.log_message(f"共 {self.done_count + len(self.in_flight) + len(self.queued)} 个视频")
 
-            # 使用线程池并发下载视频
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                futures = []
-                for i, link in enumerate(video_links):
-                    if not self.running:
+                # 等待所有视频完成，每完成一个提交下一个
+                while self.running and (self.in_flight or self.queued):
+                    if self.paused and not self.in_flight:
+                        # 进行中的视频都已保存进度退出，等待继续
+                        self.wait_if_paused()
+                        continue
+                    if not self.submit_queued(executor) or not self.in_flight:
                         break
+                    wait(list(self.in_flight), timeout=COLLECT_INTERVAL, return_when=FIRST_COMPLETED)
+                    self.collect_finished(failed_downloads)
 
-                    if 'search?query' in link:
-                        self.log_message(f"链接: {link} 不是视频链接，跳过")
-                        continue
+                if not self.running:
+                    for future in self.in_flight:
+                        future.cancel()
+                    self.log_message("下载任务已取消")
 
-                    self.log_message(f"提交下载任务: 视频 {i + 1}/{len(video_links)}")
-                    future = executor.submit(self.download_video, link)
-                    futures.append(future)
-                    time.sleep(random.uniform(0.5, 1.0))  # 减少等待时间
-
-                # 等待所有任务完成
-                for i, future in enumerate(as_completed(futures)):
-                    if not self.running:
-                        for f in futures:
-                            if not f.done():
-                                f.cancel()
-                        self.log_message("下载任务已取消")
-                        break
+            self.estimator.save()
 
-                    try:
-                        success = future.result(timeout=1800)  # 30分钟超时
-                        if success:
-                            self.log_message(f"视频 {i + 1} 下载成功")
-                        else:
-                            self.log_message(f"视频 {i + 1} 下载失败")
-                            if i < len(video_links):
-                                failed_downloads.append(video_links[i])
-                    except Exception as e:
-                        self.log_message(f"视频下载出错: {str(e)}")
-                        if i < len(video_links):
-                            failed_downloads.append(video_links[i])
-
-            # 检查任务状态
-            if self.task_logger:
+            # 检查任务状态；停止或退出时任务没有完成，状态由停止方记录
+            if self.task_logger and self.running:
                 task_info = self.task_logger.get_task_info(self.task_id)
                 if task_info:
                     if failed_downloads:
@@ -453,6 +632,9 @@ class VideoDownloadThread(QThread):
                         # 所有视频都成功，标记任务完成
                         self.task_logger.update_task_status(self.task_id, "completed")
 
+            if self.job.file_mover is not None and self.job.file_mover.pending_count():
+                self.log_message(f"还有 {self.job.file_mover.pending_count()} 个文件正在后台移动到下载目录")
+
             # 发送完成信号
             if self.running:
                 self.finished_signal.emit(self.task_id, failed_downloads)
@@ -465,4 +647,11 @@ class VideoDownloadThread(QThread):
                 self.task_logger.mark_task_failed(self.task_id, str(e))
 
             failed_downloads.append(self.list_url)
-            self.finished_signal.emit(self.task_id, failed_downloads)
\ No newline at end of file
+            self.finished_signal.emit(self.task_id, failed_downloads)
+        finally:
+            if self.lookahead is not None:
+                self.lookahead.close()
+            if self.coordinator is not None:
+                self.coordinator.unregister(self.task_id)
+            if self.shards is not None:
+                self.shards.unregister(self.task_id)
\ No newline at end of file
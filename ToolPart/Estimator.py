@@ -0,0 +1,224 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ToolPart.ContentIndex import video_id_from_url
+
+SCHEDULE_ORDERS = ("fifo", "shortest", "largest")
+# 汇总吞吐量的采样间隔（秒），间隔太短时单个数据块会让速度大幅波动
+THROUGHPUT_SAMPLE_SECONDS = 2.0
+# 单个传输的速度采样间隔（秒）
+TRANSFER_SAMPLE_SECONDS = 1.0
+
+
+class Ewma:
+    """指数加权移动平均，alpha 越大越偏向最近的样本"""
+
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self.value: Optional[float] = None
+
+    def update(self, sample: float) -> float:
+        self.value = sample if self.value is None else self.alpha * sample + (1 - self.alpha) * self.value
+        return self.value
+
+
+class TransferStats:
+    """单个文件传输的进度和速度"""
+
+    def __init__(self, host: str, alpha: float):
+        self.host = host
+        self.downloaded = 0
+        self.total = 0
+        self.speed = Ewma(alpha)
+        self.sample_time = time.monotonic()
+        self.sample_bytes = 0
+
+
+class SpeedEstimator:
+    """下载速度和剩余时间估计
+
+    按传输和按主机分别维护速度的指数加权移动平均，另外统计所有传输合计的吞吐量；
+    视频大小从下载表格或 Content-Length 得到，保存到 size_file 供之后的调度和估计使用。
+    """
+
+    def __init__(self, size_file: str = "./logger/video_sizes.json", alpha: float = 0.3):
+        self.size_file = size_file
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.transfers: Dict[str, TransferStats] = {}
+        self.hosts: Dict[str, Ewma] = {}
+        self.throughput_ewma = Ewma(alpha)
+        self.window_bytes = 0
+        self.window_start = time.monotonic()
+        self.sizes: Dict[str, int] = self._load_sizes()  # 视频ID -> 字节数
+        self.dirty = False
+
+    def learn_size(self, video_url: str, size: Optional[int]) -> None:
+        """记录视频的大小"""
+        if not size or size <= 0:
+            return
+        video_id = video_id_from_url(video_url)
+        with self.lock:
+            if self.sizes.get(video_id) != size:
+                self.sizes[video_id] = size
+                self.dirty = True
+
+    def expected_size(self, video_url: str) -> Optional[int]:
+        with self.lock:
+            return self.sizes.get(video_id_from_url(video_url))
+
+    def progress(self, key: str, host: str, downloaded: int, total: int) -> None:
+        """更新传输进度，key 为视频页面链接"""
+        now = time.monotonic()
+        with self.lock:
+            stats = self.transfers.get(key)
+            if stats is None:
+                stats = self.transfers[key] = TransferStats(host, self.alpha)
+            delta = max(downloaded - stats.downloaded, 0)
+            stats.downloaded = downloaded
+            stats.total = total
+            self._add_bytes(delta, now)
+            elapsed = now - stats.sample_time
+            if elapsed >= TRANSFER_SAMPLE_SECONDS:
+                speed = (downloaded - stats.sample_bytes) / elapsed
+                stats.speed.update(speed)
+                self.hosts.setdefault(host, Ewma(self.alpha)).update(speed)
+                stats.sample_time, stats.sample_bytes = now, downloaded
+
+    def finish(self, key: str) -> None:
+        """传输结束（成功或失败）后移除"""
+        with self.lock:
+            self.transfers.pop(key, None)
+
+    def record_completion(self, size: int, seconds: float, host: str = "") -> None:
+        """在其他进程或机器上完成的下载没有进度回调，按完成时的大小和耗时计入"""
+        if size <= 0:
+            return
+        with self.lock:
+            self._add_bytes(size, time.monotonic())
+            if host and seconds > 0:
+                self.hosts.setdefault(host, Ewma(self.alpha)).update(size / seconds)
+
+    def transfer_speed(self, key: str) -> Optional[float]:
+        with self.lock:
+            stats = self.transfers.get(key)
+            return stats.speed.value if stats else None
+
+    def transfer_eta(self, key: str) -> Optional[float]:
+        """单个传输的剩余时间（秒），速度或大小未知时返回 None"""
+        with self.lock:
+            stats = self.transfers.get(key)
+            if stats is None or not stats.total or not stats.speed.value:
+                return None
+            return max(stats.total - stats.downloaded, 0) / stats.speed.value
+
+    def host_speed(self, host: str) -> Optional[float]:
+        with self.lock:
+            ewma = self.hosts.get(host)
+            return ewma.value if ewma else None
+
+    def throughput(self) -> Optional[float]:
+        """所有传输合计的吞吐量（字节/秒）"""
+        with self.lock:
+            self._add_bytes(0, time.monotonic())
+            return self.throughput_ewma.value
+
+    def remaining_bytes(self, video_urls: Iterable[str]) -> Tuple[int, int]:
+        """一组视频剩余的字节数，返回（估计的剩余字节数，大小未知的视频数）
+
+        大小未知的视频按已知视频的平均大小计入；正在传输的视频扣除已下载的部分。
+        """
+        video_urls = list(video_urls)
+        with self.lock:
+            in_flight = sum(self.transfers[url].downloaded for url in video_urls if url in self.transfers)
+            known = [self.sizes.get(video_id_from_url(url)) for url in video_urls]
+            sizes = [size for size in known if size]
+            unknown = len(known) - len(sizes)
+            average = sum(sizes) / len(sizes) if sizes else (sum(self.sizes.values()) / len(self.sizes)
+                                                             if self.sizes else 0)
+        return max(int(sum(sizes) + unknown * average) - in_flight, 0), unknown
+
+    def eta(self, video_urls: Iterable[str]) -> Optional[float]:
+        """一组视频（播放列表或整个队列）的剩余时间（秒），无法估计时返回 None"""
+        remaining, _ = self.remaining_bytes(video_urls)
+        speed = self.throughput()
+        if not speed or not remaining:
+            return None
+        return remaining / speed
+
+    def order(self, video_urls: List[str], policy: str) -> List[str]:
+        """按调度策略排序：fifo 保持原顺序，shortest 小文件优先，largest 大文件优先
+
+        大小未知的视频按平均大小参与排序，大小相同时保持原顺序。
+        """
+        if policy not in ("shortest", "largest") or len(video_urls) < 2:
+            return list(video_urls)
+        with self.lock:
+            sizes = [self.sizes.get(video_id_from_url(url)) for url in video_urls]
+        known = [size for size in sizes if size]
+        average = sum(known) / len(known) if known else 0
+        keyed = [(size or average, index) for index, size in enumerate(sizes)]
+        keyed.sort(key=lambda item: (-item[0] if policy == "largest" else item[0], item[1]))
+        return [video_urls[index] for _, index in keyed]
+
+    def save(self) -> None:
+        """保存学到的视频大小"""
+        with self.lock:
+            if not self.dirty:
+                return
+            data = dict(self.sizes)
+            self.dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.size_file) or ".", exist_ok=True)
+            temp_path = self.size_file + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.size_file)
+        except OSError as e:
+            print(f"保存视频大小记录失败: {str(e)}")
+
+    def _add_bytes(self, nbytes: int, now: float) -> None:
+        # 调用方持有锁
+        self.window_bytes += nbytes
+        elapsed = now - self.window_start
+        if elapsed >= THROUGHPUT_SAMPLE_SECONDS:
+            self.throughput_ewma.update(self.window_bytes / elapsed)
+            self.window_bytes, self.window_start = 0, now
+
+    def _load_sizes(self) -> Dict[str, int]:
+        if not os.path.exists(self.size_file):
+            return {}
+        try:
+            with open(self.size_file, "r", encoding="utf-8") as f:
+                return {key: int(value) for key, value in json.load(f).items()}
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"读取视频大小记录失败: {str(e)}")
+            return {}
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    """剩余时间的简短描述"""
+    if seconds is None:
+        return "未知"
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} 秒"
+    if seconds < 3600:
+        return f"{seconds // 60} 分 {seconds % 60} 秒"
+    return f"{seconds // 3600} 小时 {seconds % 3600 // 60} 分"
+
+
+_estimator: Optional[SpeedEstimator] = None
+_estimator_lock = threading.Lock()
+
+
+def get_speed_estimator(settings: Optional[Dict[str, Any]] = None) -> SpeedEstimator:
+    """获取进程内共享的速度估计，所有任务的传输共同计入吞吐量"""
+    global _estimator
+    with _estimator_lock:
+        if _estimator is None:
+            _estimator = SpeedEstimator(alpha=(settings or {}).get("SpeedSmoothing", 0.3))
+        return _estimator
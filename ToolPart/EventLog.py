@@ -0,0 +1,254 @@
+import glob
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ToolPart.Metrics import metrics
+
+# 写入队列的最大长度，写入跟不上时丢弃新记录而不是阻塞下载线程
+QUEUE_SIZE = 10000
+# 每次写入文件的最大记录数
+WRITE_BATCH = 500
+# 文件名：events[-进程标记]-日期[.序号].jsonl[.gz]
+FILE_PATTERN = re.compile(r"^events(?:-[\w]+)?-(\d{4}-\d{2}-\d{2})(?:\.\d+)?\.jsonl(?:\.gz)?$")
+
+# 工作进程的文件名标记，避免多个进程写同一个文件
+_process_tag = ""
+
+
+def set_process_tag(tag: str) -> None:
+    """工作进程启动时调用，此后该进程的事件写入单独的文件"""
+    global _process_tag
+    _process_tag = tag
+
+
+class EventLog:
+    """结构化事件日志：每条记录一行 JSON，由后台线程批量写入
+
+    文件按日期切分，超过 max_bytes 时滚动为带序号的文件；滚动下来的旧文件用 gzip 压缩，超过 keep_days 的删除。
+    """
+
+    def __init__(self, log_dir: str, max_bytes: int = 50 * 1024 * 1024, keep_days: int = 30,
+                 record_all: bool = False, tag: str = ""):
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.keep_days = keep_days
+        self.record_all = record_all  # 除失败外是否也记录完成、浏览器回收等事件
+        self.prefix = f"events-{tag}" if tag else "events"
+        self.queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(QUEUE_SIZE)
+        self.current_date = ""
+        self.current_path = ""
+        os.makedirs(log_dir, exist_ok=True)
+        if record_all:
+            metrics.add_listener(self.record)
+        threading.Thread(target=self._write_loop, name="event-log", daemon=True).start()
+
+    def record(self, kind: str, **fields: Any) -> None:
+        """记录一条事件，不阻塞调用方"""
+        entry = {"ts": datetime.now().isoformat(timespec="milliseconds"), "kind": kind, **fields}
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            metrics.increment("event_log_dropped")
+
+    def record_event(self, kind: str, **fields: Any) -> None:
+        """记录非失败的事件，只在 record_all 开启时写入"""
+        if self.record_all:
+            self.record(kind, **fields)
+
+    def flush(self, timeout: float = 5) -> bool:
+        """等待队列中的记录全部写入，返回是否在时限内完成"""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"写入事件日志失败: {str(e)}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        date = time.strftime("%Y-%m-%d")
+        if date != self.current_date:
+            previous = self.current_path
+            self.current_date = date
+            self.current_path = os.path.join(self.log_dir, f"{self.prefix}-{date}.jsonl")
+            if previous and os.path.exists(previous):
+                self._compress(previous)
+            self._cleanup()
+        elif os.path.exists(self.current_path) and os.path.getsize(self.current_path) >= self.max_bytes:
+            self._rotate()
+
+        lines = "".join(json.dumps(entry, ensure_ascii=False, default=str) + "\n" for entry in batch)
+        with open(self.current_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def _rotate(self) -> None:
+        """当前文件超过大小上限，改名为下一个序号并压缩"""
+        base = self.current_path[:-len(".jsonl")]
+        index = 1
+        while os.path.exists(f"{base}.{index}.jsonl") or os.path.exists(f"{base}.{index}.jsonl.gz"):
+            index += 1
+        rotated = f"{base}.{index}.jsonl"
+        os.replace(self.current_path, rotated)
+        self._compress(rotated)
+
+    def _compress(self, path: str) -> None:
+        try:
+            # 追加模式：目标已存在时作为新的 gzip 成员写在后面，读取时两部分都能读到
+            with open(path, "rb") as src, gzip.open(path + ".gz", "ab") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(path)
+        except OSError as e:
+            print(f"压缩事件日志失败: {str(e)}")
+
+    def _cleanup(self) -> None:
+        """删除超过保留天数的文件，并压缩其他进程遗留的旧日期文件"""
+        cutoff = (datetime.now() - timedelta(days=self.keep_days)).strftime("%Y-%m-%d")
+        # 其他进程的文件可能还在写入，只压缩两天前的
+        stale = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        for path, date in iter_log_files(self.log_dir):
+            if self.keep_days > 0 and date < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            elif path.endswith(".jsonl") and (date < stale or date < self.current_date and
+                                              os.path.basename(path).startswith(f"{self.prefix}-{date}")):
+                self._compress(path)
+
+
+def iter_log_files(log_dir: str) -> Iterator[Tuple[str, str]]:
+    """列出事件日志文件，返回（路径，日期）"""
+    for path in sorted(glob.glob(os.path.join(log_dir, "events*.jsonl*"))):
+        match = FILE_PATTERN.match(os.path.basename(path))
+        if match:
+            yield path, match.group(1)
+
+
+def read_events(log_dir: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                kinds: Optional[Tuple[str, ...]] = None) -> Iterator[Dict[str, Any]]:
+    """读取时间范围内的事件（包括已压缩的文件）"""
+    since_text = since.isoformat() if since else ""
+    until_text = until.isoformat() if until else ""
+    for path, date in iter_log_files(log_dir):
+        if since and date < since.strftime("%Y-%m-%d"):
+            continue
+        if until and date > until.strftime("%Y-%m-%d"):
+            continue
+        opener = gzip.open if path.endswith(".gz") else open
+        try:
+            with opener(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    ts = entry.get("ts", "")
+                    if since_text and ts < since_text or until_text and ts > until_text:
+                        continue
+                    if kinds and entry.get("kind") not in kinds:
+                        continue
+                    yield entry
+        except (OSError, EOFError) as e:
+            print(f"读取事件日志 {path} 失败: {str(e)}")
+
+
+def summarize(log_dir: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+              top: int = 10) -> Dict[str, Any]:
+    """按失败类型、主机和阶段汇总失败
+
+    attempt_failed 为每次下载尝试的失败（含阶段和主机），video_failed 为重试用尽后最终失败的视频。
+    """
+    attempts: Counter = Counter()
+    by_class: Counter = Counter()
+    by_host: Counter = Counter()
+    by_stage: Counter = Counter()
+    by_combo: Counter = Counter()
+    final_by_class: Counter = Counter()
+    examples: Dict[str, str] = {}
+    failed_videos = 0
+    for entry in read_events(log_dir, since, until, ("attempt_failed", "video_failed")):
+        error_class = entry.get("error_class") or "unknown"
+        if entry["kind"] == "video_failed":
+            failed_videos += 1
+            final_by_class[error_class] += 1
+            continue
+        host = entry.get("host") or "-"
+        stage = entry.get("stage") or "-"
+        attempts["total"] += 1
+        by_class[error_class] += 1
+        by_host[host] += 1
+        by_stage[stage] += 1
+        by_combo[(error_class, host, stage)] += 1
+        examples.setdefault(error_class, entry.get("error", ""))
+
+    return {
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat() if until else None,
+        "failed_attempts": attempts["total"],
+        "failed_videos": failed_videos,
+        "by_class": by_class.most_common(top),
+        "by_host": by_host.most_common(top),
+        "by_stage": by_stage.most_common(top),
+        "top_causes": [{"error_class": c, "host": h, "stage": s, "count": n}
+                       for (c, h, s), n in by_combo.most_common(top)],
+        "final_by_class": final_by_class.most_common(top),
+        "examples": examples,
+    }
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """汇总结果的文本报告"""
+    lines = [f"时间范围: {summary['since'] or '最早'} ~ {summary['until'] or '现在'}",
+             f"失败尝试 {summary['failed_attempts']} 次，最终失败视频 {summary['failed_videos']} 个"]
+    for title, key in (("按失败类型", "by_class"), ("按主机", "by_host"), ("按阶段", "by_stage"),
+                       ("最终失败的类型", "final_by_class")):
+        if summary[key]:
+            lines.append(f"{title}:")
+            lines.extend(f"  {name}: {count}" for name, count in summary[key])
+    if summary["top_causes"]:
+        lines.append("主要原因（类型 / 主机 / 阶段）:")
+        lines.extend(f"  {c['error_class']} / {c['host']} / {c['stage']}: {c['count']}" for c in summary["top_causes"])
+    if summary["examples"]:
+        lines.append("错误示例:")
+        lines.extend(f"  {name}: {message}" for name, message in summary["examples"].items())
+    return "\n".join(lines)
+
+
+_event_log: Optional[EventLog] = None
+_event_log_lock = threading.Lock()
+
+
+def get_event_log(log_dir: str = "./logger/events", settings: Optional[Dict[str, Any]] = None) -> EventLog:
+    """获取进程内共享的事件日志，首次调用时按设置创建"""
+    global _event_log
+    with _event_log_lock:
+        if _event_log is None:
+            settings = settings or {}
+            _event_log = EventLog(log_dir, settings.get("EventLogMaxMB", 50) * 1024 * 1024,
+                                  settings.get("EventLogKeepDays", 30), settings.get("EventLogAll", False),
+                                  _process_tag)
+        return _event_log
@@ -0,0 +1,128 @@
+import json
+import re
+from typing import Optional, List, Dict, Any
+
+# 播放列表页：一次脚本调用取出标题和从第 start 个开始的视频链接
+PLAYLIST_SCRIPT = """
+const start = arguments[0] || 0;
+const box = document.querySelector('#playlist-scroll');
+const titleNode = document.evaluate('//*[@id="video-playlist-wrapper"]/div[1]/h4[1]', document, null,
+                                    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+const anchors = box ? Array.from(box.querySelectorAll('a')) : [];
+const links = [];
+for (const a of anchors.slice(start)) {
+    links.push(a.getAttribute('href') ? a.href : '');
+}
+return JSON.stringify({
+    found: !!box,
+    title: titleNode ? titleNode.textContent.trim() : null,
+    count: anchors.length,
+    links: links
+});
+"""
+
+# 播放列表页：滚动到底部，等待新链接出现（DOM 变化即返回）或超时
+SCROLL_PLAYLIST_SCRIPT = """
+const known = arguments[0];
+const timeout = arguments[1];
+const box = document.querySelector('#playlist-scroll');
+if (!box) {
+    return known;
+}
+const count = () => box.querySelectorAll('a').length;
+box.scrollTop = box.scrollHeight;
+window.scrollTo(0, document.body.scrollHeight);
+return new Promise(resolve => {
+    if (count() > known) {
+        resolve(count());
+        return;
+    }
+    const observer = new MutationObserver(() => {
+        if (count() > known) {
+            observer.disconnect();
+            resolve(count());
+        }
+    });
+    observer.observe(box, {childList: true, subtree: true});
+    setTimeout(() => {
+        observer.disconnect();
+        resolve(count());
+    }, timeout);
+});
+"""
+
+# 下载页：一次脚本调用取出下载表格中所有带下载链接的行
+DOWNLOAD_TABLE_SCRIPT = """
+const table = document.querySelector('#content-div');
+if (!table) {
+    return JSON.stringify(null);
+}
+const rows = [];
+table.querySelectorAll('tr').forEach((tr, index) => {
+    const link = tr.querySelector('a[data-url]');
+    if (!link) {
+        return;
+    }
+    rows.push({
+        index: index,
+        cells: Array.from(tr.querySelectorAll('td')).map(td => td.textContent.trim()),
+        url: link.getAttribute('data-url'),
+        filename: link.getAttribute('download')
+    });
+});
+return JSON.stringify(rows);
+"""
+
+QUALITY_PATTERN = re.compile(r'(\d{3,4})\s*[pP]\b')
+SIZE_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*([KMGT]i?B)\b', re.IGNORECASE)
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_quality(text: str) -> Optional[int]:
+    """从文本中解析分辨率（如 1080p），失败返回 None"""
+    match = QUALITY_PATTERN.search(text)
+    return int(match.group(1)) if match else None
+
+
+def parse_size(text: str) -> Optional[int]:
+    """从文本中解析文件大小（如 245.3MB），返回字节数，失败返回 None"""
+    match = SIZE_PATTERN.search(text)
+    if not match:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)[0].upper()])
+
+
+def extract_playlist(browser, start: int = 0) -> Dict[str, Any]:
+    """提取播放列表页信息，返回 {found, title, count, links}
+
+    links 为第 start 个链接元素之后的链接（保持页面顺序，可能含重复），count 为链接元素总数。
+    """
+    data = json.loads(browser.run_js(PLAYLIST_SCRIPT, start))
+    return {
+        "found": bool(data.get("found")),
+        "title": data.get("title") or None,
+        "count": int(data.get("count", 0)),
+        "links": [link for link in data.get("links", []) if link],
+    }
+
+
+def scroll_playlist(browser, known: int, timeout: float) -> int:
+    """滚动播放列表以加载更多条目，返回当前链接元素总数，没有新条目时返回值不变"""
+    result = browser.run_js(SCROLL_PLAYLIST_SCRIPT, known, int(timeout * 1000), timeout=timeout + 5)
+    return int(result or known)
+
+
+def extract_download_rows(browser) -> Optional[List[Dict[str, Any]]]:
+    """提取下载页表格中的所有下载源，未找到表格时返回 None
+
+    每行包含 index、cells、url、filename 以及解析出的 quality（分辨率）和 size（字节）。
+    """
+    rows = json.loads(browser.run_js(DOWNLOAD_TABLE_SCRIPT))
+    if rows is None:
+        return None
+
+    for row in rows:
+        text = " ".join(row.get("cells", []))
+        row["quality"] = parse_quality(text)
+        row["size"] = parse_size(text)
+    return rows
@@ -2,20 +2,40 @@ import configparser
 import os
 import time
 import uuid
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QFont
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QLabel, QLineEdit, QPushButton, QTextEdit, QGroupBox,
                              QScrollArea, QFrame, QFileDialog, QMessageBox, QCheckBox)
 
+from ToolPart.Cluster import get_coordinator
+from ToolPart.ControlApi import ApiBridge, ApiError, ControlServer, EventHub
 from ToolPart.DownloadThread import VideoDownloadThread
+from ToolPart.Integrity import IntegrityVerifier
 from ToolPart.Logger import LogEmitter, TaskLogger
+from ToolPart.Estimator import format_duration, get_speed_estimator
+from ToolPart.EventLog import get_event_log
+from ToolPart.MemoryGovernor import get_memory_governor
+from ToolPart.Settings import load_advanced_settings
+from ToolPart.Sharding import shutdown_process_shards
+from ToolPart.SourcePolicy import SourcePolicy
+from ToolPart.UrlImport import describe_skipped, parse_import, plan_import
+
+# 批量导入时每次事件循环创建的任务框数量
+FRAME_BATCH_SIZE = 100
+# 状态栏刷新剩余时间的间隔（毫秒）
+ETA_REFRESH_MS = 3000
+# 退出时浏览器全部关闭后，留给任务线程保存断点和任务记录的时间（秒）
+SHUTDOWN_GRACE = 2.0
 
 
 def update_task_status(task_frame: QFrame, status: str, color: str) -> None:
     """更新任务状态显示"""
+    if task_frame is None:
+        # 批量导入的任务框尚未创建，创建后统一刷新状态
+        return
     status_label = task_frame.findChild(QLabel, "status_label")
     if status_label:
         status_label.setText(f"状态: {status}")
@@ -146,21 +166,60 @@ class HanimeDownloaderApp(QMainWindow):
 
         self.active_threads: List[VideoDownloadThread] = []
         self.pending_tasks: List[Dict[str, Any]] = []  # 等待队列
+        # 已点击继续、但没有空闲并发槽位的暂停任务，保持暂停，槽位空出时先于等待队列继续
+        self.parked_threads: List[VideoDownloadThread] = []
         self.log_emitter = LogEmitter()
+        self.events = EventHub()  # 控制接口的进度事件
         self.task_logger = TaskLogger()  # 任务日志管理器
         self.max_concurrent_tasks = 2  # 减少并发任务数
+        self.shutting_down = False  # 正在退出，不再启动新任务
+        self.forced_exit = False  # 退出时有线程未在时限内结束，由主程序直接结束进程
 
         # 加载配置文件
         self.config = configparser.ConfigParser()
         self.config_file = "./config.ini"
         self.download_dir = self.load_config()
         self.headless_mode = self.load_headless_config()  # 加载无头模式配置
+        self.advanced_settings = load_advanced_settings(self.config_file)  # 加载高级设置
+        get_event_log(settings=self.advanced_settings)  # 按设置创建结构化事件日志
 
         self.init_ui()
         self.restore_pending_tasks()  # 恢复未完成任务
 
         # 在 init_ui() 之后连接信号
         self.log_emitter.log_signal.connect(self.log_message)  # type: ignore
+        self.log_emitter.requeue_signal.connect(self.on_video_requeued)  # type: ignore
+
+        # 启动协调节点，供其他机器上的工作节点连接
+        if self.advanced_settings["CoordinatorPort"] > 0:
+            try:
+                coordinator = get_coordinator(self.advanced_settings, self.log_emitter.log_signal.emit)
+                self.log_message(f"协调节点已启动: {coordinator.address}")
+            except OSError as e:
+                self.log_message(f"启动协调节点失败: {str(e)}")
+
+        # 本地控制接口，供脚本批量提交和管理任务
+        self.control_server = None
+        if self.advanced_settings["ApiPort"] > 0:
+            try:
+                self.api_bridge = ApiBridge(self.handle_api_command)
+                self.control_server = ControlServer(self.api_bridge, self.task_logger, self.events,
+                                                    self.advanced_settings["ApiHost"],
+                                                    self.advanced_settings["ApiPort"],
+                                                    self.advanced_settings["ApiToken"])
+                self.log_message(f"控制接口已启动: http://{self.control_server.address}")
+            except OSError as e:
+                self.log_message(f"启动控制接口失败: {str(e)}")
+
+        # 状态栏定时显示下载速度和整个队列的预计剩余时间
+        self.eta_timer = QTimer(self)
+        self.eta_timer.timeout.connect(self.update_queue_eta)  # type: ignore
+        self.eta_timer.start(ETA_REFRESH_MS)
+
+        # 后台检查下载目录中已有文件的完整性
+        if self.advanced_settings["VerifyOnStartup"]:
+            IntegrityVerifier(self.download_dir, self.task_logger, self.advanced_settings["VerifyWorkers"],
+                              self.log_emitter.log_signal.emit, self.log_emitter.requeue_signal.emit).start()
 
     def load_config(self) -> str:
         """加载配置文件，返回下载路径"""
@@ -199,116 +258,7 @@ class HanimeDownloaderApp(QMainWindow):
             self.log_message(f"找到 {len(pending_tasks)} 个未完成的任务")
 
             for task_info in pending_tasks:
-                task_id = task_info["task_id"]
-                url = task_info["url"]
-                download_dir = task_info.get("download_dir", self.download_dir)
-                status = task_info.get("status", "pending")
-                task_type = task_info.get("task_type", "playlist")
-
-                self.log_message(f"恢复任务: {url} (状态: {status}, 类型: {task_type})")
-
-                # 创建任务显示框
-                task_frame = QFrame()
-                task_frame.setFrameShape(QFrame.StyledPanel)
-                task_frame.setObjectName(task_id)
-                task_frame.url = url
-                task_layout = QVBoxLayout(task_frame)
-
-                # 显示任务类型
-                task_type_text = "播放列表" if task_type == "playlist" else "单视频"
-                if status == "failed":
-                    task_label_text = f"[失败]{task_type_text}: {url}"
-                elif task_info.get("is_retry", False):
-                    task_label_text = f"[重试]{task_type_text}: {url}"
-                else:
-                    task_label_text = f"{task_type_text}: {url}"
-
-                task_label = QLabel(task_label_text)
-                task_label.setStyleSheet("color: #ecf0f1; font-weight: bold;")
-                task_layout.addWidget(task_label)
-
-                status_text = "失败" if status == "failed" else status
-                status_label = QLabel(f"状态: {status_text}")
-                status_label.setObjectName("status_label")
-                task_layout.addWidget(status_label)
-
-                # 显示进度信息
-                total_videos = task_info.get("total_videos", 0)
-                completed_videos = len(task_info.get("completed_videos", []))
-                failed_videos = len(task_info.get("failed_videos", []))
-
-                if total_videos > 0:
-                    progress_text = f"进度: {completed_videos}/{total_videos}"
-                    if failed_videos > 0:
-                        progress_text += f" (失败: {failed_videos})"
-
-                    progress_label = QLabel(progress_text)
-                    progress_label.setStyleSheet("color: #95a5a6;")
-                    task_layout.addWidget(progress_label)
-
-                # 按钮布局
-                button_layout = QHBoxLayout()
-
-                pause_btn = QPushButton("暂停")
-                pause_btn.setObjectName("pause_btn")
-                pause_btn.clicked.connect(lambda: self.pause_task(task_frame))  # type: ignore
-                button_layout.addWidget(pause_btn)
-
-                resume_btn = QPushButton("继续")
-                resume_btn.setObjectName("resume_btn")
-                resume_btn.clicked.connect(lambda: self.resume_task(task_frame))  # type: ignore
-                button_layout.addWidget(resume_btn)
-
-                delete_btn = QPushButton("删除")
-                delete_btn.setObjectName("delete_btn")
-                delete_btn.clicked.connect(lambda: self.delete_task(task_frame))  # type: ignore
-                button_layout.addWidget(delete_btn)
-
-                task_layout.addLayout(button_layout)
-                self.tasks_layout.addWidget(task_frame)
-
-                # 根据状态设置颜色和按钮状态
-                if status == "paused":
-                    status_label.setStyleSheet("color: #f39c12;")
-                    pause_btn.setEnabled(False)
-                    resume_btn.setEnabled(True)
-                    # 添加到队列但不立即启动
-                    self.pending_tasks.append({
-                        "url": url,
-                        "frame": task_frame,
-                        "task_id": task_id,
-                        "task_type": task_type,
-                        "status": "paused",
-                        "is_retry": task_info.get("is_retry", False)
-                    })
-                elif status == "failed":
-                    status_label.setStyleSheet("color: #e74c3c;")
-                    pause_btn.setEnabled(False)
-                    resume_btn.setEnabled(True)  # 失败任务可以继续
-                    # 失败任务添加到队列末尾，状态为paused
-                    self.pending_tasks.append({
-                        "url": url,
-                        "frame": task_frame,
-                        "task_id": task_id,
-                        "task_type": task_type,
-                        "status": "paused",  # 失败任务以暂停状态加入队列
-                        "is_retry": True  # 标记为重试
-                    })
-                else:  # running or pending
-                    color = "#2ecc71" if status == "running" else "#f39c12"
-                    status_label.setStyleSheet(f"color: {color};")
-                    pause_btn.setEnabled(status == "running")
-                    resume_btn.setEnabled(False)
-                    # 添加到等待队列
-                    self.pending_tasks.append({
-                        "url": url,
-                        "frame": task_frame,
-                        "task_id": task_id,
-                        "task_type": task_type,
-                        "status": "pending"
-                    })
-
-                self.log_message(f"任务已添加到队列: {url}")
+                self.add_task_frame(task_info)
 
             if self.pending_tasks:
                 self.delete_all_btn.setEnabled(True)
@@ -320,6 +270,131 @@ class HanimeDownloaderApp(QMainWindow):
         except Exception as e:
             self.log_message(f"恢复任务失败: {str(e)}")
 
+    def add_task_frame(self, task_info: Dict[str, Any]) -> None:
+        """为账本中的任务创建任务显示框并按状态加入队列"""
+        task_id = task_info["task_id"]
+        url = task_info["url"]
+        download_dir = task_info.get("download_dir", self.download_dir)
+        status = task_info.get("status", "pending")
+        task_type = task_info.get("task_type", "playlist")
+
+        self.log_message(f"恢复任务: {url} (状态: {status}, 类型: {task_type})")
+
+        # 创建任务显示框
+        task_frame = QFrame()
+        task_frame.setFrameShape(QFrame.StyledPanel)
+        task_frame.setObjectName(task_id)
+        task_frame.url = url
+        task_layout = QVBoxLayout(task_frame)
+
+        # 显示任务类型
+        task_type_text = "播放列表" if task_type == "playlist" else "单视频"
+        if status == "failed":
+            task_label_text = f"[失败]{task_type_text}: {url}"
+        elif task_info.get("is_retry", False):
+            task_label_text = f"[重试]{task_type_text}: {url}"
+        else:
+            task_label_text = f"{task_type_text}: {url}"
+
+        task_label = QLabel(task_label_text)
+        task_label.setStyleSheet("color: #ecf0f1; font-weight: bold;")
+        task_layout.addWidget(task_label)
+
+        status_text = "失败" if status == "failed" else status
+        status_label = QLabel(f"状态: {status_text}")
+        status_label.setObjectName("status_label")
+        task_layout.addWidget(status_label)
+
+        # 显示进度信息
+        total_videos = task_info.get("total_videos", 0)
+        completed_videos = len(task_info.get("completed_videos", []))
+        failed_videos = len(task_info.get("failed_videos", []))
+
+        if total_videos > 0:
+            progress_text = f"进度: {completed_videos}/{total_videos}"
+            if failed_videos > 0:
+                progress_text += f" (失败: {failed_videos})"
+
+            progress_label = QLabel(progress_text)
+            progress_label.setStyleSheet("color: #95a5a6;")
+            task_layout.addWidget(progress_label)
+
+        # 按钮布局
+        button_layout = QHBoxLayout()
+
+        pause_btn = QPushButton("暂停")
+        pause_btn.setObjectName("pause_btn")
+        pause_btn.clicked.connect(lambda: self.pause_task(task_frame))  # type: ignore
+        button_layout.addWidget(pause_btn)
+
+        resume_btn = QPushButton("继续")
+        resume_btn.setObjectName("resume_btn")
+        resume_btn.clicked.connect(lambda: self.resume_task(task_frame))  # type: ignore
+        button_layout.addWidget(resume_btn)
+
+        delete_btn = QPushButton("删除")
+        delete_btn.setObjectName("delete_btn")
+        delete_btn.clicked.connect(lambda: self.delete_task(task_frame))  # type: ignore
+        button_layout.addWidget(delete_btn)
+
+        task_layout.addLayout(button_layout)
+        self.tasks_layout.addWidget(task_frame)
+
+        # 根据状态设置颜色和按钮状态
+        if status == "paused":
+            status_label.setStyleSheet("color: #f39c12;")
+            pause_btn.setEnabled(False)
+            resume_btn.setEnabled(True)
+            # 添加到队列但不立即启动
+            self.pending_tasks.append({
+                "url": url,
+                "frame": task_frame,
+                "task_id": task_id,
+                "task_type": task_type,
+                "status": "paused",
+                "is_retry": task_info.get("is_retry", False)
+            })
+        elif status == "failed":
+            status_label.setStyleSheet("color: #e74c3c;")
+            pause_btn.setEnabled(False)
+            resume_btn.setEnabled(True)  # 失败任务可以继续
+            # 失败任务添加到队列末尾，状态为paused
+            self.pending_tasks.append({
+                "url": url,
+                "frame": task_frame,
+                "task_id": task_id,
+                "task_type": task_type,
+                "status": "paused",  # 失败任务以暂停状态加入队列
+                "is_retry": True  # 标记为重试
+            })
+        else:  # running or pending
+            color = "#2ecc71" if status == "running" else "#f39c12"
+            status_label.setStyleSheet(f"color: {color};")
+            pause_btn.setEnabled(status == "running")
+            resume_btn.setEnabled(False)
+            # 添加到等待队列
+            self.pending_tasks.append({
+                "url": url,
+                "frame": task_frame,
+                "task_id": task_id,
+                "task_type": task_type,
+                "status": "pending"
+            })
+
+        self.log_message(f"任务已添加到队列: {url}")
+
+    def on_video_requeued(self, task_id: str) -> None:
+        """完整性检查把损坏的视频重新加入任务后，显示尚未出现在界面中的任务"""
+        if any(thread.task_id == task_id for thread in self.active_threads):
+            return
+        if any(task["task_id"] == task_id for task in self.pending_tasks):
+            return
+        task_info = self.task_logger.get_task_info(task_id)
+        if task_info:
+            self.add_task_frame(task_info)
+            self.delete_all_btn.setEnabled(True)
+            self.update_queue_status()
+
     def init_ui(self) -> None:
         """初始化用户界面"""
         central_widget = QWidget()
@@ -377,13 +452,17 @@ class HanimeDownloaderApp(QMainWindow):
 
         input_layout.addLayout(url_input_layout)
 
-        # 按钮布局 - 现在有4个按钮
+        # 按钮布局 - 现在有5个按钮
         button_layout = QHBoxLayout()
 
         self.download_btn = QPushButton("开始下载")
         self.download_btn.clicked.connect(self.start_download)  # type: ignore
         button_layout.addWidget(self.download_btn)
 
+        self.import_btn = QPushButton("批量导入")
+        self.import_btn.clicked.connect(self.import_file)  # type: ignore
+        button_layout.addWidget(self.import_btn)
+
         self.pause_all_btn = QPushButton("暂停所有任务")
         self.pause_all_btn.clicked.connect(self.pause_all_tasks)  # type: ignore
         button_layout.addWidget(self.pause_all_btn)
@@ -432,6 +511,93 @@ class HanimeDownloaderApp(QMainWindow):
         self.status_bar = self.statusBar()
         self.status_bar.showMessage("就绪")
 
+    def queue_eta(self) -> Dict[str, Any]:
+        """整个队列的下载速度和预计剩余时间
+
+        只能估计已枚举出的视频；尚未开始的任务和仍在枚举的播放列表单独计数。
+        """
+        estimator = get_speed_estimator(self.advanced_settings)
+        videos: List[str] = []
+        for thread in self.active_threads:
+            if thread.isRunning():
+                videos.extend(thread.remaining_videos())
+        remaining, unknown = estimator.remaining_bytes(videos)
+        speed = estimator.throughput()
+        return {
+            "speed": speed or 0,
+            "remaining_videos": len(videos),
+            "remaining_bytes": remaining,
+            "unknown_sizes": unknown,
+            "eta_seconds": remaining / speed if speed and remaining else None,
+            "tasks_not_started": sum(1 for task in self.pending_tasks if task.get("status") != "paused"),
+        }
+
+    def update_queue_eta(self) -> None:
+        if not any(thread.isRunning() for thread in self.active_threads):
+            if self.status_bar.currentMessage().startswith("速度"):
+                self.status_bar.showMessage("就绪")
+            return
+        eta = self.queue_eta()
+        message = (f"速度 {eta['speed'] / 1024 / 1024:.2f} MB/s，剩余 {eta['remaining_videos']} 个视频，"
+                   f"预计 {format_duration(eta['eta_seconds'])}")
+        if eta["tasks_not_started"]:
+            message += f"（另有 {eta['tasks_not_started']} 个任务未开始）"
+        self.status_bar.showMessage(message)
+
+    def task_states(self) -> Dict[str, str]:
+        """界面中各任务的当前状态：running、paused 或 queued"""
+        states: Dict[str, str] = {}
+        for thread in self.active_threads:
+            if thread in self.parked_threads:
+                states[thread.task_id] = "queued"
+            else:
+                states[thread.task_id] = "paused" if getattr(thread, 'paused', False) else "running"
+        for task in self.pending_tasks:
+            states.setdefault(task["task_id"], "paused" if task.get("status") == "paused" else "queued")
+        return states
+
+    def publish_task_event(self, task_id: str, action: str, **extra: Any) -> None:
+        """向控制接口的事件流发布任务状态变化"""
+        self.events.publish("task", {"task_id": task_id, "action": action,
+                                     "state": self.task_states().get(task_id, "idle"), **extra})
+
+    def handle_api_command(self, action: str, payload: Dict[str, Any]) -> Any:
+        """在界面线程中执行控制接口的命令"""
+        if action == "status":
+            states = self.task_states()
+            return {
+                "running": sum(1 for state in states.values() if state == "running"),
+                "queued": sum(1 for state in states.values() if state == "queued"),
+                "paused": sum(1 for state in states.values() if state == "paused"),
+                "max_concurrent_tasks": self.max_concurrent_tasks,
+                "download_dir": self.download_dir,
+                "eta": self.queue_eta(),
+            }
+        if action == "snapshot":
+            return self.task_states()
+        if action == "enqueue":
+            urls = payload.get("urls") or ([payload["url"]] if payload.get("url") else [])
+            task_type = payload.get("type", "playlist")
+            if task_type not in ("playlist", "video"):
+                raise ApiError(400, f"未知的任务类型: {task_type}")
+            urls = [url.strip() for url in urls if isinstance(url, str) and url.strip()]
+            if not urls:
+                raise ApiError(400, "请提供 url 或 urls")
+            return self.import_urls("\n".join(urls), task_type)
+
+        task_frame = self.find_task_frame(payload.get("task_id", ""))
+        if task_frame is None:
+            raise ApiError(404, f"任务不存在: {payload.get('task_id')}")
+        if action == "pause":
+            self.pause_task(task_frame)
+        elif action == "resume":
+            self.resume_task(task_frame)
+        elif action == "delete":
+            self.delete_task(task_frame)
+        else:
+            raise ApiError(400, f"未知的命令: {action}")
+        return {"task_id": payload["task_id"], "state": self.task_states().get(payload["task_id"], "deleted")}
+
     def on_headless_changed(self, state: int) -> None:
         """无头模式复选框状态改变"""
         self.headless_mode = (state == Qt.Checked)
@@ -452,7 +618,10 @@ class HanimeDownloaderApp(QMainWindow):
             clipboard = QApplication.clipboard()
             text = clipboard.text().strip()
 
-            if text:
+            if text and len(text.splitlines()) > 1:
+                # 多行内容直接批量导入
+                self.import_urls(text)
+            elif text:
                 self.url_input.setText(text)
                 self.log_message(f"已粘贴剪贴板内容: {text[:50]}{'...' if len(text) > 50 else ''}")
             else:
@@ -493,28 +662,127 @@ class HanimeDownloaderApp(QMainWindow):
                     task_label.setText(f"播放列表: {playlist_title}")
 
     def start_download(self) -> None:
-        """开始新的下载任务"""
-        url = self.url_input.text().strip()
-        if not url:
+        """开始新的下载任务，输入框中可以包含多个链接"""
+        text = self.url_input.text().strip()
+        if not text:
             self.log_message("请输入有效的URL")
             return
 
         self.url_input.clear()
+        self.import_urls(text)
+
+    def import_file(self) -> None:
+        """从文本或 JSONL 文件批量导入链接"""
+        path, _ = QFileDialog.getOpenFileName(self, "选择要导入的链接文件", "",
+                                              "链接列表 (*.txt *.jsonl *.csv);;所有文件 (*)")
+        if not path:
+            return
+        try:
+            with open(path, "r", encoding="utf-8-sig") as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            self.log_message(f"读取导入文件失败: {str(e)}")
+            return
+        self.import_urls(text)
+
+    def import_urls(self, text: str, task_type: str = "playlist") -> Dict[str, Any]:
+        """解析并批量添加链接，跳过重复和已有的任务，返回新任务ID和跳过的数量"""
+        entries, invalid = parse_import(text, task_type)
+        existing = [task.get("url", "") for task in self.task_logger.get_all_tasks().values()]
+        downloaded = [record["url"] for path, record in self.task_logger.get_file_records(self.download_dir).items()
+                      if record.get("url") and os.path.exists(path)]
+        accepted, skipped = plan_import(entries, existing, downloaded)
+
+        task_ids = self.enqueue_tasks(accepted)
+        summary = describe_skipped(skipped, invalid)
+        if len(entries) + invalid > 1 or summary:
+            self.log_message(f"已添加 {len(task_ids)} 个任务" + (f"，跳过{summary}" if summary else ""))
+        return {"task_ids": task_ids, "skipped": skipped, "invalid": invalid}
+
+    def enqueue_task(self, url: str, task_type: str = "playlist") -> str:
+        """创建单个任务并启动或加入等待队列，返回任务ID"""
+        return self.enqueue_tasks([{"url": url, "task_type": task_type}])[0]
+
+    def enqueue_tasks(self, entries: List[Dict[str, str]]) -> List[str]:
+        """批量创建任务：一次写入任务记录，一次刷新界面，然后按并发数启动"""
+        if not entries:
+            return []
+        new_tasks = [{"task_id": str(uuid.uuid4()), "url": entry["url"], "task_type": entry["task_type"]}
+                     for entry in entries]
+
+        # 记录任务开始，下载源策略随任务保存，之后修改配置不影响已有任务
+        self.task_logger.log_tasks_start(new_tasks, self.download_dir,
+                                         SourcePolicy.from_settings(self.advanced_settings).to_dict())
+
+        # 任务框稍后分批创建，先启动的任务在启动时创建
+        for task in new_tasks:
+            self.pending_tasks.append({
+                "url": task["url"],
+                "frame": None,
+                "task_id": task["task_id"],
+                "task_type": task["task_type"],
+                "status": "pending"
+            })
 
-        # 生成任务ID
-        task_id = str(uuid.uuid4())
+        # 检查当前活动任务数量，空闲的并发槽位立即启动队列中的任务
+        for _ in range(self.max_concurrent_tasks - self.running_task_count()):
+            self.start_next_task()
 
-        # 记录任务开始
-        self.task_logger.log_task_start(task_id, url, self.download_dir)
+        queued = sum(1 for task in self.pending_tasks if task.get("status") != "paused")
+        if queued:
+            self.log_message(f"任务已添加到队列，当前等待任务数: {queued}")
+        self.build_pending_frames()
+        self.delete_all_btn.setEnabled(True)
 
-        # 创建任务显示框
+        task_ids = [task["task_id"] for task in new_tasks]
+        self.events.publish("task", {"action": "added", "task_ids": task_ids})
+        return task_ids
+
+    def ensure_task_frame(self, task: Dict[str, Any]) -> QFrame:
+        """返回等待任务的显示框，尚未创建时立即创建"""
+        if task["frame"] is None:
+            task["frame"] = self.create_task_frame(task["task_id"], task["url"], task["task_type"])
+        return task["frame"]
+
+    def build_pending_frames(self) -> None:
+        """分批为尚未显示的等待任务创建任务框，批量导入上千个任务时界面不会长时间无响应"""
+        built = 0
+        self.tasks_container.setUpdatesEnabled(False)
+        try:
+            for task in self.pending_tasks:
+                if task["frame"] is None:
+                    self.ensure_task_frame(task)
+                    built += 1
+                    if built >= FRAME_BATCH_SIZE:
+                        break
+        finally:
+            self.tasks_container.setUpdatesEnabled(True)
+
+        if any(task["frame"] is None for task in self.pending_tasks):
+            QTimer.singleShot(0, self.build_pending_frames)
+        else:
+            self.update_queue_status()
+
+    def find_task_frame(self, task_id: str) -> Optional[QFrame]:
+        """按任务ID查找任务框，等待中的任务尚未创建任务框时立即创建"""
+        task_frame = self.findChild(QFrame, task_id)
+        if task_frame is not None:
+            return task_frame
+        for task in self.pending_tasks:
+            if task["task_id"] == task_id:
+                return self.ensure_task_frame(task)
+        return None
+
+    def create_task_frame(self, task_id: str, url: str, task_type: str) -> QFrame:
+        """创建新任务的显示框"""
         task_frame = QFrame()
         task_frame.setFrameShape(QFrame.StyledPanel)
         task_frame.setObjectName(task_id)
         task_frame.url = url
         task_layout = QVBoxLayout(task_frame)
 
-        task_label = QLabel(f"播放列表: {url}")
+        task_type_text = "播放列表" if task_type == "playlist" else "单视频"
+        task_label = QLabel(f"{task_type_text}: {url}")
         task_label.setStyleSheet("color: #ecf0f1; font-weight: bold;")
         task_layout.addWidget(task_label)
 
@@ -544,26 +812,7 @@ class HanimeDownloaderApp(QMainWindow):
 
         task_layout.addLayout(button_layout)
         self.tasks_layout.addWidget(task_frame)
-
-        # 检查当前活动任务数量
-        active_count = sum(1 for thread in self.active_threads
-                           if thread.isRunning() and not getattr(thread, 'paused', False))
-
-        if active_count < self.max_concurrent_tasks:
-            update_task_status(task_frame, "运行中", "#2ecc71")
-            self.start_download_task(url, task_frame, task_id)
-        else:
-            self.pending_tasks.append({
-                "url": url,
-                "frame": task_frame,
-                "task_id": task_id,
-                "task_type": "playlist",
-                "status": "pending"
-            })
-            self.log_message(f"任务已添加到队列，当前队列位置: {len(self.pending_tasks)}")
-            self.update_queue_status()
-
-        self.delete_all_btn.setEnabled(True)
+        return task_frame
 
     def start_download_task(self, url: str, task_frame: QFrame, task_id: str) -> None:
         """启动下载线程"""
@@ -580,18 +829,23 @@ class HanimeDownloaderApp(QMainWindow):
             self.task_logger.update_task_status(task_id, "running")
 
         thread = VideoDownloadThread(url, self.download_dir, task_id,
-                                     self.task_logger, is_retry, self.headless_mode)  # 传递headless参数
+                                     self.task_logger, is_retry, self.headless_mode,  # 传递headless参数
+                                     self.advanced_settings)
         thread.task_frame = task_frame
         thread.task_id = task_id
 
         # 连接信号
         thread.log_signal.connect(self.log_message)
         thread.finished_signal.connect(self.on_download_finished)
+        thread.log_signal.connect(lambda message: self.events.publish("log", {"task_id": task_id, "message": message}))
+        thread.video_signal.connect(lambda tid, video_url, ok: self.events.publish(
+            "video", {"task_id": tid, "url": video_url, "success": ok}))
 
         self.active_threads.append(thread)
 
         update_task_status(task_frame, "运行中", "#2ecc71")
         thread.start()
+        self.publish_task_event(task_id, "started")
 
     def on_download_finished(self, task_id: str, failed_urls: List[str]) -> None:
         """下载完成处理"""
@@ -607,6 +861,9 @@ class HanimeDownloaderApp(QMainWindow):
 
         if thread and thread in self.active_threads:
             self.active_threads.remove(thread)
+        if thread in self.parked_threads:
+            self.parked_threads.remove(thread)
+        self.publish_task_event(task_id, "finished", failed_videos=len(failed_urls))
 
         # 获取任务信息
         task_info = self.task_logger.get_task_info(task_id)
@@ -689,12 +946,20 @@ class HanimeDownloaderApp(QMainWindow):
         self.start_next_task()
 
     def start_next_task(self) -> None:
-        """启动下一个等待中的任务"""
+        """启动下一个等待中的任务，等待继续的暂停任务优先"""
+        if self.shutting_down:
+            return
+        while self.parked_threads:
+            thread = self.parked_threads.pop(0)
+            if thread in self.active_threads and thread.isRunning():
+                self.resume_thread(thread)
+                return
         if self.pending_tasks:
             # 查找第一个状态不是"paused"的任务
             for i, task in enumerate(self.pending_tasks):
                 if task.get("status") != "paused":
                     next_task = self.pending_tasks.pop(i)
+                    self.ensure_task_frame(next_task)
                     update_task_status(next_task["frame"], "运行中", "#2ecc71")
                     self.start_download_task(next_task["url"], next_task["frame"], next_task["task_id"])
                     self.update_queue_status()
@@ -716,6 +981,8 @@ class HanimeDownloaderApp(QMainWindow):
         found_in_active = False
         for thread in self.active_threads:
             if hasattr(thread, 'task_frame') and thread.task_frame == task_frame:
+                if thread in self.parked_threads:
+                    self.parked_threads.remove(thread)
                 thread.pause()
                 update_task_status(task_frame, "已暂停", "#f39c12")
                 self.log_message(f"任务已暂停: {thread.list_url}")
@@ -731,6 +998,10 @@ class HanimeDownloaderApp(QMainWindow):
                         task["status"] = "paused"
                         break
                 found_in_active = True
+
+                # 暂停的任务会释放浏览器和连接，不再占用并发槽位，可以启动队列中的任务
+                if self.running_task_count() < self.max_concurrent_tasks:
+                    self.start_next_task()
                 break
 
         # 如果不在活动线程中，说明这是一个队列中的任务
@@ -749,6 +1020,8 @@ class HanimeDownloaderApp(QMainWindow):
                     self.log_message(f"任务已暂停: {task['url']}")
                     break
 
+        self.publish_task_event(task_id, "paused")
+
     def resume_task(self, task_frame: QFrame) -> None:
         """继续单个任务"""
         task_id = task_frame.objectName()
@@ -757,21 +1030,20 @@ class HanimeDownloaderApp(QMainWindow):
         found_in_active = False
         for thread in self.active_threads:
             if hasattr(thread, 'task_frame') and thread.task_frame == task_frame:
-                thread.resume()
-                update_task_status(task_frame, "运行中", "#2ecc71")
-                self.log_message(f"任务已继续: {thread.list_url}")
-
-                # 更新任务状态
-                task_id = thread.task_id
-                if self.task_logger:
-                    self.task_logger.update_task_status(task_id, "running")
-
-                # 更新pending_tasks中的状态
-                for task in self.pending_tasks:
-                    if task["frame"] == task_frame:
-                        task["status"] = "running"
-                        break
                 found_in_active = True
+                task_id = thread.task_id
+                if thread in self.parked_threads or not getattr(thread, 'paused', False):
+                    break
+                # 暂停期间其他任务占用了并发槽位时保持暂停，等槽位空出后再继续
+                if self.running_task_count() >= self.max_concurrent_tasks:
+                    self.parked_threads.append(thread)
+                    update_task_status(task_frame, "队列中", "#f39c12")
+                    self.log_message(f"并发任务数已达上限，任务在队列中等待继续: {thread.list_url}")
+                    # 任务记录中按运行处理，下次启动时自动继续
+                    if self.task_logger:
+                        self.task_logger.update_task_status(task_id, "running")
+                else:
+                    self.resume_thread(thread)
                 break
 
         # 如果不在活动线程中，说明这是一个暂停的队列任务
@@ -789,12 +1061,8 @@ class HanimeDownloaderApp(QMainWindow):
 
                     self.log_message(f"任务已恢复: {task['url']}")
 
-                    # 检查当前活动任务数量
-                    active_count = sum(1 for thread in self.active_threads
-                                       if thread.isRunning() and not getattr(thread, 'paused', False))
-
                     # 如果并发数允许，立即启动这个任务
-                    if active_count < self.max_concurrent_tasks:
+                    if self.running_task_count() < self.max_concurrent_tasks:
                         # 从pending_tasks中移除并立即启动
                         self.pending_tasks.remove(task)
                         self.start_download_task(task["url"], task["frame"], task["task_id"])
@@ -806,14 +1074,34 @@ class HanimeDownloaderApp(QMainWindow):
                     self.update_queue_status()
                     break
 
+        self.publish_task_event(task_id, "resumed")
+
+    def resume_thread(self, thread: VideoDownloadThread) -> None:
+        """继续暂停中的任务线程"""
+        thread.resume()
+        update_task_status(thread.task_frame, "运行中", "#2ecc71")
+        self.log_message(f"任务已继续: {thread.list_url}")
+
+        # 更新pending_tasks中的状态
+        for task in self.pending_tasks:
+            if task["frame"] == thread.task_frame:
+                task["status"] = "running"
+                break
+
+    def running_task_count(self) -> int:
+        """占用并发槽位的任务数，暂停的任务已释放浏览器和连接，不计入"""
+        return sum(1 for thread in self.active_threads
+                   if thread.isRunning() and not getattr(thread, 'paused', False))
+
     def delete_task(self, task_frame: QFrame) -> None:
         """删除单个任务（放弃任务）"""
         task_id = task_frame.objectName()
+        self.publish_task_event(task_id, "deleted")
 
         # 停止活动线程中的任务
         for thread in self.active_threads:
             if hasattr(thread, 'task_frame') and thread.task_frame == task_frame:
-                thread.stop()
+                thread.stop(discard=True)
                 if thread.isRunning():
                     thread.wait(5000)  # 等待线程停止
                 self.log_message(f"任务已删除: {thread.list_url}")
@@ -824,6 +1112,8 @@ class HanimeDownloaderApp(QMainWindow):
 
                 if thread in self.active_threads:
                     self.active_threads.remove(thread)
+                if thread in self.parked_threads:
+                    self.parked_threads.remove(thread)
                 if task_frame and task_frame.parent():
                     task_frame.deleteLater()
 
@@ -915,7 +1205,7 @@ class HanimeDownloaderApp(QMainWindow):
         for thread in self.active_threads[:]:  # 使用副本遍历
             try:
                 if thread.isRunning():
-                    thread.stop()
+                    thread.stop(discard=True)
                     thread.wait(5000)  # 等待5秒让线程停止
                 self.log_message(f"已删除任务: {thread.list_url}")
 
@@ -942,6 +1232,7 @@ class HanimeDownloaderApp(QMainWindow):
 
         # 清除所有列表
         self.active_threads.clear()
+        self.parked_threads.clear()
         self.pending_tasks.clear()
         self.delete_all_btn.setEnabled(False)
         self.log_message("已删除所有任务")
@@ -962,7 +1253,7 @@ class HanimeDownloaderApp(QMainWindow):
             self.log_message(f"下载路径已更新为: {self.download_dir}")
 
     def closeEvent(self, event) -> None:
-        """关闭窗口时停止所有线程"""
+        """关闭窗口时在时限内停止所有任务，进行中的下载保存断点，下次启动时继续"""
         if self.active_threads or self.pending_tasks:
             reply = QMessageBox.question(
                 self,
@@ -971,24 +1262,46 @@ class HanimeDownloaderApp(QMainWindow):
                 QMessageBox.Yes | QMessageBox.No,
                 QMessageBox.No
             )
-
-            if reply == QMessageBox.Yes:
-                # 更新所有活动任务状态为暂停
-                for thread in self.active_threads:
-                    if thread.isRunning():
-                        task_id = thread.task_id
-                        self.task_logger.update_task_status(task_id, "paused")
-                        thread.stop()
-
-                # 更新所有等待任务状态为暂停
-                for task in self.pending_tasks:
-                    if task.get("status") != "paused":
-                        self.task_logger.update_task_status(task["task_id"], "paused")
-
-                # 等待线程停止
-                time.sleep(2)
-                event.accept()
-            else:
+            if reply != QMessageBox.Yes:
                 event.ignore()
-        else:
-            event.accept()
\ No newline at end of file
+                return
+
+        self.shutdown()
+        event.accept()
+
+    def shutdown(self) -> None:
+        """退出流程，总时长不超过 ShutdownTimeout
+
+        1. 不再启动队列中的任务，关闭控制接口；
+        2. 所有任务停止提交新视频，进行中的传输写完缓冲区后保存断点，中断的视频记入任务记录；
+        3. 浏览器并行关闭，到时限仍未关闭的直接结束进程，卡在浏览器操作中的线程随之返回；
+           配置了 ProcessWorkers 时工作进程连同其浏览器一起结束；
+        4. 等待任务线程退出，保存速度估计和事件日志。
+        运行中的任务在任务记录中保持运行状态，下次启动时自动继续；暂停的任务保持暂停。
+        """
+        deadline = time.monotonic() + self.advanced_settings["ShutdownTimeout"]
+        self.shutting_down = True
+        self.eta_timer.stop()
+        if self.control_server is not None:
+            self.control_server.shutdown()
+
+        threads = [thread for thread in self.active_threads if thread.isRunning()]
+        for thread in threads:
+            thread.shutdown()
+
+        closed, killed = get_memory_governor(self.advanced_settings).shutdown(
+            max(deadline - time.monotonic() - SHUTDOWN_GRACE, 0))
+        # 工作进程中的视频保存断点后返回，到时限仍未结束的连同其浏览器一起结束
+        abandoned = shutdown_process_shards(max(deadline - time.monotonic() - SHUTDOWN_GRACE, 0))
+        for thread in threads:
+            thread.wait(int(max(deadline - time.monotonic(), 0) * 1000))
+        unfinished = [thread for thread in threads if thread.isRunning()]
+
+        get_speed_estimator(self.advanced_settings).save()
+        get_event_log().flush(max(deadline - time.monotonic(), 0.5))
+        print(f"退出: 停止 {len(threads)} 个任务，关闭 {closed} 个浏览器，强制结束 {killed} 个浏览器")
+        if abandoned:
+            print(f"{abandoned} 个工作进程中的视频未在时限内保存断点，已强制结束")
+        if unfinished:
+            print(f"{len(unfinished)} 个任务未在时限内结束，未保存的进度下次启动时重新下载")
+            self.forced_exit = True
\ No newline at end of file
@@ -0,0 +1,216 @@
+import hashlib
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 分块哈希的块大小，与分段下载的对齐大小一致，每个分段只覆盖完整的块
+HASH_BLOCK_SIZE = 1024 * 1024
+# MP4 必须包含的顶层 box
+REQUIRED_BOXES = ("ftyp", "moov")
+
+
+class BlockHasher:
+    """边下载边计算的分块哈希
+
+    文件按 HASH_BLOCK_SIZE 切块，每块单独计算 SHA-256，最终摘要是所有块摘要按顺序拼接后的 SHA-256。
+    多个连接各自顺序写入不同的块，因此分段下载也能在传输过程中完成计算，无需下载后再读一遍文件。
+    """
+
+    def __init__(self, block_size: int = HASH_BLOCK_SIZE):
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.blocks: Dict[int, bytes] = {}
+
+    def stream(self, offset: int) -> "HashStream":
+        """从 offset（必须是块边界）开始顺序计算"""
+        if offset % self.block_size:
+            raise ValueError(f"哈希起始位置 {offset} 未按块对齐")
+        return HashStream(self, offset)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.blocks.clear()
+
+    def _add_block(self, index: int, digest: bytes) -> None:
+        with self.lock:
+            self.blocks[index] = digest
+
+    def hexdigest(self, total: int) -> str:
+        """文件总长为 total 时的最终摘要，有块缺失时抛出 ValueError"""
+        count = (total + self.block_size - 1) // self.block_size
+        with self.lock:
+            missing = [i for i in range(count) if i not in self.blocks]
+            if missing:
+                raise ValueError(f"缺少 {len(missing)} 个数据块的哈希")
+            digest = hashlib.sha256()
+            for i in range(count):
+                digest.update(self.blocks[i])
+        return digest.hexdigest()
+
+
+class HashStream:
+    """一个连接的顺序哈希计算，块写满后提交给 BlockHasher"""
+
+    def __init__(self, hasher: BlockHasher, offset: int):
+        self.hasher = hasher
+        self.index = offset // hasher.block_size
+        self.filled = 0
+        self.current = hashlib.sha256()
+
+    def update(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.hasher.block_size - self.filled)
+            self.current.update(view[:take])
+            self.filled += take
+            view = view[take:]
+            if self.filled == self.hasher.block_size:
+                self._commit()
+
+    def finish(self) -> None:
+        """提交文件末尾不足一块的数据"""
+        if self.filled:
+            self._commit()
+
+    def _commit(self) -> None:
+        self.hasher._add_block(self.index, self.current.digest())
+        self.index += 1
+        self.filled = 0
+        self.current = hashlib.sha256()
+
+
+def file_digest(path: str, block_size: int = HASH_BLOCK_SIZE) -> str:
+    """按 BlockHasher 相同的规则计算已有文件的摘要"""
+    hasher = BlockHasher(block_size)
+    stream = hasher.stream(0)
+    total = 0
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            stream.update(data)
+            total += len(data)
+    stream.finish()
+    return hasher.hexdigest(total)
+
+
+def check_mp4(path: str) -> Tuple[bool, str]:
+    """快速检查 MP4 结构：遍历顶层 box，要求包含 ftyp 和 moov，且各 box 长度之和正好等于文件大小
+
+    只读取每个 box 的头部，不读取媒体数据，可以识别下载中断留下的截断文件。
+    """
+    try:
+        size = os.path.getsize(path)
+        found = set()
+        position = 0
+        with open(path, 'rb') as f:
+            while position < size:
+                f.seek(position)
+                header = f.read(8)
+                if len(header) < 8:
+                    return False, f"位置 {position} 处 box 头部不完整"
+                box_size, box_type = struct.unpack(">I4s", header)
+                header_size = 8
+                if box_size == 1:
+                    large = f.read(8)
+                    if len(large) < 8:
+                        return False, f"位置 {position} 处 box 头部不完整"
+                    box_size = struct.unpack(">Q", large)[0]
+                    header_size = 16
+                elif box_size == 0:
+                    # 长度为 0 表示延伸到文件末尾
+                    box_size = size - position
+                if box_size < header_size:
+                    return False, f"位置 {position} 处 box 长度无效"
+                if position + box_size > size:
+                    return False, f"{box_type.decode('latin-1')} 超出文件末尾，文件可能被截断"
+                found.add(box_type.decode('latin-1'))
+                position += box_size
+    except OSError as e:
+        return False, f"读取文件失败: {str(e)}"
+
+    missing = [name for name in REQUIRED_BOXES if name not in found]
+    if missing:
+        return False, f"缺少 {', '.join(missing)}"
+    return True, ""
+
+
+def verify_files(paths: List[str], workers: int = 4,
+                 expected_sizes: Optional[Dict[str, int]] = None) -> Dict[str, str]:
+    """并行检查多个文件，返回 {损坏文件路径: 原因}"""
+    expected_sizes = expected_sizes or {}
+
+    def check(path: str) -> Tuple[str, bool, str]:
+        expected = expected_sizes.get(path)
+        if expected is not None:
+            try:
+                actual = os.path.getsize(path)
+            except OSError as e:
+                return path, False, str(e)
+            if actual != expected:
+                return path, False, f"文件大小 {actual} 与记录的 {expected} 不一致"
+        ok, reason = check_mp4(path)
+        return path, ok, reason
+
+    corrupt: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for path, ok, reason in executor.map(check, paths):
+            if not ok:
+                corrupt[path] = reason
+    return corrupt
+
+
+class IntegrityVerifier:
+    """后台检查下载目录中已有的视频，删除损坏的文件并把对应的视频重新加入任务的重试列表"""
+
+    def __init__(self, download_dir: str, task_logger, workers: int = 4,
+                 log: Optional[Callable[[str], None]] = None,
+                 on_requeue: Optional[Callable[[str], None]] = None):
+        self.download_dir = download_dir
+        self.task_logger = task_logger
+        self.workers = workers
+        self.log = log or print
+        self.on_requeue = on_requeue or (lambda task_id: None)
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.run, name="integrity-verifier", daemon=True)
+        thread.start()
+        return thread
+
+    def run(self) -> None:
+        try:
+            if not os.path.isdir(self.download_dir):
+                return
+            directory = os.path.abspath(self.download_dir)
+            paths = [os.path.join(directory, name) for name in os.listdir(directory)
+                     if name.lower().endswith(".mp4")]
+            if not paths:
+                return
+
+            records = self.task_logger.get_file_records(self.download_dir)
+            sizes = {path: record["size"] for path, record in records.items() if record.get("size")}
+            corrupt = verify_files(paths, self.workers, sizes)
+            self.log(f"完整性检查: 共 {len(paths)} 个文件，发现 {len(corrupt)} 个损坏")
+
+            requeued = set()
+            for path, reason in corrupt.items():
+                record = records.get(path)
+                if record is None:
+                    self.log(f"文件损坏（{reason}），但找不到对应的任务: {path}")
+                    continue
+                task_id = self.task_logger.requeue_video(record, f"文件损坏: {reason}")
+                if task_id:
+                    # 删除损坏的文件，否则重新下载时会被当作已存在而跳过
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    self.log(f"文件损坏（{reason}），已重新加入下载: {os.path.basename(path)}")
+                    requeued.add(task_id)
+            for task_id in requeued:
+                self.on_requeue(task_id)
+        except Exception as e:
+            self.log(f"完整性检查失败: {str(e)}")
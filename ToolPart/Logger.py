@@ -1,13 +1,20 @@
 import os
-import time
 import json
+import threading
+import uuid
 from typing import Optional, Dict, Any, List
 from PyQt5.QtCore import pyqtSignal, QObject
 from datetime import datetime
 
+from ToolPart.EventLog import get_event_log
+
+# 下载线程、枚举线程和完整性检查会同时更新任务记录：每次读取、修改、保存整个过程都持有该锁，避免互相覆盖
+_ledger_lock = threading.RLock()
+
 
 class LogEmitter(QObject):
     log_signal = pyqtSignal(str)  # type: ignore
+    requeue_signal = pyqtSignal(str)  # type: ignore  # 任务中有视频被重新加入下载
 
 
 class TaskLogger:
@@ -16,84 +23,101 @@ class TaskLogger:
     def __init__(self, logger_dir: str = "./logger"):
         self.logger_dir = logger_dir
         self.pending_tasks_file = os.path.join(logger_dir, "pending_tasks.json")
+        # 已下载文件的来源和校验信息，任务完成并删除后仍然保留
+        self.file_records_file = os.path.join(logger_dir, "file_records.json")
         os.makedirs(logger_dir, exist_ok=True)
 
     def log_task_start(self, task_id: str, url: str, download_dir: str,
-                       task_type: str = "playlist", retry_count: int = 0) -> None:
-        """记录任务开始"""
+                       task_type: str = "playlist", retry_count: int = 0,
+                       source_policy: Optional[Dict[str, Any]] = None) -> None:
+        """记录任务开始，source_policy 为该任务的下载源选择策略"""
         try:
-            tasks = self._load_tasks()
-            tasks[task_id] = {
-                "task_id": task_id,
-                "url": url,
-                "download_dir": download_dir,
-                "task_type": task_type,  # "playlist" or "video"
-                "status": "running",  # running, paused, completed, failed
-                "created_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat(),
-                "video_tasks": {},  # 存储每个视频任务的状态
-                "failed_videos": [],  # 存储失败视频的URL
-                "completed_videos": [],  # 存储成功下载的视频URL
-                "total_videos": 0,
-                "current_progress": 0,
-                "retry_count": retry_count,
-                "last_error": None,
-                "is_retry": False  # 标记是否为重试任务
-            }
-            self._save_tasks(tasks)
+            with _ledger_lock:
+                tasks = self._load_tasks()
+                tasks[task_id] = self._new_task(task_id, url, download_dir, task_type, retry_count)
+                if source_policy:
+                    tasks[task_id]["source_policy"] = source_policy
+                self._save_tasks(tasks)
         except Exception as e:
             print(f"记录任务开始失败: {str(e)}")
 
+    def log_tasks_start(self, new_tasks: List[Dict[str, str]], download_dir: str,
+                        source_policy: Optional[Dict[str, Any]] = None) -> None:
+        """批量记录任务开始，只读写一次任务文件；new_tasks 中每项包含 task_id、url 和 task_type"""
+        try:
+            with _ledger_lock:
+                tasks = self._load_tasks()
+                for new_task in new_tasks:
+                    task = self._new_task(new_task["task_id"], new_task["url"], download_dir,
+                                          new_task.get("task_type", "playlist"))
+                    if source_policy:
+                        task["source_policy"] = source_policy
+                    tasks[new_task["task_id"]] = task
+                self._save_tasks(tasks)
+        except Exception as e:
+            print(f"批量记录任务开始失败: {str(e)}")
+
     def log_video_task_start(self, task_id: str, video_url: str, video_id: str = None) -> None:
         """记录视频任务开始"""
         try:
             if video_id is None:
                 video_id = self._generate_video_id(video_url)
 
-            tasks = self._load_tasks()
-            if task_id in tasks:
-                tasks[task_id]["video_tasks"][video_id] = {
-                    "url": video_url,
-                    "status": "running",  # running, completed, failed
-                    "start_time": datetime.now().isoformat(),
-                    "end_time": None,
-                    "error": None,
-                    "retry_count": 0
-                }
-                tasks[task_id]["updated_at"] = datetime.now().isoformat()
-                self._save_tasks(tasks)
+            with _ledger_lock:
+                tasks = self._load_tasks()
+                if task_id in tasks:
+                    # 保留之前运行累计的重试次数
+                    previous = tasks[task_id]["video_tasks"].get(video_id, {})
+                    tasks[task_id]["video_tasks"][video_id] = {
+                        "url": video_url,
+                        "status": "running",  # running, interrupted, completed, failed
+                        "start_time": datetime.now().isoformat(),
+                        "end_time": None,
+                        "error": None,
+                        "retry_count": previous.get("retry_count", 0)
+                    }
+                    tasks[task_id]["updated_at"] = datetime.now().isoformat()
+                    self._save_tasks(tasks)
         except Exception as e:
             print(f"记录视频任务开始失败: {str(e)}")
 
-    def log_video_task_complete(self, task_id: str, video_url: str, video_id: str = None) -> None:
-        """记录视频任务完成"""
+    def log_video_task_complete(self, task_id: str, video_url: str, video_id: str = None,
+                                file_info: Optional[Dict[str, Any]] = None) -> None:
+        """记录视频任务完成，file_info 为文件名、大小、摘要等校验信息"""
         try:
             if video_id is None:
                 video_id = self._generate_video_id(video_url)
 
-            tasks = self._load_tasks()
-            if task_id in tasks:
-                # 更新视频任务状态
-                if video_id in tasks[task_id]["video_tasks"]:
-                    tasks[task_id]["video_tasks"][video_id]["status"] = "completed"
-                    tasks[task_id]["video_tasks"][video_id]["end_time"] = datetime.now().isoformat()
-
-                # 添加到完成列表
-                if video_url not in tasks[task_id]["completed_videos"]:
-                    tasks[task_id]["completed_videos"].append(video_url)
-
-                # 从失败列表中移除（如果存在）
-                if video_url in tasks[task_id]["failed_videos"]:
-                    tasks[task_id]["failed_videos"].remove(video_url)
+            with _ledger_lock:
+                tasks = self._load_tasks()
+                if task_id in tasks:
+                    # 更新视频任务状态
+                    if video_id in tasks[task_id]["video_tasks"]:
+                        tasks[task_id]["video_tasks"][video_id]["status"] = "completed"
+                        tasks[task_id]["video_tasks"][video_id]["end_time"] = datetime.now().isoformat()
+                        if file_info:
+                            tasks[task_id]["video_tasks"][video_id].update(file_info)
+                    if file_info and file_info.get("filename"):
+                        self._record_file(tasks[task_id], video_url, file_info)
+
+                    # 添加到完成列表
+                    if video_url not in tasks[task_id]["completed_videos"]:
+                        tasks[task_id]["completed_videos"].append(video_url)
+
+                    # 从失败列表和重试列表中移除（如果存在）
+                    if video_url in tasks[task_id]["failed_videos"]:
+                        tasks[task_id]["failed_videos"].remove(video_url)
+                    if video_url in tasks[task_id].get("retry_videos", []):
+                        tasks[task_id]["retry_videos"].remove(video_url)
+
+                    # 更新进度
+                    total = tasks[task_id]["total_videos"]
+                    completed = len(tasks[task_id]["completed_videos"])
+                    if total > 0:
+                        tasks[task_id]["current_progress"] = int((completed / total) * 100)
 
-                # 更新进度
-                total = tasks[task_id]["total_videos"]
-                completed = len(tasks[task_id]["completed_videos"])
-                if total > 0:
-                    tasks[task_id]["current_progress"] = int((completed / total) * 100)
-
-                tasks[task_id]["updated_at"] = datetime.now().isoformat()
-                self._save_tasks(tasks)
+                    tasks[task_id]["updated_at"] = datetime.now().isoformat()
+                    self._save_tasks(tasks)
         except Exception as e:
             print(f"记录视频任务完成失败: {str(e)}")
 
@@ -103,69 +127,92 @@ class TaskLogger:
             if video_id is None:
                 video_id = self._generate_video_id(video_url)
 
-            tasks = self._load_tasks()
-            if task_id in tasks:
-                # 更新视频任务状态
-                if video_id in tasks[task_id]["video_tasks"]:
-                    tasks[task_id]["video_tasks"][video_id]["status"] = "failed"
-                    tasks[task_id]["video_tasks"][video_id]["end_time"] = datetime.now().isoformat()
-                    tasks[task_id]["video_tasks"][video_id]["error"] = error
-                    tasks[task_id]["video_tasks"][video_id]["retry_count"] += 1
+            with _ledger_lock:
+                tasks = self._load_tasks()
+                if task_id in tasks:
+                    # 更新视频任务状态
+                    if video_id in tasks[task_id]["video_tasks"]:
+                        tasks[task_id]["video_tasks"][video_id]["status"] = "failed"
+                        tasks[task_id]["video_tasks"][video_id]["end_time"] = datetime.now().isoformat()
+                        tasks[task_id]["video_tasks"][video_id]["error"] = error
+                        tasks[task_id]["video_tasks"][video_id]["retry_count"] += 1
 
-                # 添加到失败列表
-                if video_url not in tasks[task_id]["failed_videos"]:
-                    tasks[task_id]["failed_videos"].append(video_url)
+                    # 添加到失败列表
+                    if video_url not in tasks[task_id]["failed_videos"]:
+                        tasks[task_id]["failed_videos"].append(video_url)
 
-                # 从完成列表中移除（如果存在）
-                if video_url in tasks[task_id]["completed_videos"]:
-                    tasks[task_id]["completed_videos"].remove(video_url)
+                    # 从完成列表中移除（如果存在）
+                    if video_url in tasks[task_id]["completed_videos"]:
+                        tasks[task_id]["completed_videos"].remove(video_url)
 
-                tasks[task_id]["updated_at"] = datetime.now().isoformat()
-                self._save_tasks(tasks)
+                    tasks[task_id]["updated_at"] = datetime.now().isoformat()
+                    self._save_tasks(tasks)
         except Exception as e:
             print(f"记录视频任务失败失败: {str(e)}")
 
+    def log_video_task_interrupted(self, task_id: str, video_url: str, partial: Optional[Dict[str, Any]] = None,
+                                   video_id: str = None) -> None:
+        """记录视频因暂停或退出而中断（不计入失败），partial 为已保存断点的文件名和已下载字节数"""
+        try:
+            if video_id is None:
+                video_id = self._generate_video_id(video_url)
+
+            with _ledger_lock:
+                tasks = self._load_tasks()
+                if task_id in tasks and video_id in tasks[task_id]["video_tasks"]:
+                    video_task = tasks[task_id]["video_tasks"][video_id]
+                    video_task["status"] = "interrupted"
+                    video_task["end_time"] = datetime.now().isoformat()
+                    video_task["partial"] = partial
+                    tasks[task_id]["updated_at"] = datetime.now().isoformat()
+                    self._save_tasks(tasks)
+        except Exception as e:
+            print(f"记录视频任务中断失败: {str(e)}")
+
     def update_task_total_videos(self, task_id: str, total_videos: int) -> None:
         """更新任务总视频数"""
         try:
-            tasks = self._load_tasks()
-            if task_id in tasks:
-                tasks[task_id]["total_videos"] = total_videos
-                tasks[task_id]["updated_at"] = datetime.now().isoformat()
-                self._save_tasks(tasks)
+            with _ledger_lock:
+                tasks = self._load_tasks()
+                if task_id in tasks:
+                    tasks[task_id]["total_videos"] = total_videos
+                    tasks[task_id]["updated_at"] = datetime.now().isoformat()
+                    self._save_tasks(tasks)
         except Exception as e:
             print(f"更新任务总视频数失败: {str(e)}")
 
     def update_task_status(self, task_id: str, status: str) -> None:
         """更新任务状态"""
         try:
-            tasks = self._load_tasks()
-            if task_id in tasks:
-                old_status = tasks[task_id]["status"]
-                tasks[task_id]["status"] = status
-                tasks[task_id]["updated_at"] = datetime.now().isoformat()
+            with _ledger_lock:
+                tasks = self._load_tasks()
+                if task_id in tasks:
+                    old_status = tasks[task_id]["status"]
+                    tasks[task_id]["status"] = status
+                    tasks[task_id]["updated_at"] = datetime.now().isoformat()
 
-                # 如果任务完成且没有失败视频，则删除任务记录
-                if status == "completed" and not tasks[task_id]["failed_videos"]:
-                    self._remove_task_completely(tasks, task_id)
-                else:
-                    self._save_tasks(tasks)
+                    # 如果任务完成且没有失败视频，则删除任务记录
+                    if status == "completed" and not tasks[task_id]["failed_videos"]:
+                        self._remove_task_completely(tasks, task_id)
+                    else:
+                        self._save_tasks(tasks)
 
-                # 如果是任务从失败状态变为运行中，清空失败状态（准备重试）
-                if old_status == "failed" and status == "running":
-                    self._clear_failed_state(tasks, task_id)
+                    # 如果是任务从失败状态变为运行中，清空失败状态（准备重试）
+                    if old_status == "failed" and status == "running":
+                        self._clear_failed_state(tasks, task_id)
         except Exception as e:
             print(f"更新任务状态失败: {str(e)}")
 
     def mark_task_failed(self, task_id: str, error: str = "") -> None:
         """标记任务失败"""
         try:
-            tasks = self._load_tasks()
-            if task_id in tasks:
-                tasks[task_id]["status"] = "failed"
-                tasks[task_id]["last_error"] = error
-                tasks[task_id]["updated_at"] = datetime.now().isoformat()
-                self._save_tasks(tasks)
+            with _ledger_lock:
+                tasks = self._load_tasks()
+                if task_id in tasks:
+                    tasks[task_id]["status"] = "failed"
+                    tasks[task_id]["last_error"] = error
+                    tasks[task_id]["updated_at"] = datetime.now().isoformat()
+                    self._save_tasks(tasks)
         except Exception as e:
             print(f"标记任务失败失败: {str(e)}")
 
@@ -226,44 +273,171 @@ class TaskLogger:
         except Exception:
             return None
 
+    def get_retry_videos(self, task_id: str) -> List[str]:
+        """获取任务中需要重试的视频URL"""
+        task_info = self.get_task_info(task_id)
+        if not task_info:
+            return []
+        return list(task_info.get("retry_videos", []))
+
+    def get_completed_videos(self, task_id: str) -> List[str]:
+        """获取任务中已完成的视频URL"""
+        task_info = self.get_task_info(task_id)
+        if not task_info:
+            return []
+        return list(task_info.get("completed_videos", []))
+
+    def get_interrupted_videos(self, task_id: str) -> List[str]:
+        """获取任务中上次运行时被中断的视频URL"""
+        task_info = self.get_task_info(task_id)
+        if not task_info:
+            return []
+        completed = set(task_info.get("completed_videos", []))
+        return [video_task["url"] for video_task in task_info.get("video_tasks", {}).values()
+                if video_task.get("status") == "interrupted" and video_task["url"] not in completed]
+
+    def get_file_records(self, download_dir: str) -> Dict[str, Dict[str, Any]]:
+        """获取下载到 download_dir 的文件记录，键为文件完整路径"""
+        target_dir = os.path.abspath(download_dir)
+        return {path: record for path, record in self._load_json(self.file_records_file).items()
+                if os.path.dirname(path) == target_dir}
+
+    def requeue_video(self, record: Dict[str, Any], error: str = "") -> str:
+        """已下载的视频文件损坏时重新加入下载，返回所属任务ID
+
+        原任务仍在记录中时加入其重试列表；原任务已完成并删除时新建一个只重试该视频的任务。
+        """
+        try:
+            video_url = record["url"]
+            video_id = self._generate_video_id(video_url)
+            with _ledger_lock:
+                tasks = self._load_tasks()
+                # 原任务已删除时沿用原任务ID重建，同一任务的多个损坏视频归入同一个重试任务
+                task_id = record.get("task_id") or str(uuid.uuid4())
+                if task_id not in tasks:
+                    tasks[task_id] = self._new_task(task_id, record["list_url"], record["download_dir"])
+                    tasks[task_id]["status"] = "failed"
+
+                task = tasks[task_id]
+                if video_id in task["video_tasks"]:
+                    task["video_tasks"][video_id]["status"] = "failed"
+                    task["video_tasks"][video_id]["error"] = error
+                if video_url in task["completed_videos"]:
+                    task["completed_videos"].remove(video_url)
+                retry_videos = task.setdefault("retry_videos", [])
+                if video_url not in retry_videos:
+                    retry_videos.append(video_url)
+                task["is_retry"] = True
+                if task["status"] == "completed":
+                    task["status"] = "failed"
+                task["last_error"] = error
+                task["updated_at"] = datetime.now().isoformat()
+                self._save_tasks(tasks)
+                return task_id
+        except Exception as e:
+            print(f"重新加入视频失败: {str(e)}")
+            return ""
+
     def remove_task(self, task_id: str) -> None:
         """移除任务记录"""
         try:
-            tasks = self._load_tasks()
-            if task_id in tasks:
-                # 如果任务完成且没有失败视频，则完全删除
-                if tasks[task_id]["status"] == "completed" and not tasks[task_id]["failed_videos"]:
-                    self._remove_task_completely(tasks, task_id)
-                else:
-                    # 否则标记为失败
-                    tasks[task_id]["status"] = "failed"
-                    tasks[task_id]["updated_at"] = datetime.now().isoformat()
-                    self._save_tasks(tasks)
+            with _ledger_lock:
+                tasks = self._load_tasks()
+                if task_id in tasks:
+                    # 如果任务完成且没有失败视频，则完全删除
+                    if tasks[task_id]["status"] == "completed" and not tasks[task_id]["failed_videos"]:
+                        self._remove_task_completely(tasks, task_id)
+                    else:
+                        # 否则标记为失败
+                        tasks[task_id]["status"] = "failed"
+                        tasks[task_id]["updated_at"] = datetime.now().isoformat()
+                        self._save_tasks(tasks)
         except Exception as e:
             print(f"移除任务失败: {str(e)}")
 
     def reset_task_for_retry(self, task_id: str) -> Dict[str, Any]:
-        """重置任务状态用于重试"""
+        """重置任务状态用于重试
+
+        保留已完成视频和每个视频的状态，只把失败视频转入重试列表，
+        重试时仅重新下载这些视频而不必重新加载播放列表。
+        """
         try:
-            tasks = self._load_tasks()
-            if task_id in tasks:
-                # 清空失败状态，准备重试
-                tasks[task_id]["failed_videos"] = []
-                tasks[task_id]["completed_videos"] = []
-                tasks[task_id]["video_tasks"] = {}
-                tasks[task_id]["current_progress"] = 0
-                tasks[task_id]["retry_count"] = tasks[task_id].get("retry_count", 0) + 1
-                tasks[task_id]["is_retry"] = True
-                tasks[task_id]["status"] = "paused"  # 设置为暂停状态，等待用户继续
-                tasks[task_id]["updated_at"] = datetime.now().isoformat()
+            with _ledger_lock:
+                tasks = self._load_tasks()
+                if task_id in tasks:
+                    # 失败视频转入重试列表，准备重试
+                    self._move_failed_to_retry(tasks[task_id])
+                    tasks[task_id]["retry_count"] = tasks[task_id].get("retry_count", 0) + 1
+                    tasks[task_id]["is_retry"] = True
+                    tasks[task_id]["status"] = "paused"  # 设置为暂停状态，等待用户继续
+                    tasks[task_id]["updated_at"] = datetime.now().isoformat()
 
-                self._save_tasks(tasks)
-                return tasks[task_id]
-            return {}
+                    self._save_tasks(tasks)
+                    return tasks[task_id]
+                return {}
         except Exception as e:
             print(f"重置任务状态失败: {str(e)}")
             return {}
 
+    def _new_task(self, task_id: str, url: str, download_dir: str,
+                  task_type: str = "playlist", retry_count: int = 0) -> Dict[str, Any]:
+        """新任务的初始记录"""
+        return {
+            "task_id": task_id,
+            "url": url,
+            "download_dir": download_dir,
+            "task_type": task_type,  # "playlist" or "video"
+            "status": "running",  # running, paused, completed, failed
+            "created_at": datetime.now().isoformat(),
+            "updated_at": datetime.now().isoformat(),
+            "video_tasks": {},  # 存储每个视频任务的状态
+            "failed_videos": [],  # 存储失败视频的URL
+            "completed_videos": [],  # 存储成功下载的视频URL
+            "retry_videos": [],  # 重试时需要重新下载的视频URL
+            "total_videos": 0,
+            "current_progress": 0,
+            "retry_count": retry_count,
+            "last_error": None,
+            "is_retry": False  # 标记是否为重试任务
+        }
+
+    def _record_file(self, task: Dict[str, Any], video_url: str, file_info: Dict[str, Any]) -> None:
+        """记录下载文件的来源和校验信息"""
+        download_dir = os.path.abspath(task.get("download_dir", ""))
+        records = self._load_json(self.file_records_file)
+        records[os.path.join(download_dir, file_info["filename"])] = {
+            "url": video_url,
+            "task_id": task["task_id"],
+            "list_url": task["url"],
+            "download_dir": download_dir,
+            "recorded_at": datetime.now().isoformat(),
+            **file_info
+        }
+        self._save_json(self.file_records_file, records)
+
+    def _load_json(self, path: str) -> Dict[str, Any]:
+        try:
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    content = f.read().strip()
+                    if content:
+                        return json.loads(content)
+            return {}
+        except Exception as e:
+            print(f"加载文件 {path} 失败: {str(e)}")
+            return {}
+
+    def _save_json(self, path: str, data: Dict[str, Any]) -> None:
+        # 先写临时文件再替换，退出或崩溃时不会留下写了一半的文件
+        try:
+            temp_path = path + ".tmp"
+            with _ledger_lock:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(temp_path, path)
+        except Exception as e:
+            print(f"保存文件 {path} 失败: {str(e)}")
+
     def _load_tasks(self) -> Dict[str, Any]:
         """加载任务文件"""
         try:
@@ -280,8 +454,11 @@ class TaskLogger:
     def _save_tasks(self, tasks: Dict[str, Any]) -> None:
         """保存任务文件"""
         try:
-            with open(self.pending_tasks_file, "w", encoding="utf-8") as f:
-                json.dump(tasks, f, ensure_ascii=False, indent=2)
+            temp_path = self.pending_tasks_file + ".tmp"
+            with _ledger_lock:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(tasks, f, ensure_ascii=False, indent=2)
+                os.replace(temp_path, self.pending_tasks_file)
         except Exception as e:
             print(f"保存任务文件失败: {str(e)}")
 
@@ -298,7 +475,7 @@ class TaskLogger:
         """清空失败状态"""
         try:
             if task_id in tasks:
-                tasks[task_id]["failed_videos"] = []
+                self._move_failed_to_retry(tasks[task_id])
                 tasks[task_id]["last_error"] = None
                 tasks[task_id]["is_retry"] = True
                 tasks[task_id]["updated_at"] = datetime.now().isoformat()
@@ -306,27 +483,28 @@ class TaskLogger:
         except Exception as e:
             print(f"清空失败状态失败: {str(e)}")
 
+    def _move_failed_to_retry(self, task: Dict[str, Any]) -> None:
+        """把失败视频合并到重试列表并清空失败列表"""
+        retry_videos = task.setdefault("retry_videos", [])
+        for video_url in task.get("failed_videos", []):
+            if video_url not in retry_videos:
+                retry_videos.append(video_url)
+        task["failed_videos"] = []
+
     def _generate_video_id(self, video_url: str) -> str:
         """生成视频ID"""
         import hashlib
         return hashlib.md5(video_url.encode()).hexdigest()[:8]
 
 
-def log_failure(logger_dir: str, filename: str, url: str, error: str = "") -> Optional[str]:
-    """记录下载失败到日志文件"""
+def log_failure(logger_dir: str, filename: str, url: str, error: str = "", **fields: Any) -> Optional[str]:
+    """记录下载失败，写入结构化事件日志（logger_dir/events 下的 JSONL 文件）
+
+    写入由后台线程完成，不阻塞下载线程；fields 可以附带失败类型、任务 ID、尝试次数等字段。
+    """
     try:
-        # 创建日志文件路径（按日期）
-        log_file = os.path.join(logger_dir, f"{time.strftime('%Y-%m-%d')}.log")
-        # 日志内容
-        log_content = (
-            f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] "
-            f"下载失败: 文件名: {filename}, "
-            f"URL: {url}, "
-            f"错误: {error}\n"
-        )
-        # 写入日志文件（追加模式）
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(log_content)
+        get_event_log(os.path.join(logger_dir, "events")).record(
+            "video_failed", filename=filename, url=url, error=error, **fields)
     except Exception as e:
         return f"记录失败日志时出错: {str(e)}"
-    return None
\ No newline at end of file
+    return None
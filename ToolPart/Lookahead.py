@@ -0,0 +1,162 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlparse
+
+# 直链中表示过期时间（Unix 时间戳）的查询参数
+EXPIRY_PARAMS = ("expires", "expire", "expiry", "exp", "e", "deadline", "validto")
+# 把数值当作时间戳的合理范围，避免把普通参数误认为过期时间
+MIN_TIMESTAMP = 1_000_000_000
+MAX_TIMESTAMP = 10_000_000_000
+# 观察到的过期时间打折扣，提前重新解析
+TTL_SAFETY = 0.8
+
+
+def url_expiry(url: str) -> Optional[float]:
+    """从直链的查询参数推断过期时间（Unix 时间），无法判断时返回 None
+
+    支持 expires=时间戳 一类的参数和 S3 风格的 X-Amz-Date + X-Amz-Expires。
+    """
+    params = {key.lower(): value for key, value in parse_qsl(urlparse(url).query)}
+    if "x-amz-date" in params and "x-amz-expires" in params:
+        try:
+            signed = datetime.strptime(params["x-amz-date"], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+            return signed.timestamp() + int(params["x-amz-expires"])
+        except ValueError:
+            pass
+    for key in EXPIRY_PARAMS:
+        value = params.get(key, "")
+        if value.isdigit() and MIN_TIMESTAMP <= int(value) < MAX_TIMESTAMP:
+            return float(value)
+    return None
+
+
+class Resolution:
+    """解析出的下载源，以及最早过期的直链的过期时间"""
+
+    def __init__(self, video_url: str, candidates: List[Dict[str, Any]], expires_at: Optional[float]):
+        self.video_url = video_url
+        self.candidates = candidates
+        self.resolved_at = time.time()
+        self.expires_at = expires_at
+        self.prefetched = False  # 是否由预解析得到
+
+    def valid_for(self, seconds: float) -> bool:
+        """在 seconds 秒后是否仍未过期"""
+        return self.expires_at is None or self.expires_at > time.time() + seconds
+
+
+class ResolutionCache:
+    """预解析结果，按视频链接保存到被下载取走为止
+
+    直链没有过期参数时，用该主机上观察到的 403 推算有效期（解析后多久开始出现 403）。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Resolution] = {}
+        self.host_ttl: Dict[str, float] = {}  # 主机 -> 观察到的直链有效期（秒）
+
+    def estimate_expiry(self, candidates: List[Dict[str, Any]]) -> Optional[float]:
+        """所有下载源中最早的过期时间"""
+        now = time.time()
+        expiries = []
+        with self.lock:
+            for source in candidates:
+                expiry = url_expiry(source["url"])
+                if expiry is None:
+                    ttl = self.host_ttl.get(urlparse(source["url"]).netloc)
+                    expiry = now + ttl if ttl else None
+                if expiry is not None:
+                    expiries.append(expiry)
+        return min(expiries) if expiries else None
+
+    def put(self, resolution: Resolution) -> None:
+        with self.lock:
+            self.entries[resolution.video_url] = resolution
+
+    def take(self, video_url: str) -> Optional[Resolution]:
+        """取出预解析结果，没有时返回 None；是否仍然有效由调用方按传输所需时间判断"""
+        with self.lock:
+            return self.entries.pop(video_url, None)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.entries)
+
+    def contains(self, video_url: str) -> bool:
+        with self.lock:
+            return video_url in self.entries
+
+    def mark_expired(self, resolution: Resolution, host: str) -> None:
+        """预解析的直链返回 403，按解析到现在的时间记录该主机直链的有效期"""
+        age = time.time() - resolution.resolved_at
+        with self.lock:
+            ttl = self.host_ttl.get(host)
+            self.host_ttl[host] = min(ttl, age * TTL_SAFETY) if ttl else age * TTL_SAFETY
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+class Lookahead:
+    """在传输之前预先解析等待中的视频，传输槽位空出时可以直接开始下载
+
+    resolve 为解析函数，返回 Resolution 或 None（失败时由下载时重新解析）；
+    同时最多预解析 workers 个视频，解析结果和正在解析的视频合计不超过 depth 个。
+    """
+
+    def __init__(self, resolve: Callable[[str], Optional[Resolution]], cache: ResolutionCache,
+                 depth: int, workers: int = 1):
+        self.resolve = resolve
+        self.cache = cache
+        self.depth = depth
+        self.lock = threading.Lock()
+        self.pending: Dict[str, Future] = {}
+        self.executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="lookahead")
+
+    def prefetch(self, video_urls: Iterable[str]) -> None:
+        """为排在最前面的视频安排预解析，video_urls 按提交顺序排列"""
+        with self.lock:
+            self.pending = {url: future for url, future in self.pending.items() if not future.done()}
+            for url in video_urls:
+                if len(self.pending) + len(self.cache) >= self.depth:
+                    break
+                if url in self.pending or self.cache.contains(url):
+                    continue
+                self.pending[url] = self.executor.submit(self._resolve, url)
+
+    def wait_for(self, video_url: str, timeout: Optional[float] = None) -> None:
+        """视频正在预解析时等待完成，避免同一视频同时被解析两次"""
+        with self.lock:
+            future = self.pending.get(video_url)
+        if future is not None:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+
+    def discard(self, video_url: str) -> None:
+        """视频不再需要下载时丢弃其预解析结果，正在预解析的在解析完成后丢弃"""
+        with self.lock:
+            future = self.pending.pop(video_url, None)
+        if future is not None:
+            future.add_done_callback(lambda _: self.cache.take(video_url))
+        self.cache.take(video_url)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.cache.clear()
+
+    def _resolve(self, video_url: str) -> None:
+        try:
+            resolution = self.resolve(video_url)
+        except Exception as e:
+            print(f"预解析 {video_url} 出错: {str(e)}")
+            return
+        if resolution is not None:
+            resolution.prefetched = True
+            self.cache.put(resolution)
@@ -0,0 +1,253 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from ToolPart.Metrics import metrics
+from ToolPart.Watchdog import list_descendants, psutil
+
+# 空闲浏览器超过该时间（秒）未被复用则关闭
+IDLE_TIMEOUT = 60
+# 估算新浏览器启动后占用的内存，用于判断预算是否允许再启动一个
+BROWSER_STARTUP_BYTES = 300 * 1024 * 1024
+# 等待内存时检查的间隔（秒）
+MEMORY_POLL_INTERVAL = 5
+
+try:
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+
+def process_rss(pid: int) -> int:
+    """单个进程的常驻内存（字节），无法获取时返回 0"""
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return 0
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def process_tree_rss(pid: Optional[int]) -> int:
+    """进程及其所有子进程（浏览器的渲染、GPU 等进程）的常驻内存之和"""
+    if not pid:
+        return 0
+    return sum(process_rss(p) for p in [pid] + list_descendants(pid))
+
+
+def available_memory() -> Optional[int]:
+    """系统当前可用内存（字节），平台不支持时返回 None"""
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+class IdleBrowser:
+    def __init__(self, browser: Any, slot: Optional[str], closer: Callable[[Any, Optional[str]], None]):
+        self.browser = browser
+        self.slot = slot
+        self.closer = closer
+        self.since = time.monotonic()
+
+
+class MemoryGovernor:
+    """按浏览器进程树的常驻内存管理浏览器
+
+    - 单个浏览器超过 browser_budget 时在页面之间回收（关闭后重新启动）；
+    - 所有浏览器合计超过 total_budget，或系统可用内存低于 min_available 时，暂停启动新的浏览器；
+    - 解析完成的浏览器放入空闲列表供下一个视频复用，内存紧张或空闲过久时关闭。
+    """
+
+    def __init__(self, browser_budget: int, total_budget: int = 0, min_available: int = 0, max_idle: int = 2):
+        self.browser_budget = browser_budget
+        self.total_budget = total_budget
+        self.min_available = min_available
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.active: Dict[int, Any] = {}  # id(浏览器) -> 正在使用的浏览器
+        self.idle: Dict[Hashable, List[IdleBrowser]] = {}
+        self.closing = False  # 程序正在退出，归还的浏览器不再保留
+        threading.Thread(target=self._reap_loop, name="memory-governor", daemon=True).start()
+
+    def browser_rss(self, browser: Any) -> int:
+        return process_tree_rss(self._pid(browser))
+
+    def total_rss(self) -> int:
+        """所有在用和空闲浏览器的内存之和"""
+        with self.lock:
+            pids = [self._pid(browser) for browser in self.active.values()] + \
+                   [self._pid(entry.browser) for entries in self.idle.values() for entry in entries]
+        return sum(process_tree_rss(pid) for pid in pids)
+
+    def register(self, browser: Any) -> None:
+        with self.lock:
+            self.active[id(browser)] = browser
+
+    def unregister(self, browser: Any) -> None:
+        with self.lock:
+            self.active.pop(id(browser), None)
+
+    def over_budget(self, browser: Any) -> Tuple[bool, int]:
+        """浏览器是否超过单个浏览器的内存预算，返回（是否超出，当前内存）"""
+        if self.browser_budget <= 0:
+            return False, 0
+        rss = self.browser_rss(browser)
+        return rss > self.browser_budget, rss
+
+    def take_idle(self, key: Hashable) -> Optional[Tuple[Any, Optional[str]]]:
+        """取出一个配置相同的空闲浏览器，没有时返回 None
+
+        空闲期间已被看门狗回收的浏览器不再复用，交给关闭函数清理进程并归还用户目录槽位。
+        """
+        dead: List[IdleBrowser] = []
+        found = None
+        with self.lock:
+            entries = self.idle.get(key)
+            while entries:
+                entry = entries.pop()
+                if entry.browser.guard.dead:
+                    dead.append(entry)
+                    continue
+                self.active[id(entry.browser)] = entry.browser
+                found = entry.browser, entry.slot
+                break
+        for entry in dead:
+            self._close_entry(entry)
+        return found
+
+    def put_idle(self, key: Hashable, browser: Any, slot: Optional[str],
+                 closer: Callable[[Any, Optional[str]], None], log: Callable[[str], None]) -> bool:
+        """页面之间归还浏览器：未超出预算时放入空闲列表返回 True，否则返回 False 由调用方关闭"""
+        self.unregister(browser)
+        if self.max_idle <= 0 or self.closing or browser.guard.dead:
+            return False
+        over, rss = self.over_budget(browser)
+        if over:
+            log(f"浏览器内存 {rss / 1024 / 1024:.0f} MB 超过预算，关闭后重新启动")
+            metrics.record_event("browser_recycle", rss=rss)
+            return False
+        with self.lock:
+            entries = self.idle.setdefault(key, [])
+            if sum(len(e) for e in self.idle.values()) >= self.max_idle:
+                return False
+            entries.append(IdleBrowser(browser, slot, closer))
+        return True
+
+    def memory_ok(self) -> bool:
+        """是否还有余量启动一个新的浏览器"""
+        available = available_memory()
+        if self.min_available > 0 and available is not None and available < self.min_available:
+            return False
+        if self.total_budget > 0 and self.total_rss() + BROWSER_STARTUP_BYTES > self.total_budget:
+            return False
+        return True
+
+    def wait_for_memory(self, checkpoint: Callable[[], bool], wait: Callable[[float], Any],
+                        log: Callable[[str], None]) -> bool:
+        """内存不足时先关闭空闲浏览器，仍不足则等待其他浏览器关闭，返回任务是否仍在运行
+
+        没有在用的浏览器时直接返回，避免在内存本身就不足的机器上永久等待。
+        """
+        logged = False
+        while checkpoint():
+            if self.memory_ok():
+                return True
+            if self.close_idle(1):
+                continue
+            with self.lock:
+                if not self.active:
+                    return True
+            if not logged:
+                log("内存接近上限，等待其他浏览器关闭后再启动新的浏览器")
+                logged = True
+            wait(MEMORY_POLL_INTERVAL)
+        return False
+
+    def close_idle(self, limit: int = 0, older_than: float = 0) -> int:
+        """关闭空闲浏览器（最久未使用的优先），limit 为 0 表示全部，返回关闭的数量"""
+        now = time.monotonic()
+        with self.lock:
+            entries = sorted((entry for group in self.idle.values() for entry in group), key=lambda e: e.since)
+            entries = [entry for entry in entries if now - entry.since >= older_than]
+            if limit:
+                entries = entries[:limit]
+            for group in self.idle.values():
+                group[:] = [entry for entry in group if entry not in entries]
+        for entry in entries:
+            self._close_entry(entry)
+        return len(entries)
+
+    def shutdown(self, timeout: float) -> Tuple[int, int]:
+        """程序退出时关闭所有浏览器，返回（关闭的数量，强制结束的数量）
+
+        空闲浏览器并行关闭；正在使用的浏览器由任务线程停止时自行关闭。
+        到 timeout 仍未关闭的（包括关闭卡住的）直接结束进程树，卡在浏览器操作中的任务线程随之返回。
+        """
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            self.closing = True
+            entries = [entry for group in self.idle.values() for entry in group]
+            self.idle.clear()
+            in_use = len(self.active)
+        closers = [threading.Thread(target=self._close_entry, args=(entry,), daemon=True) for entry in entries]
+        for closer in closers:
+            closer.start()
+        for closer in closers:
+            closer.join(max(deadline - time.monotonic(), 0))
+        while time.monotonic() < deadline:
+            with self.lock:
+                if not self.active:
+                    break
+            time.sleep(0.1)
+
+        with self.lock:
+            leftovers = list(self.active.values())
+        leftovers += [entry.browser for entry, closer in zip(entries, closers) if closer.is_alive()]
+        for browser in leftovers:
+            browser.guard.terminate()
+        return len(entries) + in_use - len(leftovers), len(leftovers)
+
+    @staticmethod
+    def _close_entry(entry: IdleBrowser) -> None:
+        try:
+            entry.closer(entry.browser, entry.slot)
+        except Exception as e:
+            print(f"关闭空闲浏览器失败: {str(e)}")
+
+    def _reap_loop(self) -> None:
+        while True:
+            time.sleep(IDLE_TIMEOUT / 4)
+            self.close_idle(older_than=IDLE_TIMEOUT)
+
+    @staticmethod
+    def _pid(browser: Any) -> Optional[int]:
+        guard = getattr(browser, "guard", None)
+        return getattr(guard, "pid", None)
+
+
+_governor: Optional[MemoryGovernor] = None
+_governor_lock = threading.Lock()
+
+
+def get_memory_governor(settings: Dict[str, Any]) -> MemoryGovernor:
+    """获取进程内共享的内存管理器，所有任务的浏览器共用同一份预算"""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = MemoryGovernor(settings["BrowserMemoryMB"] * 1024 * 1024,
+                                       settings["MemoryBudgetMB"] * 1024 * 1024,
+                                       settings["MinFreeMemoryMB"] * 1024 * 1024,
+                                       settings["IdleBrowsers"])
+        return _governor
@@ -0,0 +1,43 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List
+
+
+class Metrics:
+    """进程内的运行指标：计数器和最近发生的事件"""
+
+    def __init__(self, max_events: int = 200):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, float] = {}
+        self.events: deque = deque(maxlen=max_events)
+        self.listeners: List[Callable[..., None]] = []  # 事件发生时额外通知，例如写入事件日志
+
+    def increment(self, name: str, value: float = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_event(self, name: str, **fields: Any) -> None:
+        """记录一次事件，同时累加同名计数器"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+            self.events.append({"time": time.time(), "name": name, **fields})
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(name, **fields)
+
+    def add_listener(self, listener: Callable[..., None]) -> None:
+        with self.lock:
+            self.listeners.append(listener)
+
+    def recent_events(self, name: str = "") -> List[Dict[str, Any]]:
+        with self.lock:
+            return [event for event in self.events if not name or event["name"] == name]
+
+    def snapshot(self) -> Dict[str, float]:
+        with self.lock:
+            return dict(self.counters)
+
+
+# 全局指标实例
+metrics = Metrics()
@@ -0,0 +1,156 @@
+import os
+import shutil
+import sys
+import threading
+from typing import Dict, List, Optional
+
+# 超出容量时优先清理的缓存子目录，保留 Cookie 等会话数据
+CACHE_SUBDIRS = [
+    os.path.join("Default", "Cache"),
+    os.path.join("Default", "Code Cache"),
+    os.path.join("Default", "GPUCache"),
+    os.path.join("Default", "Service Worker", "CacheStorage"),
+    "GrShaderCache",
+    "ShaderCache",
+]
+LOCK_FILE = "slot.lock"
+
+
+def dir_size(path: str) -> int:
+    """统计目录占用的字节数"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _pid_alive(pid: int) -> bool:
+    """判断进程是否仍然存在"""
+    if pid <= 0:
+        return False
+    if sys.platform == "win32":
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ProfilePool:
+    """持久化浏览器用户目录池，每个槽位同一时间只给一个浏览器使用
+
+    槽位目录在应用重启后继续复用，使页面的 HTTP 缓存保持温热；
+    槽位归还时检查大小，超出上限先清理缓存，仍超出则整体轮换。
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.in_use: List[str] = []
+        os.makedirs(self.root, exist_ok=True)
+
+    def cache_size_limit(self) -> int:
+        """传给 Chrome 的磁盘缓存上限，留出其余配置文件的空间"""
+        return max(int(self.max_bytes * 0.8), 16 * 1024 * 1024)
+
+    def acquire(self) -> str:
+        """租用一个空闲槽位，没有空闲槽位时新建一个"""
+        with self.lock:
+            index = 0
+            while True:
+                slot = os.path.join(self.root, f"slot_{index}")
+                if slot not in self.in_use and self._try_lock(slot):
+                    self.in_use.append(slot)
+                    return slot
+                index += 1
+
+    def release(self, slot: str) -> None:
+        """归还槽位，必要时清理或轮换"""
+        try:
+            self._enforce_limit(slot)
+        finally:
+            with self.lock:
+                self._unlock(slot)
+                if slot in self.in_use:
+                    self.in_use.remove(slot)
+
+    def _try_lock(self, slot: str) -> bool:
+        """用锁文件占用槽位，防止其他进程中的浏览器同时使用"""
+        os.makedirs(slot, exist_ok=True)
+        lock_path = os.path.join(slot, LOCK_FILE)
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(lock_path, "r", encoding="utf-8") as f:
+                    owner = int(f.read().strip() or 0)
+            except (OSError, ValueError):
+                owner = 0
+            if _pid_alive(owner):
+                return False
+            # 锁文件属于已退出的进程，回收后重试
+            try:
+                os.remove(lock_path)
+            except OSError:
+                return False
+            return self._try_lock(slot)
+
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(str(os.getpid()))
+        return True
+
+    def _unlock(self, slot: str) -> None:
+        try:
+            os.remove(os.path.join(slot, LOCK_FILE))
+        except OSError:
+            pass
+
+    def _enforce_limit(self, slot: str) -> None:
+        if self.max_bytes <= 0 or dir_size(slot) <= self.max_bytes:
+            return
+
+        for sub in CACHE_SUBDIRS:
+            shutil.rmtree(os.path.join(slot, sub), ignore_errors=True)
+
+        if dir_size(slot) > self.max_bytes:
+            # 缓存之外的数据也超出上限，整个槽位重新开始
+            for name in os.listdir(slot):
+                if name == LOCK_FILE:
+                    continue
+                path = os.path.join(slot, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+
+_pools: Dict[str, ProfilePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_profile_pool(root: str, max_bytes: int) -> ProfilePool:
+    """获取进程内共享的用户目录池，所有下载任务共用同一组槽位"""
+    key = os.path.abspath(root)
+    with _pools_lock:
+        pool: Optional[ProfilePool] = _pools.get(key)
+        if pool is None:
+            pool = ProfilePool(root, max_bytes)
+            _pools[key] = pool
+        pool.max_bytes = max_bytes
+        return pool
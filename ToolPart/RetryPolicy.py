@@ -0,0 +1,179 @@
+import errno
+import random
+import socket
+import threading
+import time
+from typing import Optional, Dict
+
+import requests
+
+
+class ErrorClass:
+    """失败类型，决定是否重试以及退避方式"""
+    DNS = "dns"  # 域名解析失败
+    CONNECT = "connect"  # 连接失败或连接中断
+    TIMEOUT = "timeout"  # 连接或读取超时
+    HTTP_4XX = "http_4xx"  # 客户端错误，重试无意义
+    FORBIDDEN = "forbidden"  # 403，直链可能已过期，重新解析后可再试
+    RATE_LIMITED = "rate_limited"  # 429，需要更长的退避
+    HTTP_5XX = "http_5xx"  # 服务端错误
+    MISSING_ELEMENT = "missing_element"  # 页面中缺少预期元素
+    CHALLENGE = "challenge"  # Cloudflare 验证未通过
+    BROWSER = "browser"  # 浏览器异常
+    DISK_FULL = "disk_full"  # 磁盘空间不足
+    CORRUPT = "corrupt"  # 文件大小不符或结构损坏
+    STOPPED = "stopped"  # 任务被停止
+    PAUSED = "paused"  # 任务被暂停，已保存进度，继续后重新排队
+    UNKNOWN = "unknown"
+
+
+# 反映主机整体不可用的失败类型，计入熔断器
+HOST_FAILURE_CLASSES = {ErrorClass.DNS, ErrorClass.CONNECT, ErrorClass.TIMEOUT, ErrorClass.HTTP_5XX}
+
+
+class DownloadError(Exception):
+    """带失败类型的下载错误"""
+
+    def __init__(self, message: str, error_class: str = ErrorClass.UNKNOWN):
+        super().__init__(message)
+        self.error_class = error_class
+
+
+def classify_status(status_code: int) -> str:
+    """根据 HTTP 状态码判断失败类型"""
+    if status_code == 403:
+        return ErrorClass.FORBIDDEN
+    if status_code == 408:
+        return ErrorClass.TIMEOUT
+    if status_code == 429:
+        return ErrorClass.RATE_LIMITED
+    if 400 <= status_code < 500:
+        return ErrorClass.HTTP_4XX
+    if status_code >= 500:
+        return ErrorClass.HTTP_5XX
+    return ErrorClass.UNKNOWN
+
+
+def classify_error(error: BaseException) -> str:
+    """判断异常的失败类型"""
+    if isinstance(error, DownloadError):
+        return error.error_class
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return classify_status(error.response.status_code)
+    if isinstance(error, (requests.exceptions.Timeout, socket.timeout, TimeoutError)):
+        return ErrorClass.TIMEOUT
+    if isinstance(error, socket.gaierror):
+        return ErrorClass.DNS
+    if isinstance(error, requests.exceptions.ConnectionError):
+        text = str(error)
+        if any(key in text for key in ("NameResolutionError", "getaddrinfo failed",
+                                       "Name or service not known", "nodename nor servname")):
+            return ErrorClass.DNS
+        return ErrorClass.CONNECT
+    if isinstance(error, (requests.exceptions.ChunkedEncodingError, ConnectionError)):
+        return ErrorClass.CONNECT
+    if isinstance(error, OSError) and error.errno in (errno.ENOSPC, getattr(errno, "EDQUOT", errno.ENOSPC)):
+        return ErrorClass.DISK_FULL
+    return ErrorClass.UNKNOWN
+
+
+class RetryRule:
+    """单个失败类型的重试规则"""
+
+    def __init__(self, max_attempts: int, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.max_attempts = max_attempts  # 包括第一次在内的最大尝试次数，1 表示不重试
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+
+DEFAULT_RULES: Dict[str, RetryRule] = {
+    ErrorClass.DNS: RetryRule(3, 5.0, 60.0),
+    ErrorClass.CONNECT: RetryRule(4, 2.0, 30.0),
+    ErrorClass.TIMEOUT: RetryRule(4, 2.0, 30.0),
+    ErrorClass.HTTP_4XX: RetryRule(1),
+    ErrorClass.FORBIDDEN: RetryRule(2, 1.0, 5.0),
+    ErrorClass.RATE_LIMITED: RetryRule(4, 15.0, 120.0),
+    ErrorClass.HTTP_5XX: RetryRule(4, 3.0, 60.0),
+    ErrorClass.MISSING_ELEMENT: RetryRule(3, 1.0, 5.0),
+    ErrorClass.CHALLENGE: RetryRule(3, 3.0, 30.0),
+    ErrorClass.BROWSER: RetryRule(3, 1.0, 10.0),
+    ErrorClass.DISK_FULL: RetryRule(1),
+    ErrorClass.CORRUPT: RetryRule(3, 2.0, 30.0),
+    ErrorClass.STOPPED: RetryRule(1),
+    ErrorClass.PAUSED: RetryRule(1),
+    ErrorClass.UNKNOWN: RetryRule(3, 1.0, 10.0),
+}
+
+
+class RetryPolicy:
+    """按失败类型决定是否重试，并计算带抖动的指数退避时间"""
+
+    def __init__(self, rules: Optional[Dict[str, RetryRule]] = None):
+        self.rules = dict(DEFAULT_RULES)
+        if rules:
+            self.rules.update(rules)
+
+    def rule(self, error_class: str) -> RetryRule:
+        return self.rules.get(error_class, self.rules[ErrorClass.UNKNOWN])
+
+    def should_retry(self, error_class: str, attempt: int) -> bool:
+        """已经尝试 attempt 次且最近一次失败类型为 error_class 时，是否继续重试"""
+        return attempt < self.rule(error_class).max_attempts
+
+    def backoff(self, error_class: str, attempt: int) -> float:
+        """第 attempt 次失败后的等待秒数，一半固定一半随机，避免多个任务同时重试"""
+        rule = self.rule(error_class)
+        delay = min(rule.max_delay, rule.base_delay * (2 ** max(attempt - 1, 0)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """按主机统计连续失败，达到阈值后在冷却时间内暂停对该主机的请求
+
+    冷却结束后放行请求；若随后再次失败立即重新熔断，成功则清零计数。
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.failures: Dict[str, int] = {}
+        self.open_until: Dict[str, float] = {}
+
+    def record_success(self, host: str) -> None:
+        with self.lock:
+            self.failures.pop(host, None)
+            self.open_until.pop(host, None)
+
+    def record_failure(self, host: str, error_class: str) -> bool:
+        """记录一次失败，返回本次是否触发熔断"""
+        if not host or error_class not in HOST_FAILURE_CLASSES:
+            return False
+        with self.lock:
+            count = self.failures.get(host, 0) + 1
+            self.failures[host] = count
+            if count >= self.failure_threshold and self.open_until.get(host, 0) <= time.monotonic():
+                self.open_until[host] = time.monotonic() + self.cooldown
+                return True
+            return False
+
+    def remaining(self, host: str) -> float:
+        """熔断剩余秒数，未熔断返回 0"""
+        with self.lock:
+            return max(0.0, self.open_until.get(host, 0) - time.monotonic())
+
+
+_breaker: Optional[CircuitBreaker] = None
+_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker(failure_threshold: int = 5, cooldown: float = 60.0) -> CircuitBreaker:
+    """获取进程内共享的熔断器，所有下载任务共同感知主机状态"""
+    global _breaker
+    with _breaker_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker(failure_threshold, cooldown)
+        else:
+            _breaker.failure_threshold = failure_threshold
+            _breaker.cooldown = cooldown
+        return _breaker
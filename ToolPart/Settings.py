@@ -0,0 +1,118 @@
+import configparser
+import os
+from typing import Dict, Any
+
+# config.ini 中的高级设置节，界面不提供入口，需要手动编辑
+ADVANCED_SECTION = "Advanced"
+
+ADVANCED_DEFAULTS: Dict[str, Any] = {
+    # 解析阶段拦截图片、媒体、字体和第三方站点请求
+    "BlockResources": True,
+    # 启用拦截的阶段：playlist（播放列表页）、video（视频页）、download（下载页）
+    "BlockStages": "playlist,video,download",
+    # 关闭无头模式调试时是否仍然拦截资源
+    "BlockResourcesWhenVisible": False,
+    # 使用持久化浏览器用户目录，跨视频和重启复用 HTTP 缓存
+    "PersistentProfile": False,
+    "ProfileDir": "./browser_profiles",
+    # 单个用户目录的容量上限（MB），超出后清理缓存或轮换
+    "ProfileMaxMB": 512,
+    # 同一主机连续失败多少次后熔断，以及熔断冷却时间（秒）
+    "CircuitBreakerThreshold": 5,
+    "CircuitBreakerCooldown": 60.0,
+    # 低速检测：连续 StallWindow 秒平均速度低于 MinSpeedKB 时断开并从断点重连，最多 MaxStallRestarts 次
+    "MinSpeedKB": 20,
+    "StallWindow": 30,
+    "MaxStallRestarts": 5,
+    # 分段下载：不小于 SegmentMinMB 的文件使用 Segments 个连接，空闲连接会分担慢速分段
+    "Segments": 4,
+    "SegmentMinMB": 16,
+    # 单次浏览器操作的时限（秒，另加操作自身的等待时间；打开页面另加页面加载超时乘以尝试次数），超时后强制结束浏览器
+    "BrowserOpTimeout": 60.0,
+    # 关闭浏览器的时限（秒）
+    "BrowserQuitTimeout": 15.0,
+    # 写入：网络数据攒成 WriteBlockKB 大小的对齐块后写盘；开启 WriteBehind 时由每个磁盘卷专用的线程写入，
+    # 所有待写数据合计不超过 WriteBufferMB，写满时下载线程等待
+    "WriteBehind": False,
+    "WriteBufferMB": 64,
+    "WriteBlockKB": 1024,
+    # 暂存目录（建议放在本地 SSD），下载在此完成后由后台队列移动到下载目录；留空则直接下载到下载目录
+    "StagingDir": "",
+    # 磁盘剩余空间（扣除进行中下载的预留）低于 MinFreeMB 时暂停开始新的下载；Preallocate 开始下载时一次性分配文件空间
+    "MinFreeMB": 1024,
+    "Preallocate": True,
+    # 启动时用 VerifyWorkers 个线程检查下载目录中已有视频的结构，损坏的视频重新加入下载
+    "VerifyOnStartup": True,
+    "VerifyWorkers": 4,
+    # 内容索引：同一视频已下载到其他目录时按 DedupMethods 的顺序（hardlink、reflink、copy）复用，不再重新下载
+    "Dedup": True,
+    "DedupMethods": "hardlink,reflink,copy",
+    # 下载源选择（新任务创建时保存到任务记录）：PreferredQuality 为首选分辨率（0 表示最高），MaxSizeMB 为大小上限（0 表示不限），
+    # SourceFallback 为首选不可用时的顺序：lower、higher 或 table；SwitchSourceOnError 为所选下载源出错或过慢时是否改用下一个
+    "PreferredQuality": 0,
+    "MaxSizeMB": 0,
+    "SourceFallback": "lower",
+    "SwitchSourceOnError": True,
+    # 下载视频的工作进程数，每个进程有自己的浏览器和传输引擎；0 表示在下载线程中直接下载
+    "ProcessWorkers": 0,
+    # 多机下载：CoordinatorPort 大于 0 时本机作为协调节点，视频交给连接进来的工作节点下载；
+    # CoordinatorHost 为监听地址（局域网使用时设为 0.0.0.0），LeaseSeconds 为租约时长（秒），
+    # ClusterToken 为工作节点需要提供的口令，ClusterJobs 为每个任务同时排队或下载的视频数
+    "CoordinatorPort": 0,
+    "CoordinatorHost": "127.0.0.1",
+    "LeaseSeconds": 60,
+    "ClusterToken": "",
+    "ClusterJobs": 8,
+    # 本地控制接口：ApiPort 大于 0 时启动 HTTP/JSON 接口，ApiHost 为监听地址，ApiToken 为调用时需要提供的口令
+    "ApiPort": 0,
+    "ApiHost": "127.0.0.1",
+    "ApiToken": "",
+    # 浏览器内存管理：BrowserMemoryMB 为单个浏览器（含子进程）的内存上限，超出后在页面之间关闭重启；
+    # MemoryBudgetMB 为所有浏览器合计的内存预算（0 表示不限），MinFreeMemoryMB 为系统可用内存的下限，
+    # 超出预算或低于下限时暂停启动新的浏览器；IdleBrowsers 为保留供复用的空闲浏览器数（0 表示用完即关闭）
+    "BrowserMemoryMB": 800,
+    "MemoryBudgetMB": 0,
+    "MinFreeMemoryMB": 512,
+    "IdleBrowsers": 2,
+    # 结构化事件日志（logger/events 下的 JSONL 文件）：EventLogMaxMB 为单个文件的大小上限，超出后滚动并压缩；
+    # EventLogKeepDays 为保留天数（0 表示不删除）；EventLogAll 为 True 时除失败外也记录完成、浏览器回收等事件
+    "EventLogMaxMB": 50,
+    "EventLogKeepDays": 30,
+    "EventLogAll": False,
+    # 任务内视频的下载顺序：fifo 按播放列表顺序，shortest 小文件优先（单位时间完成的文件最多），
+    # largest 大文件优先（减少最后只剩一个大文件在下载的情况）；大小来自下载表格和 Content-Length，未知时按平均大小
+    "ScheduleOrder": "fifo",
+    # 速度估计的平滑系数（0~1），越大越偏向最近的速度
+    "SpeedSmoothing": 0.3,
+    # 预解析：LookaheadVideos 为提前解析下载链接的视频数（0 表示不预解析，只在本机下载时生效），
+    # LookaheadWorkers 为同时预解析的数量（每个占用一个浏览器）；
+    # 取用预解析结果时直链至少还要有效 LookaheadMargin 秒（已知大小和速度时按估计的传输时间），否则重新解析
+    "LookaheadVideos": 2,
+    "LookaheadWorkers": 1,
+    "LookaheadMargin": 60,
+    # 退出程序时等待任务停止和浏览器关闭的总时限（秒），超时的浏览器直接结束进程
+    "ShutdownTimeout": 10.0,
+}
+
+
+def load_advanced_settings(config_file: str = "./config.ini") -> Dict[str, Any]:
+    """读取高级设置，缺失的项使用默认值，类型与默认值一致"""
+    config = configparser.ConfigParser()
+    if os.path.exists(config_file):
+        config.read(config_file, encoding='utf-8')
+
+    settings: Dict[str, Any] = {}
+    for key, default in ADVANCED_DEFAULTS.items():
+        try:
+            if isinstance(default, bool):
+                settings[key] = config.getboolean(ADVANCED_SECTION, key, fallback=default)
+            elif isinstance(default, int):
+                settings[key] = config.getint(ADVANCED_SECTION, key, fallback=default)
+            elif isinstance(default, float):
+                settings[key] = config.getfloat(ADVANCED_SECTION, key, fallback=default)
+            else:
+                settings[key] = config.get(ADVANCED_SECTION, key, fallback=default)
+        except ValueError:
+            print(f"高级设置 {key} 的值无效，使用默认值: {default}")
+            settings[key] = default
+    return settings
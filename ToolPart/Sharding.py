@@ -0,0 +1,222 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from ToolPart.EventLog import set_process_tag
+from ToolPart.RetryPolicy import ErrorClass
+from ToolPart.SourcePolicy import SourcePolicy
+from ToolPart.Watchdog import kill_process_tree
+
+# 工作进程读取暂停/停止状态的缓存时间（秒），避免每个数据块都跨进程查询
+CONTROL_CACHE_SECONDS = 0.5
+# 暂停期间检查是否继续的间隔（秒）
+PAUSE_POLL_INTERVAL = 0.5
+
+# 工作进程内的日志队列，由进程池初始化函数设置
+_log_queue = None
+
+
+class JobControl:
+    """主进程与工作进程共享的任务暂停/停止状态"""
+
+    def __init__(self, stop_event, pause_event, discard_event):
+        self.stop_event = stop_event
+        self.pause_event = pause_event
+        self.discard_event = discard_event  # 任务被删除，停止时不保留断点
+        self._checked = 0.0
+        self._running = True
+        self._paused = False
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"stop_event": self.stop_event, "pause_event": self.pause_event,
+                "discard_event": self.discard_event}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["stop_event"], state["pause_event"], state["discard_event"])
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if now - self._checked >= CONTROL_CACHE_SECONDS:
+            self._running = not self.stop_event.is_set()
+            self._paused = self.pause_event.is_set()
+            self._checked = now
+
+    def is_running(self) -> bool:
+        self._refresh()
+        return self._running
+
+    def is_paused(self) -> bool:
+        self._refresh()
+        return self._paused
+
+    def is_discarded(self) -> bool:
+        return self.discard_event.is_set()
+
+    def checkpoint(self) -> bool:
+        """暂停时阻塞，返回任务是否仍在运行"""
+        self._refresh()
+        if not self._running:
+            return False
+        if not self._paused:
+            return True
+        while self.pause_event.is_set() and not self.stop_event.is_set():
+            time.sleep(PAUSE_POLL_INTERVAL)
+        self._checked = 0.0
+        return not self.stop_event.is_set()
+
+    def sleep(self, seconds: float) -> None:
+        self.stop_event.wait(seconds)
+
+
+def _init_worker(log_queue, worker_pids) -> None:
+    global _log_queue
+    _log_queue = log_queue
+    # 登记进程号，程序退出时主进程据此结束工作进程及其浏览器
+    worker_pids.append(os.getpid())
+    # 每个工作进程写自己的事件日志文件
+    set_process_tag(f"w{os.getpid()}")
+
+
+def run_video_job(task_id: str, video_url: str, download_dir: str, headless: bool,
+                  settings: Dict[str, Any], policy: Dict[str, Any],
+                  control: JobControl) -> Tuple[bool, str, Optional[str], str, Optional[Dict[str, Any]],
+                                                Optional[Dict[str, Any]]]:
+    """在工作进程中下载一个视频，返回（是否成功，错误信息，文件名，失败类型，文件信息，暂停或停止时保存的断点）"""
+    from ToolPart.VideoJob import VideoJob
+
+    def log(message: str) -> None:
+        if _log_queue is not None:
+            _log_queue.put((task_id, message))
+
+    try:
+        job = VideoJob(download_dir, headless, settings, SourcePolicy.from_dict(policy), log,
+                       control.checkpoint, control.is_running, control.sleep, control.is_paused,
+                       control.is_discarded)
+        success, error, filename, error_class = job.attempt(video_url)
+        file_info = job.file_records.pop(filename, None) if filename else None
+        return success, error, filename, error_class, file_info, job.partials.pop(video_url, None)
+    except Exception as e:
+        return False, f"工作进程出错: {str(e)}", None, ErrorClass.UNKNOWN, None, None
+
+
+class ProcessShards:
+    """把视频下载分散到多个工作进程执行，每个进程有自己的浏览器和传输引擎
+
+    主进程负责枚举、调度、重试和任务记录；工作进程的日志经队列转发给对应任务。
+    """
+
+    def __init__(self, workers: int):
+        # 使用 spawn 启动，避免在已有 Qt 线程的进程中 fork
+        self.context = multiprocessing.get_context("spawn")
+        self.manager = self.context.Manager()
+        self.log_queue = self.manager.Queue()
+        self.worker_pids = self.manager.list()
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=self.context,
+                                            initializer=_init_worker, initargs=(self.log_queue, self.worker_pids))
+        self.listeners: Dict[str, Callable[[str], None]] = {}
+        self.controls: Dict[str, JobControl] = {}  # task_id -> 控制状态，退出时统一停止，任务结束时移除
+        self.pending: Set[Future] = set()  # 工作进程中尚未结束的视频
+        self.lock = threading.Lock()
+        self.router = threading.Thread(target=self._route_logs, name="shard-log-router", daemon=True)
+        self.router.start()
+
+    def new_control(self, task_id: str) -> JobControl:
+        control = JobControl(self.manager.Event(), self.manager.Event(), self.manager.Event())
+        with self.lock:
+            self.controls[task_id] = control
+        return control
+
+    def register(self, task_id: str, log: Callable[[str], None]) -> None:
+        with self.lock:
+            self.listeners[task_id] = log
+
+    def unregister(self, task_id: str) -> None:
+        """任务结束：移除日志转发和控制状态，管理进程随之释放其中的 Event"""
+        with self.lock:
+            self.listeners.pop(task_id, None)
+            self.controls.pop(task_id, None)
+
+    def submit(self, task_id: str, video_url: str, download_dir: str, headless: bool,
+               settings: Dict[str, Any], policy: SourcePolicy, control: JobControl) -> Future:
+        future = self.executor.submit(run_video_job, task_id, video_url, download_dir, headless,
+                                      settings, policy.to_dict(), control)
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future: Future) -> None:
+        with self.lock:
+            self.pending.discard(future)
+
+    def shutdown(self, timeout: float) -> int:
+        """程序退出时停止所有工作进程，返回未在时限内结束的视频数
+
+        先通知所有任务停止，进行中的传输保存断点后返回；到 timeout 仍未结束的视频不再等待。
+        工作进程中的浏览器（包括留作复用的空闲浏览器）随工作进程的进程树一起结束。
+        """
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            controls = list(self.controls.values())
+        for control in controls:
+            try:
+                control.stop_event.set()
+            except (EOFError, OSError):
+                pass
+        while time.monotonic() < deadline:
+            with self.lock:
+                if not self.pending:
+                    break
+            time.sleep(0.1)
+
+        with self.lock:
+            unfinished = len(self.pending)
+        try:
+            pids = list(self.worker_pids)
+        except (EOFError, OSError):
+            pids = []
+        for pid in pids:
+            kill_process_tree(pid)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.manager.shutdown()
+        return unfinished
+
+    def _route_logs(self) -> None:
+        while True:
+            try:
+                task_id, message = self.log_queue.get()
+            except (EOFError, OSError):
+                return
+            except queue.Empty:
+                continue
+            with self.lock:
+                listener = self.listeners.get(task_id)
+            if listener:
+                listener(message)
+
+
+_shards: Optional[ProcessShards] = None
+_shards_lock = threading.Lock()
+
+
+def get_process_shards(workers: int) -> ProcessShards:
+    """获取进程内共享的工作进程池，所有下载任务共用"""
+    global _shards
+    with _shards_lock:
+        if _shards is None:
+            _shards = ProcessShards(workers)
+        return _shards
+
+
+def shutdown_process_shards(timeout: float) -> int:
+    """程序退出时关闭工作进程池（未启动时不做任何事），返回未在时限内结束的视频数"""
+    global _shards
+    with _shards_lock:
+        shards, _shards = _shards, None
+    if shards is None:
+        return 0
+    return shards.shutdown(timeout)
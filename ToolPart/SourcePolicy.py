@@ -0,0 +1,74 @@
+from typing import Any, Dict, List
+
+# 首选分辨率不可用时的回退顺序
+FALLBACK_LOWER = "lower"  # 先找更低的分辨率，再找更高的
+FALLBACK_HIGHER = "higher"  # 先找更高的分辨率，再找更低的
+FALLBACK_TABLE = "table"  # 按下载表格中的顺序
+FALLBACK_ORDERS = (FALLBACK_LOWER, FALLBACK_HIGHER, FALLBACK_TABLE)
+
+
+class SourcePolicy:
+    """下载源选择策略：首选分辨率、大小上限和回退顺序
+
+    preferred_quality 为 0 表示选择最高分辨率；max_size_mb 为 0 表示不限制大小。
+    """
+
+    def __init__(self, preferred_quality: int = 0, max_size_mb: int = 0,
+                 fallback: str = FALLBACK_LOWER, switch_on_error: bool = True):
+        self.preferred_quality = preferred_quality
+        self.max_size_mb = max_size_mb
+        self.fallback = fallback if fallback in FALLBACK_ORDERS else FALLBACK_LOWER
+        self.switch_on_error = switch_on_error  # 所选下载源出错或过慢时是否改用下一个
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> "SourcePolicy":
+        return cls(settings.get("PreferredQuality", 0), settings.get("MaxSizeMB", 0),
+                   settings.get("SourceFallback", FALLBACK_LOWER), settings.get("SwitchSourceOnError", True))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SourcePolicy":
+        return cls(data.get("preferred_quality", 0), data.get("max_size_mb", 0),
+                   data.get("fallback", FALLBACK_LOWER), data.get("switch_on_error", True))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "preferred_quality": self.preferred_quality,
+            "max_size_mb": self.max_size_mb,
+            "fallback": self.fallback,
+            "switch_on_error": self.switch_on_error,
+        }
+
+    def describe(self) -> str:
+        quality = f"{self.preferred_quality}p" if self.preferred_quality else "最高"
+        size = f"{self.max_size_mb} MB" if self.max_size_mb else "不限"
+        return f"首选分辨率 {quality}，大小上限 {size}，回退顺序 {self.fallback}"
+
+    def rank(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """按策略给下载表格中的行排序，返回候选列表（第一个为首选）
+
+        超过大小上限的行被排除；全部超出时只保留最小的一个。分辨率未知的行排在最后。
+        """
+        rows = [row for row in rows if row.get("url")]
+        if self.max_size_mb:
+            limit = self.max_size_mb * 1024 * 1024
+            allowed = [row for row in rows if row.get("size") is None or row["size"] <= limit]
+            if not allowed and rows:
+                allowed = [min(rows, key=lambda row: row["size"])]
+            rows = allowed
+
+        known = [row for row in rows if row.get("quality")]
+        unknown = [row for row in rows if not row.get("quality")]
+        if self.fallback == FALLBACK_TABLE and self.preferred_quality:
+            preferred = [row for row in known if row["quality"] == self.preferred_quality]
+            return preferred + [row for row in rows if row not in preferred]
+
+        target = self.preferred_quality
+        if not target:
+            return sorted(known, key=lambda row: -row["quality"]) + unknown
+
+        lower = sorted((row for row in known if row["quality"] <= target), key=lambda row: -row["quality"])
+        higher = sorted((row for row in known if row["quality"] > target), key=lambda row: row["quality"])
+        if self.fallback == FALLBACK_HIGHER:
+            exact = [row for row in lower if row["quality"] == target]
+            return exact + higher + [row for row in lower if row["quality"] != target] + unknown
+        return lower + higher + unknown
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import queue
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from ToolPart.Writer import volume_id
+
+# 跨磁盘复制时的读写缓冲大小
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+# 暂存子目录中记录最终目录的文件
+TARGET_FILE = "target.txt"
+# 暂存目录中未下载完的文件：.part 临时文件、断点信息及其写入中的临时文件，恢复时不移动
+UNFINISHED_SUFFIXES = (".part", ".part.json", ".tmp")
+
+
+def staging_dir_for(staging_root: str, download_dir: str) -> str:
+    """下载目录对应的暂存子目录，不同下载目录的同名文件互不冲突"""
+    final_dir = os.path.abspath(download_dir)
+    name = hashlib.md5(final_dir.encode('utf-8')).hexdigest()[:12]
+    directory = os.path.join(staging_root, name)
+    os.makedirs(directory, exist_ok=True)
+    target_file = os.path.join(directory, TARGET_FILE)
+    if not os.path.exists(target_file):
+        with open(target_file, 'w', encoding='utf-8') as f:
+            f.write(final_dir)
+    return directory
+
+
+class FileMover:
+    """后台移动队列：把暂存目录中下载完成的文件移动到最终目录
+
+    同一磁盘直接改名；跨磁盘时用大缓冲复制到临时文件，校验大小一致后改名并删除暂存文件。
+    移动失败时保留暂存文件，下次启动时重新加入队列。
+    """
+
+    def __init__(self, log: Optional[Callable[[str], None]] = None):
+        self.log = log or print
+        self.queue: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+        self.lock = threading.Condition()
+        self.pending: Dict[str, str] = {}  # 最终路径 -> 暂存路径
+        self.thread = threading.Thread(target=self._loop, name="file-mover", daemon=True)
+        self.thread.start()
+
+    def submit(self, staged_path: str, final_path: str) -> None:
+        with self.lock:
+            if final_path in self.pending:
+                return
+            self.pending[final_path] = staged_path
+        self.queue.put((staged_path, final_path))
+
+    def is_pending(self, final_path: str) -> bool:
+        """文件是否已下载完成、正在等待移动"""
+        with self.lock:
+            return final_path in self.pending
+
+    def pending_count(self) -> int:
+        with self.lock:
+            return len(self.pending)
+
+    def wait_all(self, timeout: Optional[float] = None) -> bool:
+        """等待队列清空，返回是否全部完成"""
+        with self.lock:
+            return self.lock.wait_for(lambda: not self.pending, timeout)
+
+    def recover(self, staging_root: str) -> int:
+        """把上次未移动完的文件重新加入队列，返回数量"""
+        if not os.path.isdir(staging_root):
+            return 0
+        count = 0
+        for name in os.listdir(staging_root):
+            directory = os.path.join(staging_root, name)
+            try:
+                with open(os.path.join(directory, TARGET_FILE), 'r', encoding='utf-8') as f:
+                    final_dir = f.read().strip()
+            except OSError:
+                continue
+            for filename in os.listdir(directory):
+                staged_path = os.path.join(directory, filename)
+                if filename == TARGET_FILE or filename.endswith(UNFINISHED_SUFFIXES) or not os.path.isfile(staged_path):
+                    continue
+                self.submit(staged_path, os.path.join(final_dir, filename))
+                count += 1
+        return count
+
+    def _loop(self) -> None:
+        while True:
+            staged_path, final_path = self.queue.get()
+            try:
+                self._move(staged_path, final_path)
+                self.log(f"已移动到最终目录: {final_path}")
+            except Exception as e:
+                self.log(f"移动文件失败，暂存文件已保留: {staged_path} - {str(e)}")
+            finally:
+                with self.lock:
+                    self.pending.pop(final_path, None)
+                    self.lock.notify_all()
+
+    def _move(self, staged_path: str, final_path: str) -> None:
+        os.makedirs(os.path.dirname(final_path) or ".", exist_ok=True)
+        if volume_id(staged_path) == volume_id(final_path):
+            os.replace(staged_path, final_path)
+            return
+
+        size = os.path.getsize(staged_path)
+        temp_path = final_path + ".moving"
+        try:
+            with open(staged_path, 'rb') as src, open(temp_path, 'wb') as dst:
+                while True:
+                    block = src.read(COPY_BUFFER_SIZE)
+                    if not block:
+                        break
+                    dst.write(block)
+                dst.flush()
+                os.fsync(dst.fileno())
+            copied = os.path.getsize(temp_path)
+            if copied != size:
+                raise IOError(f"复制后大小不一致: {copied} != {size}")
+            os.replace(temp_path, final_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        os.remove(staged_path)
+
+
+_mover: Optional[FileMover] = None
+_mover_lock = threading.Lock()
+
+
+def get_file_mover(staging_root: str) -> FileMover:
+    """获取进程内共享的移动队列，首次创建时恢复上次遗留的暂存文件"""
+    global _mover
+    with _mover_lock:
+        if _mover is None:
+            _mover = FileMover()
+            recovered = _mover.recover(staging_root)
+            if recovered:
+                print(f"恢复 {recovered} 个待移动的暂存文件")
+        return _mover
@@ -0,0 +1,556 @@
+import json
+import os
+import re
+import threading
+import time
+from typing import Callable, Optional, Dict, Any, List, Tuple
+
+import requests
+
+from ToolPart.DiskSpace import Reservation, get_space_tracker
+from ToolPart.Integrity import HASH_BLOCK_SIZE, BlockHasher, HashStream
+from ToolPart.RetryPolicy import DownloadError, ErrorClass
+from ToolPart.Writer import BlockStream, FileTarget, open_target
+
+CHUNK_SIZE = 64 * 1024
+# 分段边界按此大小对齐，拆分后的分段不小于该值；与分块哈希的块大小一致
+SEGMENT_ALIGN = HASH_BLOCK_SIZE
+CONNECT_TIMEOUT = 15
+READ_TIMEOUT = 30
+
+# 视为“传输卡住”而非真正失败的异常，发生时从当前位置重新发起请求
+STALL_ERRORS = (requests.exceptions.ReadTimeout, requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.ConnectionError)
+CONTENT_RANGE_PATTERN = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+# 断点信息文件的后缀，保存在 .part 文件旁边
+STATE_SUFFIX = ".json"
+STATE_VERSION = 1
+
+
+class TransferStalled(Exception):
+    """传输速度低于下限"""
+
+
+class SpeedMonitor:
+    """低速检测：每个时间窗口内的平均速度低于下限即判定为卡住"""
+
+    def __init__(self, min_speed: float, window: float):
+        self.min_speed = min_speed
+        self.window = window
+        self.started = time.monotonic()
+        self.total = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """重新开始计时，用于暂停恢复后避免误判"""
+        self.window_start = time.monotonic()
+        self.window_bytes = 0
+
+    def update(self, nbytes: int) -> bool:
+        """记录读取的字节数，返回是否判定为低速"""
+        self.total += nbytes
+        self.window_bytes += nbytes
+        elapsed = time.monotonic() - self.window_start
+        if elapsed < self.window:
+            return False
+        stalled = self.min_speed > 0 and self.window_bytes / elapsed < self.min_speed
+        self.reset()
+        return stalled
+
+    def speed(self) -> float:
+        """本次连接的平均速度（字节/秒）"""
+        return self.total / max(time.monotonic() - self.started, 1e-3)
+
+
+class Segment:
+    """分段下载中的一段，负责 [offset, end) 范围，end 可能因被拆分而缩短"""
+
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.offset = start
+        self.end = end
+        self.speed = 0.0
+        self.active = False
+
+    def remaining(self) -> int:
+        return max(0, self.end - self.offset)
+
+
+def parse_content_range(value: str) -> Tuple[Optional[int], Optional[int]]:
+    """解析 Content-Range 头，返回（起始位置，文件总大小）"""
+    match = CONTENT_RANGE_PATTERN.search(value or "")
+    if not match:
+        return None, None
+    total = None if match.group(3) == "*" else int(match.group(3))
+    return int(match.group(1)), total
+
+
+def remove_partial(path: str) -> None:
+    """删除未完成的文件及其断点信息"""
+    for name in (path, path + STATE_SUFFIX):
+        if os.path.exists(name):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+
+class FileTransfer:
+    """下载单个文件到指定路径
+
+    - 低速检测：连接在一个窗口内的平均速度低于下限，或读取超时，就断开并从当前位置重新请求；
+    - 分段下载：服务器支持 Range 且文件足够大时使用多个连接并发下载，
+      某个连接空闲后拆分剩余时间最长的分段，把后半段交给它；
+    - 写入：读到的数据先攒成对齐的大块再写盘，开启 WriteBehind 后由磁盘卷专用线程写入；
+    - 空间：开始写入前按文件大小预留磁盘空间并尽量一次性预分配，空间不足时断开连接等待而不是中途写满；
+    - 校验：传输过程中计算分块哈希，结束时检查收到的字节数与文件大小一致；
+    - 暂停：检查点发现暂停或停止时各连接写完缓冲区后退出，把每个分段的位置和已完成块的哈希
+      保存到 path + ".json"；下次下载同一路径时，若服务器的文件大小和 ETag/Last-Modified 未变，
+      各分段从保存的位置用 Range 请求继续。
+    """
+
+    def __init__(self, url: str, path: str, headers: Dict[str, str],
+                 is_running: Callable[[], bool], settings: Dict[str, Any],
+                 on_progress: Optional[Callable[[int, int], None]] = None,
+                 log: Optional[Callable[[str], None]] = None,
+                 is_paused: Optional[Callable[[], bool]] = None):
+        self.url = url
+        self.path = path
+        self.state_path = path + STATE_SUFFIX
+        self.headers = headers
+        self.is_running = is_running
+        self.on_progress = on_progress
+        self.log = log or (lambda message: None)
+        self.is_paused = is_paused or (lambda: False)
+        self.min_speed = settings.get("MinSpeedKB", 0) * 1024
+        self.stall_window = settings.get("StallWindow", 30)
+        self.max_restarts = settings.get("MaxStallRestarts", 5)
+        self.connections = max(1, settings.get("Segments", 1))
+        self.segment_min = settings.get("SegmentMinMB", 16) * 1024 * 1024
+        self.write_behind = settings.get("WriteBehind", False)
+        self.write_buffer = settings.get("WriteBufferMB", 64) * 1024 * 1024
+        self.write_block = max(64, settings.get("WriteBlockKB", 1024)) * 1024
+        self.min_free = settings.get("MinFreeMB", 0) * 1024 * 1024
+        self.preallocate = settings.get("Preallocate", True)
+        self.reservation: Optional[Reservation] = None
+        self.hasher = BlockHasher()
+        self.digest: Optional[str] = None
+
+        self.lock = threading.Lock()
+        self.total = 0
+        self.ranged = False
+        self.validators: Dict[str, str] = {}
+        self.downloaded = 0
+        self.segments: List[Segment] = []
+        self.pending: List[Segment] = []
+        self.error: Optional[BaseException] = None
+
+    def run(self) -> int:
+        """执行下载，返回文件总字节数；失败时抛出异常"""
+        session = requests.Session()
+        response = self._open(session, 0)
+        ranged, self.total, self.validators = self._describe(response)
+        self.ranged = ranged
+        state = self._load_state()
+        segmented = state is None and ranged and self.connections > 1 and self.total >= self.segment_min
+        if state is not None or segmented:
+            # 断点续传和分段下载按分段重新请求，首个响应只用来取得文件信息
+            response.close()
+            response = None
+
+        def release_response() -> None:
+            # 预留空间要等其他下载释放空间时先断开连接，不在等待期间占用
+            nonlocal response
+            if response is not None:
+                response.close()
+                response = None
+
+        try:
+            if self.total:
+                self.reservation = get_space_tracker().reserve(self.path, self.total, self.min_free,
+                                                               self._keep_going, self.log, release_response)
+            if response is None and state is None and not segmented:
+                response = self._reopen(session)
+        except BaseException:
+            release_response()
+            if self.reservation is not None:
+                self.reservation.release()
+            raise
+
+        target = open_target(self.path, self.write_behind, self.write_buffer)
+        try:
+            if state is not None:
+                self._run_resumed(target, state)
+            elif segmented:
+                self._run_segmented(target)
+            else:
+                self._run_single(session, response, ranged, target)
+        except DownloadError as e:
+            if e.error_class in (ErrorClass.PAUSED, ErrorClass.STOPPED):
+                self._save_state(target)
+            raise
+        finally:
+            target.close()
+            if self.reservation is not None:
+                self.reservation.release()
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+        if self.total and self.downloaded != self.total:
+            raise DownloadError(f"收到 {self.downloaded} 字节，与文件大小 {self.total} 不一致", ErrorClass.CORRUPT)
+        self.total = self.total or self.downloaded
+        try:
+            self.digest = self.hasher.hexdigest(self.total)
+        except ValueError as e:
+            raise DownloadError(str(e), ErrorClass.CORRUPT)
+        return self.total
+
+    def _open(self, session: requests.Session, start: int, end: Optional[int] = None) -> requests.Response:
+        headers = dict(self.headers)
+        headers['Range'] = f"bytes={start}-{'' if end is None else end - 1}"
+        response = session.get(self.url, headers=headers, stream=True,
+                               timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        response.raise_for_status()
+        return response
+
+    def _reopen(self, session: requests.Session) -> requests.Response:
+        """等待空间后重新请求，服务器上的文件在此期间变化时按连接失败处理，由重试重新开始"""
+        response = self._open(session, 0)
+        if self._describe(response) != (self.ranged, self.total, self.validators):
+            response.close()
+            raise DownloadError("等待磁盘空间期间服务器上的文件已变化", ErrorClass.CONNECT)
+        return response
+
+    @staticmethod
+    def _describe(response: requests.Response) -> Tuple[bool, int, Dict[str, str]]:
+        """从首个响应得到（是否支持 Range，文件大小，ETag/Last-Modified）"""
+        ranged = response.status_code == 206
+        if ranged:
+            _, total = parse_content_range(response.headers.get('content-range', ''))
+            total = total or 0
+        else:
+            total = int(response.headers.get('content-length', 0))
+        validators = {key: response.headers[key] for key in ("etag", "last-modified") if key in response.headers}
+        return ranged, total, validators
+
+    def _keep_going(self) -> bool:
+        """不阻塞的暂停/停止检查：暂停时抛出 PAUSED，返回任务是否仍在运行"""
+        if self.is_paused():
+            raise DownloadError("任务已暂停", ErrorClass.PAUSED)
+        return self.is_running()
+
+    def _check(self) -> None:
+        """检查暂停/停止，不在原地等待：暂停时抛出 PAUSED，由调用方保存断点后断开连接"""
+        if not self._keep_going():
+            raise DownloadError("任务已停止", ErrorClass.STOPPED)
+        if self.error is not None:
+            raise DownloadError("其他分段下载失败", ErrorClass.STOPPED)
+
+    def _allocate(self, target: FileTarget) -> bool:
+        """预分配文件空间，成功后空间已实际占用，不再需要预留"""
+        if not self.preallocate or not target.preallocate(self.total):
+            return False
+        if self.reservation is not None:
+            self.reservation.release()
+        return True
+
+    def _add_progress(self, nbytes: int) -> None:
+        with self.lock:
+            self.downloaded += nbytes
+            downloaded = self.downloaded
+        if self.reservation is not None:
+            self.reservation.update(downloaded)
+        if self.on_progress:
+            self.on_progress(downloaded, self.total)
+
+    def _restart(self, restarts: int, reason: str, error_class: str = ErrorClass.TIMEOUT) -> int:
+        restarts += 1
+        if restarts > self.max_restarts:
+            raise DownloadError(f"传输多次卡住（{reason}），已放弃", error_class)
+        self.log(f"传输卡住（{reason}），从断点重新连接 ({restarts}/{self.max_restarts})")
+        return restarts
+
+    def _run_single(self, session: requests.Session, response: requests.Response, ranged: bool,
+                    target: FileTarget) -> None:
+        """单连接下载，卡住时断开并从当前位置续传（服务器不支持 Range 时从头开始）"""
+        target.truncate(0)
+        allocated = self._allocate(target)
+        stream = BlockStream(target, 0, self.write_block)
+        digest = self.hasher.stream(0)
+        offset = 0
+        restarts = 0
+        segment = Segment(0, self.total)
+        self.segments = [segment]
+        while True:
+            monitor = SpeedMonitor(self.min_speed, self.stall_window)
+            try:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    self._check()
+                    if chunk:
+                        stream.write(chunk)
+                        digest.update(chunk)
+                        offset += len(chunk)
+                        with self.lock:
+                            segment.offset = offset
+                        self._add_progress(len(chunk))
+                        if monitor.update(len(chunk)):
+                            raise TransferStalled(f"{monitor.speed() / 1024:.1f} KB/s")
+            except (TransferStalled,) + STALL_ERRORS as e:
+                response.close()
+                restarts = self._restart(restarts, str(e) or type(e).__name__)
+                response = self._open(session, offset) if ranged else None
+                if response is not None and (response.status_code != 206 or
+                                             parse_content_range(response.headers.get('content-range', ''))[0] != offset):
+                    # 服务器不再按请求的位置返回，改为从头重新下载，避免把完整内容接在已写入的数据之后
+                    self.log("服务器不再支持从断点续传，从头重新下载")
+                    response.close()
+                    response = None
+                    ranged = self.ranged = False
+                if response is None:
+                    with self.lock:
+                        self.downloaded -= offset
+                        segment.offset = 0
+                    offset = 0
+                    stream.discard()
+                    target.truncate(0)
+                    allocated = self._allocate(target)
+                    stream = BlockStream(target, 0, self.write_block)
+                    self.hasher.reset()
+                    digest = self.hasher.stream(0)
+                    response = self._open(session, 0)
+                continue
+            except BaseException:
+                response.close()
+                self._flush_quietly(stream)
+                raise
+            response.close()
+            stream.flush()
+            digest.finish()
+            if allocated:
+                # 实际长度与预分配大小不一致时截掉多余部分
+                target.truncate(offset)
+            return
+
+    def _run_segmented(self, target: FileTarget) -> None:
+        """多连接分段下载"""
+        target.truncate(self.total)
+        self._allocate(target)
+
+        size = self.total // self.connections
+        size = max(SEGMENT_ALIGN, (size // SEGMENT_ALIGN) * SEGMENT_ALIGN)
+        start = 0
+        while start < self.total:
+            end = min(self.total, start + size)
+            if self.total - end < SEGMENT_ALIGN:
+                end = self.total
+            self.segments.append(Segment(start, end))
+            start = end
+        self.pending = list(self.segments)
+        self.log(f"分段下载: {len(self.segments)} 段，{self.connections} 个连接")
+
+        workers = [threading.Thread(target=self._segment_worker, args=(target,), daemon=True)
+                   for _ in range(min(self.connections, len(self.segments)))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def _run_resumed(self, target: FileTarget, state: Dict[str, Any]) -> None:
+        """按保存的断点继续分段下载，已写入的部分不截断"""
+        self._allocate(target)
+        self.segments = [Segment(start, end) for start, _, end in state["segments"]]
+        for segment, (_, offset, _) in zip(self.segments, state["segments"]):
+            segment.offset = offset
+        for index, digest in state["blocks"].items():
+            self.hasher._add_block(int(index), bytes.fromhex(digest))
+        self.pending = [segment for segment in self.segments if segment.remaining()]
+        self.downloaded = sum(segment.offset - segment.start for segment in self.segments)
+        self.log(f"从断点继续下载: 已完成 {self.downloaded}/{self.total} 字节，剩余 {len(self.pending)} 段")
+        if self.reservation is not None:
+            self.reservation.update(self.downloaded)
+        if self.on_progress:
+            self.on_progress(self.downloaded, self.total)
+
+        # 单连接下载的断点只有一段，文件足够大时空闲连接会拆分它
+        count = self.connections if self.total >= self.segment_min else 1
+        workers = [threading.Thread(target=self._segment_worker, args=(target,), daemon=True)
+                   for _ in range(count)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        if self.error is not None:
+            raise self.error
+        self._fill_missing_blocks(target)
+
+    def _fill_missing_blocks(self, target: FileTarget) -> None:
+        """暂停恰好发生在分段写完之后时，该段最后一块的哈希未提交，从文件读回补算"""
+        block_size = self.hasher.block_size
+        with self.hasher.lock:
+            missing = [index for index in range((self.total + block_size - 1) // block_size)
+                       if index not in self.hasher.blocks]
+        for index in missing:
+            start = index * block_size
+            digest = self.hasher.stream(start)
+            digest.update(target.read_at(start, min(block_size, self.total - start)))
+            digest.finish()
+
+    def _load_state(self) -> Optional[Dict[str, Any]]:
+        """读取断点信息；服务器上的文件已变化（大小或 ETag/Last-Modified 不同）时丢弃，从头下载"""
+        if not os.path.exists(self.state_path):
+            return None
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取断点信息失败: {str(e)}")
+            state = None
+        valid = (isinstance(state, dict) and state.get("version") == STATE_VERSION and self.ranged
+                 and self.total and state.get("total") == self.total and os.path.exists(self.path)
+                 and state.get("block_size") == self.hasher.block_size
+                 and all(state.get("validators", {}).get(key, value) == value
+                         for key, value in self.validators.items()))
+        if not valid:
+            if state is not None:
+                self.log("服务器上的文件已变化，丢弃断点从头下载")
+            try:
+                os.remove(self.state_path)
+            except OSError:
+                pass
+            return None
+        return state
+
+    def _save_state(self, target: FileTarget) -> None:
+        """暂停或停止时保存断点：先把文件刷到磁盘，断点信息不会超前于文件内容"""
+        if not self.ranged or not self.total or not self.segments:
+            return
+        try:
+            target.sync()
+            with self.lock:
+                segments = [[segment.start, segment.offset, segment.end] for segment in self.segments]
+                downloaded = self.downloaded
+            with self.hasher.lock:
+                blocks = {str(index): digest.hex() for index, digest in self.hasher.blocks.items()}
+            state = {"version": STATE_VERSION, "url": self.url, "total": self.total,
+                     "validators": self.validators, "block_size": self.hasher.block_size,
+                     "segments": segments, "blocks": blocks}
+            temp_path = self.state_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.state_path)
+            self.log(f"已保存下载进度: {downloaded}/{self.total} 字节")
+        except OSError as e:
+            print(f"保存断点信息失败: {str(e)}")
+
+    def _segment_digest(self, target: FileTarget, offset: int) -> HashStream:
+        """从 offset 开始的顺序哈希；断点不在块边界时，先读回该块已写入的部分"""
+        aligned = offset - offset % self.hasher.block_size
+        digest = self.hasher.stream(aligned)
+        if offset > aligned:
+            digest.update(target.read_at(aligned, offset - aligned))
+        return digest
+
+    @staticmethod
+    def _flush_quietly(stream: BlockStream) -> None:
+        """中断退出时写入已缓冲的数据，保存的断点位置才与文件内容一致"""
+        try:
+            stream.flush()
+        except Exception as e:
+            print(f"写入缓冲数据失败: {str(e)}")
+
+    def _next_segment(self) -> Optional[Segment]:
+        """取下一个待下载分段；没有时拆分剩余时间最长的分段"""
+        with self.lock:
+            if self.pending:
+                segment = self.pending.pop(0)
+                segment.active = True
+                return segment
+
+            candidates = [s for s in self.segments if s.active and s.remaining() >= 2 * SEGMENT_ALIGN]
+            if not candidates:
+                return None
+            victim = max(candidates, key=lambda s: s.remaining() / max(s.speed, 1.0))
+            split = victim.offset + victim.remaining() // 2
+            split = ((split + SEGMENT_ALIGN - 1) // SEGMENT_ALIGN) * SEGMENT_ALIGN
+            if split >= victim.end:
+                return None
+
+            segment = Segment(split, victim.end)
+            segment.active = True
+            victim.end = split
+            self.segments.append(segment)
+        self.log(f"拆分慢速分段: {segment.start}-{segment.end} 交给空闲连接")
+        return segment
+
+    def _segment_worker(self, target: FileTarget) -> None:
+        session = requests.Session()
+        try:
+            while self.error is None:
+                segment = self._next_segment()
+                if segment is None:
+                    return
+                self._download_segment(session, target, segment)
+        except BaseException as e:
+            with self.lock:
+                if self.error is None:
+                    self.error = e
+
+    def _download_segment(self, session: requests.Session, target: FileTarget, segment: Segment) -> None:
+        stream = BlockStream(target, segment.offset, self.write_block)
+        digest = self._segment_digest(target, segment.offset)
+        try:
+            self._transfer_segment(session, segment, stream, digest)
+        except BaseException:
+            self._flush_quietly(stream)
+            raise
+
+    def _transfer_segment(self, session: requests.Session, segment: Segment, stream: BlockStream,
+                          digest: HashStream) -> None:
+        restarts = 0
+        while True:
+            with self.lock:
+                position, end = segment.offset, segment.end
+                if position >= end:
+                    segment.active = False
+                    stream.flush()
+                    digest.finish()
+                    return
+
+            response = self._open(session, position, end)
+            if response.status_code != 206:
+                response.close()
+                raise DownloadError("服务器不再支持分段下载", ErrorClass.CONNECT)
+
+            monitor = SpeedMonitor(self.min_speed, self.stall_window)
+            try:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    self._check()
+                    with self.lock:
+                        end = segment.end
+                    if position >= end:
+                        break
+                    chunk = chunk[:end - position]
+                    stream.write(chunk)
+                    digest.update(chunk)
+                    position += len(chunk)
+                    with self.lock:
+                        segment.offset = position
+                    self._add_progress(len(chunk))
+                    stalled = monitor.update(len(chunk))
+                    segment.speed = monitor.speed()
+                    if stalled:
+                        raise TransferStalled(f"{segment.speed / 1024:.1f} KB/s")
+            except (TransferStalled,) + STALL_ERRORS as e:
+                restarts = self._restart(restarts, str(e) or type(e).__name__)
+            else:
+                with self.lock:
+                    end = segment.end
+                if position < end:
+                    # 服务器在分段结束前关闭了连接（包括空响应），同样计入重连次数，避免无限重连
+                    restarts = self._restart(restarts, "响应提前结束", ErrorClass.CONNECT)
+            finally:
+                response.close()
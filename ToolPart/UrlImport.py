@@ -0,0 +1,103 @@
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+TASK_TYPES = ("playlist", "video")
+# 统计和分享链接中常见的跟踪参数，不影响页面内容
+TRACKING_PARAMS = {"fbclid", "gclid", "ref", "ref_src", "si", "feature"}
+URL_SEPARATORS = re.compile(r"[\s,，;；]+")
+
+
+def normalize_url(text: str) -> Optional[str]:
+    """规范化链接：统一为 https、域名小写、去掉片段和跟踪参数、参数排序；不是有效链接时返回 None"""
+    text = text.strip().strip("\"'<>")
+    if not text:
+        return None
+    if "://" not in text:
+        text = "https://" + text
+    try:
+        parts = urlsplit(text)
+    except ValueError:
+        return None
+    if parts.scheme.lower() not in ("http", "https") or "." not in parts.netloc:
+        return None
+
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key not in TRACKING_PARAMS and not key.startswith("utm_")]
+    query.sort()
+    path = parts.path
+    if len(path) > 1:
+        path = path.rstrip("/")
+    return urlunsplit(("https", parts.netloc.lower(), path, urlencode(query), ""))
+
+
+def parse_import(text: str, default_type: str = "playlist") -> Tuple[List[Dict[str, str]], int]:
+    """解析批量导入的内容，返回（条目列表，无效条目数）
+
+    每行可以是一个或多个以空白、逗号分隔的链接，或 JSONL 格式的 {"url": ..., "type": "playlist" | "video"}；
+    空行和 # 开头的行被忽略。
+    """
+    entries: List[Dict[str, str]] = []
+    invalid = 0
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        if line.startswith("{"):
+            try:
+                data = json.loads(line)
+                raw_items = [(str(data["url"]), str(data.get("type", default_type)))]
+            except (ValueError, KeyError, TypeError):
+                invalid += 1
+                continue
+        else:
+            raw_items = [(token, default_type) for token in URL_SEPARATORS.split(line) if token]
+
+        for raw_url, task_type in raw_items:
+            url = normalize_url(raw_url)
+            if url is None or task_type not in TASK_TYPES:
+                invalid += 1
+                continue
+            entries.append({"url": url, "task_type": task_type})
+    return entries, invalid
+
+
+def plan_import(entries: Iterable[Dict[str, str]], existing_urls: Iterable[str],
+                downloaded_urls: Iterable[str]) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+    """去除重复条目，返回（需要创建的任务，各原因跳过的数量）
+
+    existing_urls 为已有任务的链接，downloaded_urls 为下载目录中已有文件的视频链接（只用于单视频任务）。
+    """
+    known: Set[str] = {url for url in (normalize_url(u) for u in existing_urls) if url}
+    downloaded: Set[str] = {url for url in (normalize_url(u) for u in downloaded_urls) if url}
+    seen: Set[str] = set()
+    accepted: List[Dict[str, str]] = []
+    skipped = {"duplicate": 0, "existing": 0, "downloaded": 0}
+    for entry in entries:
+        url = entry["url"]
+        if url in seen:
+            skipped["duplicate"] += 1
+            continue
+        seen.add(url)
+        if url in known:
+            skipped["existing"] += 1
+        elif entry["task_type"] == "video" and url in downloaded:
+            skipped["downloaded"] += 1
+        else:
+            accepted.append(entry)
+    return accepted, skipped
+
+
+def describe_skipped(skipped: Dict[str, Any], invalid: int = 0) -> str:
+    parts = []
+    if skipped.get("duplicate"):
+        parts.append(f"重复 {skipped['duplicate']} 个")
+    if skipped.get("existing"):
+        parts.append(f"已有任务 {skipped['existing']} 个")
+    if skipped.get("downloaded"):
+        parts.append(f"已下载 {skipped['downloaded']} 个")
+    if invalid:
+        parts.append(f"无效 {invalid} 个")
+    return "，".join(parts)
@@ -0,0 +1,474 @@
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from ToolPart.Browser import (get_browser, wait_ele, wait_title_excludes,
+                              resource_blocking_stages, apply_resource_profile)
+from ToolPart.Estimator import format_duration, get_speed_estimator
+from ToolPart.EventLog import get_event_log
+from ToolPart.Extractor import extract_download_rows
+from ToolPart.Integrity import check_mp4
+from ToolPart.Lookahead import Resolution, ResolutionCache
+from ToolPart.MemoryGovernor import get_memory_governor
+from ToolPart.Profile import ProfilePool, get_profile_pool
+from ToolPart.RetryPolicy import DownloadError, ErrorClass, classify_error, get_circuit_breaker
+from ToolPart.Settings import ADVANCED_DEFAULTS
+from ToolPart.SourcePolicy import SourcePolicy
+from ToolPart.Staging import FileMover, get_file_mover, staging_dir_for
+from ToolPart.Transfer import FileTransfer, remove_partial
+from ToolPart.Watchdog import BrowserGuard, GuardedBrowser, run_with_deadline
+
+
+class VideoJob:
+    """单个视频的解析和下载：打开视频页和下载页、选择下载源、保存文件
+
+    不依赖 Qt，既可以在下载线程中直接调用，也可以在工作进程中运行。
+    日志、暂停/停止检查和等待都通过回调交给调用方。
+    """
+
+    def __init__(self, download_dir: str, headless: bool, settings: Dict[str, Any],
+                 source_policy: SourcePolicy, log: Callable[[str], None],
+                 checkpoint: Callable[[], bool], is_running: Callable[[], bool],
+                 sleep: Callable[[float], Any], is_paused: Optional[Callable[[], bool]] = None,
+                 discard_partials: Optional[Callable[[], bool]] = None):
+        self.download_dir = download_dir
+        self.headless = headless
+        self.settings = {**ADVANCED_DEFAULTS, **(settings or {})}
+        self.source_policy = source_policy
+        self.log_message = log
+        self.checkpoint = checkpoint  # 暂停时阻塞，返回任务是否仍在运行
+        self.is_running = is_running
+        self.sleep = sleep  # 可被停止打断的等待
+        # 暂停时解析和传输不在原地阻塞，而是释放浏览器和连接后退出，由下载线程重新排队
+        self.is_paused = is_paused or (lambda: False)
+        # 任务被删除时停止下载不保留断点，暂停和程序退出时保留
+        self.discard_partials = discard_partials or (lambda: False)
+        self.blocked_stages = resource_blocking_stages(self.settings, headless)
+        self.circuit_breaker = get_circuit_breaker(self.settings["CircuitBreakerThreshold"],
+                                                   self.settings["CircuitBreakerCooldown"])
+        self.profile_pool: Optional[ProfilePool] = None
+        if self.settings["PersistentProfile"]:
+            self.profile_pool = get_profile_pool(self.settings["ProfileDir"],
+                                                 self.settings["ProfileMaxMB"] * 1024 * 1024)
+        # 配置了暂存目录时先下载到暂存目录，完成后由后台队列移动到下载目录
+        self.staging_dir: Optional[str] = None
+        self.file_mover: Optional[FileMover] = None
+        if self.settings["StagingDir"]:
+            self.staging_dir = staging_dir_for(self.settings["StagingDir"], download_dir)
+            self.file_mover = get_file_mover(self.settings["StagingDir"])
+        self.file_records: Dict[str, Dict[str, Any]] = {}  # 文件名 -> 大小、摘要等校验信息
+        self.partials: Dict[str, Dict[str, Any]] = {}  # 视频URL -> 暂停或停止时保存了断点的文件和进度
+        # 浏览器内存管理：超出预算的浏览器在页面之间回收，解析完成的浏览器留给下一个视频复用
+        self.governor = get_memory_governor(self.settings)
+        self.browser_key = (self.headless, tuple(sorted(self.blocked_stages)),
+                            self.settings["ProfileDir"] if self.profile_pool else "")
+        # 失败时写入结构化事件日志
+        self.events = get_event_log(settings=self.settings)
+        # 传输速度和视频大小计入共享的估计，用于剩余时间和调度顺序
+        self.estimator = get_speed_estimator(self.settings)
+        # 预解析的下载源，由下载线程的预解析填入，下载时取出
+        self.resolutions = ResolutionCache()
+        # 同一个 VideoJob 会被多个下载线程同时使用，每次尝试的状态按线程保存：
+        # stage 和 stage_host 为尝试进行到的阶段和当时访问的主机，video_url 为正在下载的视频
+        self.local = threading.local()
+        os.makedirs(self.download_dir, exist_ok=True)
+
+        # 定义非法字符的正则表达式模式
+        self.illegal_chars_pattern = re.compile(r'[\\/*?:"<>|]')
+
+    def sanitize_filename(self, filename: str) -> str:
+        """清洗文件名，移除非法字符"""
+        clean_name = self.illegal_chars_pattern.sub('_', filename)
+        clean_name = clean_name.strip()
+
+        max_length = 200
+        if len(clean_name) > max_length:
+            name_part, ext = os.path.splitext(clean_name)
+            name_part = name_part[:max_length - len(ext)]
+            clean_name = name_part + ext
+
+        if not clean_name:
+            clean_name = "unnamed_video"
+
+        return clean_name
+
+    def file_exists(self, filepath: str) -> bool:
+        """文件已完整存在于下载目录中，或已下载完成正在等待移动
+
+        已存在但结构不完整的文件（如上次中断留下的）会被删除，以便重新下载。
+        """
+        if self.file_mover is not None and self.file_mover.is_pending(filepath):
+            return True
+        if not (os.path.exists(filepath) and os.path.isfile(filepath)):
+            return False
+
+        ok, reason = check_mp4(filepath)
+        if ok:
+            self.file_records[os.path.basename(filepath)] = {"filename": os.path.basename(filepath),
+                                                             "size": os.path.getsize(filepath)}
+            return True
+        self.log_message(f"已存在的文件不完整（{reason}），删除后重新下载: {os.path.basename(filepath)}")
+        try:
+            os.remove(filepath)
+        except OSError as e:
+            self.log_message(f"删除不完整文件失败: {str(e)}")
+            return True
+        return False
+
+    def open_browser(self) -> Tuple[GuardedBrowser, Optional[str]]:
+        """取得浏览器，启用持久化用户目录时同时租用一个槽位，返回（浏览器，槽位）
+
+        优先复用空闲的浏览器；需要启动新浏览器时，内存不足则先等待。
+        """
+        reused = self.governor.take_idle(self.browser_key)
+        if reused is not None:
+            reused[0].guard.log = self.log_message
+            return reused
+        if not self.governor.wait_for_memory(self.checkpoint, self.sleep, self.log_message):
+            raise DownloadError("任务已停止", ErrorClass.STOPPED)
+
+        slot = self.profile_pool.acquire() if self.profile_pool else None
+        try:
+            cache_size = self.profile_pool.cache_size_limit() if self.profile_pool else 0
+            browser = run_with_deadline(
+                lambda: get_browser(self.headless, bool(self.blocked_stages), slot, cache_size),
+                self.settings["BrowserOpTimeout"])
+        except Exception:
+            if slot:
+                self.profile_pool.release(slot)
+            raise
+        # 所有浏览器操作都有时限，卡死时强制结束浏览器进程
+        guard = BrowserGuard(browser, self.settings["BrowserOpTimeout"], self.log_message)
+        guarded = GuardedBrowser(browser, guard)
+        self.governor.register(guarded)
+        return guarded, slot
+
+    def release_browser(self, browser: Optional[GuardedBrowser], slot: Optional[str]) -> None:
+        """页面处理完成后归还浏览器：内存未超出预算时留给下一个页面复用，否则关闭"""
+        if browser is None:
+            return
+        if not self.governor.put_idle(self.browser_key, browser, slot, self.close_browser, self.log_message):
+            self.close_browser(browser, slot)
+
+    def close_browser(self, browser: Optional[GuardedBrowser], slot: Optional[str]) -> None:
+        """在时限内关闭浏览器并归还用户目录槽位"""
+        try:
+            if browser is not None:
+                self.governor.unregister(browser)
+                try:
+                    browser.guard.quit(self.settings["BrowserQuitTimeout"])
+                except Exception as e:
+                    self.log_message(f"关闭浏览器时出错: {str(e)}")
+        finally:
+            if slot and self.profile_pool:
+                self.profile_pool.release(slot)
+
+    def wait_for_host(self, url: str) -> bool:
+        """主机处于熔断状态时等待冷却结束，返回任务是否仍在运行"""
+        host = urlparse(url).netloc
+        remaining = self.circuit_breaker.remaining(host)
+        if remaining <= 0:
+            return self.is_running()
+
+        self.log_message(f"主机 {host} 连续失败，暂停 {remaining:.0f} 秒后再试")
+        while self.checkpoint():
+            remaining = self.circuit_breaker.remaining(host)
+            if remaining <= 0:
+                return True
+            self.sleep(min(remaining, 5))
+        return False
+
+    def keep_going(self) -> bool:
+        """浏览器等待期间的检查，停止或暂停时都立即返回"""
+        return self.is_running() and not self.is_paused()
+
+    def _interrupted(self) -> Tuple[None, str, str]:
+        """解析因停止或暂停而中断时的返回值"""
+        if not self.is_running():
+            return None, "任务已停止", ErrorClass.STOPPED
+        return None, "任务已暂停", ErrorClass.PAUSED
+
+    def _stage_failed(self, host: str, error_msg: str, error_class: str) -> Tuple[None, str, str]:
+        """记录解析阶段的失败并生成返回值"""
+        self.log_message(error_msg)
+        if self.circuit_breaker.record_failure(host, error_class):
+            self.log_message(f"主机 {host} 连续失败，已暂停对其的请求")
+        return None, error_msg, error_class
+
+    def attempt(self, video_url: str) -> Tuple[bool, str, Optional[str], str]:
+        """单个视频下载尝试，返回（是否成功，错误信息，文件名，失败类型）"""
+        self.local.stage, self.local.stage_host = "browser", urlparse(video_url).netloc
+        self.local.video_url = video_url
+        success, error, filename, error_class = self._attempt(video_url)
+        if success:
+            self.events.record_event("video_completed", url=video_url, filename=filename,
+                                     size=self.file_records.get(filename or "", {}).get("size"))
+        elif error_class not in (ErrorClass.STOPPED, ErrorClass.PAUSED):
+            self.events.record("attempt_failed", url=video_url, filename=filename, error=error,
+                               error_class=error_class, stage=self.local.stage, host=self.local.stage_host)
+        return success, error, filename, error_class
+
+    def _attempt(self, video_url: str) -> Tuple[bool, str, Optional[str], str]:
+        self.log_message(f"处理视频: {video_url}")
+        resolution = self.resolutions.take(video_url)
+        if resolution is not None and not resolution.valid_for(self.expiry_margin(resolution)):
+            self.log_message("预解析的下载链接即将过期，重新解析")
+            resolution = None
+        elif resolution is not None:
+            self.log_message("使用预解析的下载源")
+
+        if resolution is None:
+            resolution, error, error_class = self.resolve(video_url)
+            if resolution is None:
+                return False, error, None, error_class
+
+        success, error, filename, error_class = self.transfer(resolution)
+        if error_class == ErrorClass.FORBIDDEN and resolution.prefetched:
+            # 预解析的直链在使用前已失效：记下该主机直链的有效期，重新解析后再试一次
+            self.resolutions.mark_expired(resolution, self.local.stage_host)
+            self.log_message("预解析的下载链接已失效（403），重新解析")
+            resolution, error, error_class = self.resolve(video_url)
+            if resolution is None:
+                return False, error, filename, error_class
+            success, error, filename, error_class = self.transfer(resolution)
+        return success, error, filename, error_class
+
+    def expiry_margin(self, resolution: Resolution) -> float:
+        """取用解析结果时直链至少还要有效多久：按已知大小和主机速度估计的传输时间，不少于 LookaheadMargin"""
+        margin = float(self.settings["LookaheadMargin"])
+        size = self.estimator.expected_size(resolution.video_url)
+        speed = self.estimator.host_speed(urlparse(resolution.candidates[0]["url"]).netloc)
+        if size and speed:
+            margin = max(margin, size / speed)
+        return margin
+
+    def prefetch(self, video_url: str) -> Optional[Resolution]:
+        """预解析等待中的视频，失败时返回 None，下载时再重新解析"""
+        self.local.stage, self.local.stage_host = "browser", urlparse(video_url).netloc
+        self.log_message(f"预解析视频: {video_url}")
+        resolution, error, error_class = self.resolve(video_url)
+        if resolution is None and error_class not in (ErrorClass.STOPPED, ErrorClass.PAUSED):
+            self.log_message(f"预解析失败（{error}），下载时重新解析")
+        return resolution
+
+    def resolve(self, video_url: str) -> Tuple[Optional[Resolution], str, str]:
+        """打开视频页和下载页，解析出按策略排序的下载源，返回（解析结果，错误信息，失败类型）
+
+        失败时解析结果为 None；直链的过期时间从查询参数或该主机之前出现 403 的时间推算。
+        """
+        browser = None
+        slot = None
+        host = urlparse(video_url).netloc
+        if not self.keep_going():
+            return self._interrupted()
+
+        try:
+            browser, slot = self.open_browser()  # 使用headless参数
+            self.local.stage = "video_page"
+            apply_resource_profile(browser, "video", self.blocked_stages)
+            if not browser.get(video_url):
+                return self._stage_failed(host, "打开视频页面失败", ErrorClass.CONNECT)
+
+            # 如果不是无头模式，记录日志
+            if not self.headless:
+                self.log_message("非无头模式：正在打开视频页面...")
+
+            # 等待下载按钮出现，元素加载后立即返回
+            download_btn = wait_ele(browser, '#downloadBtn', 20, self.keep_going)
+            if not self.keep_going():
+                return self._interrupted()
+            if not download_btn:
+                return self._stage_failed(host, "等待下载按钮加载超时", ErrorClass.MISSING_ELEMENT)
+
+            download_page_url = download_btn.attr('href')
+            if not download_page_url:
+                return self._stage_failed(host, "下载按钮没有有效的链接", ErrorClass.MISSING_ELEMENT)
+
+            self.log_message(f"找到下载页面: {download_page_url}")
+            self.local.stage, self.local.stage_host = "download_page", urlparse(download_page_url).netloc or host
+            apply_resource_profile(browser, "download", self.blocked_stages)
+            if not browser.get(download_page_url):
+                return self._stage_failed(host, "打开下载页面失败", ErrorClass.CONNECT)
+
+            # 如果不是无头模式，记录日志
+            if not self.headless:
+                self.log_message("非无头模式：正在打开下载页面...")
+
+            # 等待Cloudflare验证，标题变化后立即返回
+            self.local.stage = "challenge"
+            passed = wait_title_excludes(browser, "Just a moment", 30, self.keep_going)
+            if not self.keep_going():
+                return self._interrupted()
+            if not passed:
+                return self._stage_failed(host, "等待Cloudflare验证完成超时", ErrorClass.CHALLENGE)
+
+            # 定位下载表格，一次脚本调用取出所有下载源
+            self.local.stage = "extract"
+            download_table = wait_ele(browser, '#content-div', 10, self.keep_going)
+            if not self.keep_going():
+                return self._interrupted()
+            if not download_table:
+                return self._stage_failed(host, "未找到下载表格", ErrorClass.MISSING_ELEMENT)
+
+            rows = extract_download_rows(browser)
+            if not rows:
+                return self._stage_failed(host, "未找到下载链接元素", ErrorClass.MISSING_ELEMENT)
+            self.circuit_breaker.record_success(host)
+
+            candidates = self.source_policy.rank(rows)
+            if not candidates:
+                return self._stage_failed(host, "未找到下载URL或文件名", ErrorClass.MISSING_ELEMENT)
+            if not self.source_policy.switch_on_error:
+                candidates = candidates[:1]
+            self.estimator.learn_size(video_url, candidates[0].get("size"))
+
+            # 文件传输不需要浏览器，先归还，传输期间浏览器可以处理其他视频或被回收
+            self.release_browser(browser, slot)
+            browser, slot = None, None
+            return Resolution(video_url, candidates, self.resolutions.estimate_expiry(candidates)), "", ""
+
+        except Exception as e:
+            error_msg = f"处理视频时出错: {str(e)}"
+            self.log_message(error_msg)
+            error_class = classify_error(e)
+            return None, error_msg, ErrorClass.BROWSER if error_class == ErrorClass.UNKNOWN else error_class
+        finally:
+            self.close_browser(browser, slot)
+
+    def transfer(self, resolution: Resolution) -> Tuple[bool, str, Optional[str], str]:
+        """按顺序尝试解析出的下载源，返回（是否成功，错误信息，文件名，失败类型）"""
+        self.local.video_url = resolution.video_url
+        filename = None
+        error, error_class = "", ErrorClass.UNKNOWN
+        try:
+            for i, source in enumerate(resolution.candidates):
+                video_download_url = source["url"]
+                raw_filename = (source["filename"] or "") + '.mp4'
+
+                filename = self.sanitize_filename(raw_filename)
+                self.log_message(f"原始文件名: {raw_filename} -> 清洗后: {filename}")
+
+                # 检查文件是否已存在
+                filepath = os.path.join(self.download_dir, filename)
+                if self.file_exists(filepath):
+                    self.log_message(f"文件已存在，跳过下载: {filename}")
+                    return True, "文件已存在，跳过下载", filename, ""
+
+                if not source["filename"]:
+                    error, error_class = "未找到文件名", ErrorClass.MISSING_ELEMENT
+                    continue
+
+                self.log_message(f"选择下载源: {self.describe_source(source)}")
+                self.estimator.learn_size(resolution.video_url, source.get("size"))
+                self.log_message(f"找到视频URL: {video_download_url}")
+                self.log_message(f"正在下载: {filename}")
+
+                self.local.stage, self.local.stage_host = "transfer", urlparse(video_download_url).netloc
+
+                success, error, error_class = self.save_video(video_download_url, filename)
+                if success or error_class in (ErrorClass.STOPPED, ErrorClass.PAUSED, ErrorClass.DISK_FULL):
+                    return success, error, filename, error_class
+                if i + 1 < len(resolution.candidates):
+                    self.log_message(f"下载源出错或过慢（{error_class}），改用下一个下载源")
+
+            return False, error, filename, error_class
+
+        except Exception as e:
+            error_msg = f"处理视频时出错: {str(e)}"
+            self.log_message(error_msg)
+            return False, error_msg, filename, classify_error(e)
+
+    def describe_source(self, source: Dict[str, Any]) -> str:
+        """下载源的简要描述，用于日志"""
+        quality = f"{source['quality']}p" if source.get("quality") else "未知分辨率"
+        size = f"{source['size'] / 1024 / 1024:.1f} MB" if source.get("size") else "未知大小"
+        return f"第 {source.get('index', '?')} 行，{quality}，{size}，{urlparse(source['url']).netloc}"
+
+    def save_video(self, url: str, filename: str) -> Tuple[bool, str, str]:
+        """保存视频文件，返回（是否成功，错误信息，失败类型）"""
+        clean_filename = self.sanitize_filename(filename)
+        filepath = os.path.join(self.download_dir, clean_filename)
+        # 未配置暂存目录时直接下载到下载目录
+        staged_path = os.path.join(self.staging_dir, clean_filename) if self.staging_dir else filepath
+        part_path = staged_path + ".part"
+        host = urlparse(url).netloc
+        # 进度回调可能在分段下载的线程中执行，先取出当前视频
+        video_url = getattr(self.local, "video_url", url)
+        transfer: Optional[FileTransfer] = None
+
+        if not self.is_running():
+            return False, "任务已停止", ErrorClass.STOPPED
+
+        try:
+            # 最终检查文件是否存在
+            if self.file_exists(filepath):
+                self.log_message(f"文件已存在，跳过下载: {clean_filename}")
+                return True, "文件已存在，跳过下载", ""
+
+            if not self.wait_for_host(url):
+                return False, "任务已停止", ErrorClass.STOPPED
+
+            headers = {
+                'Referer': 'https://hanime1.me/',
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            }
+
+            progress = {"last_percent": -1.0, "total": 0}
+
+            def report_progress(downloaded: int, total_size: int) -> None:
+                self.estimator.progress(video_url, host, downloaded, total_size)
+                if total_size > 0:
+                    if total_size != progress["total"]:
+                        # Content-Length 比下载表格中的大小准确
+                        self.estimator.learn_size(video_url, total_size)
+                        progress["total"] = total_size
+                    percent = (downloaded / total_size) * 100
+                    if abs(percent - progress["last_percent"]) > 1 or percent == 100:
+                        speed = self.estimator.transfer_speed(video_url)
+                        eta = self.estimator.transfer_eta(video_url)
+                        detail = f"，{speed / 1024 / 1024:.2f} MB/s，剩余 {format_duration(eta)}" if speed else ""
+                        self.log_message(f"下载进度: {clean_filename} - {percent:.1f}%{detail}")
+                        progress["last_percent"] = percent
+
+            # 先写入 .part 临时文件，完成后再改名，避免中断时留下不完整的正式文件
+            transfer = FileTransfer(url, part_path, headers, self.is_running, self.settings,
+                                    report_progress, self.log_message, self.is_paused)
+            total = transfer.run()
+            ok, reason = check_mp4(part_path)
+            if not ok:
+                raise DownloadError(f"下载的文件结构不完整: {reason}", ErrorClass.CORRUPT)
+            os.replace(part_path, staged_path)
+            self.file_records[clean_filename] = {"filename": clean_filename, "size": total,
+                                                 "sha256": transfer.digest, "host": host}
+
+            self.circuit_breaker.record_success(host)
+            if self.file_mover is not None:
+                self.file_mover.submit(staged_path, filepath)
+                self.log_message(f"下载完成，等待移动到下载目录: {clean_filename}")
+            else:
+                self.log_message(f"成功保存: {filepath}")
+            return True, "", ""
+
+        except Exception as e:
+            error_msg = str(e)
+            error_class = classify_error(e)
+            if error_class in (ErrorClass.PAUSED, ErrorClass.STOPPED):
+                # 保存了断点时保留 .part 文件，继续或下次启动后从断点下载；
+                # 不支持断点续传或任务已被删除时直接删除
+                discard = error_class == ErrorClass.STOPPED and self.discard_partials()
+                if transfer is not None and os.path.exists(transfer.state_path) and not discard:
+                    self.partials[video_url] = {"filename": clean_filename, "downloaded": transfer.downloaded,
+                                                "total": transfer.total}
+                    self.log_message(f"下载已中断，进度已保存: {clean_filename}")
+                else:
+                    remove_partial(part_path)
+                return False, error_msg, error_class
+            self.log_message(f"下载失败: {clean_filename} - {error_msg}")
+            if self.circuit_breaker.record_failure(host, error_class):
+                self.log_message(f"主机 {host} 连续失败，已暂停对其的请求")
+            remove_partial(part_path)
+            return False, error_msg, error_class
+        finally:
+            self.estimator.finish(video_url)
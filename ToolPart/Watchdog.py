@@ -0,0 +1,204 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+from typing import Any, Callable, Optional, List, Dict
+
+from ToolPart.Metrics import metrics
+from ToolPart.RetryPolicy import DownloadError, ErrorClass
+
+# 读取时会经 CDP 查询浏览器的属性，与方法调用一样限时；其他属性读取直接返回
+CDP_PROPERTIES = {"title", "url", "html", "text", "attrs", "shadow_root", "ready_state", "cookies"}
+# 页面导航的时限在浏览器自身的加载超时和重试之外额外留出的时间（秒）
+NAVIGATION_SLACK = 10.0
+
+try:
+    import psutil
+except ImportError:  # psutil 为可选依赖
+    psutil = None
+
+
+class BrowserHangError(DownloadError):
+    """浏览器操作超过时限，浏览器进程已被强制结束"""
+
+    def __init__(self, message: str):
+        super().__init__(message, ErrorClass.BROWSER)
+
+
+def list_descendants(pid: int) -> List[int]:
+    """列出进程的所有子孙进程"""
+    if psutil is not None:
+        try:
+            return [child.pid for child in psutil.Process(pid).children(recursive=True)]
+        except psutil.Error:
+            return []
+
+    if not os.path.isdir("/proc"):
+        return []
+    children: Dict[int, List[int]] = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "r") as f:
+                # 进程名可能含空格，取最后一个右括号之后的字段
+                fields = f.read().rsplit(")", 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(name))
+        except (OSError, IndexError, ValueError):
+            continue
+
+    result: List[int] = []
+    stack = [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            result.append(child)
+            stack.append(child)
+    return result
+
+
+def kill_process_tree(pid: Optional[int]) -> None:
+    """强制结束进程及其所有子进程"""
+    if not pid:
+        return
+    if sys.platform == "win32":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return
+
+    for target in list_descendants(pid) + [pid]:
+        try:
+            os.kill(target, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def run_with_deadline(func: Callable[[], Any], timeout: float) -> Any:
+    """在辅助线程中执行 func，超时抛出 TimeoutError（func 所在线程会被放弃）"""
+    result: Dict[str, Any] = {}
+
+    def target() -> None:
+        try:
+            result["value"] = func()
+        except BaseException as e:
+            result["error"] = e
+
+    worker = threading.Thread(target=target, daemon=True)
+    worker.start()
+    worker.join(timeout)
+    if worker.is_alive():
+        raise TimeoutError(f"操作超过 {timeout:.1f} 秒未返回")
+    if "error" in result:
+        raise result["error"]
+    return result.get("value")
+
+
+class BrowserGuard:
+    """为一个浏览器实例的所有操作设置时限，超时后结束整个浏览器进程树"""
+
+    def __init__(self, browser, op_timeout: float, log: Optional[Callable[[str], None]] = None):
+        self.browser = browser
+        self.op_timeout = op_timeout
+        self.log = log or (lambda message: None)
+        self.dead = False
+        try:
+            self.pid = browser.process_id
+        except Exception:
+            self.pid = None
+
+    def call(self, func: Callable[[], Any], operation: str, extra_timeout: float = 0) -> Any:
+        if self.dead:
+            raise BrowserHangError(f"浏览器已被回收，无法执行 {operation}")
+        try:
+            return run_with_deadline(func, self.op_timeout + extra_timeout)
+        except TimeoutError:
+            self.kill(operation)
+            raise BrowserHangError(f"浏览器操作 {operation} 无响应，已强制结束浏览器")
+
+    def kill(self, operation: str) -> None:
+        """结束浏览器进程树并记录事件"""
+        self.dead = True
+        self.log(f"浏览器操作 {operation} 超时，强制结束浏览器进程 {self.pid}")
+        metrics.record_event("browser_hang", operation=operation, pid=self.pid)
+        kill_process_tree(self.pid)
+
+    def terminate(self) -> None:
+        """程序退出时直接结束浏览器进程树，之后的浏览器操作立即失败"""
+        self.dead = True
+        kill_process_tree(self.pid)
+
+    def quit(self, timeout: float) -> None:
+        """在时限内关闭浏览器，超时或已回收则直接结束进程"""
+        if self.dead:
+            kill_process_tree(self.pid)
+            return
+        try:
+            run_with_deadline(self.browser.quit, timeout)
+        except TimeoutError:
+            self.kill("quit")
+
+
+def _is_browser_object(value: Any) -> bool:
+    return type(value).__module__.startswith("DrissionPage")
+
+
+class GuardedBrowser:
+    """浏览器代理：方法调用和经 CDP 查询的属性读取都经过 BrowserGuard 限时执行，
+
+    普通属性直接读取，不额外启动线程；返回的页面元素、等待器等对象同样被包装，调用方无需改动。
+    """
+
+    def __init__(self, target: Any, guard: BrowserGuard):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_guard", guard)
+
+    @property
+    def guard(self) -> BrowserGuard:
+        return self._guard
+
+    def __getattr__(self, name: str) -> Any:
+        if name in CDP_PROPERTIES:
+            value = self._guard.call(lambda: getattr(self._target, name), name)
+        else:
+            value = getattr(self._target, name)
+        if not _is_browser_object(value) and callable(value):
+            return self._wrap_method(value, name)
+        return self._wrap(value)
+
+    def __call__(self, *args, **kwargs):
+        return self._wrap_method(self._target, "__call__")(*args, **kwargs)
+
+    def __bool__(self) -> bool:
+        return bool(self._target)
+
+    def _wrap(self, value: Any) -> Any:
+        if _is_browser_object(value):
+            return GuardedBrowser(value, self._guard)
+        return value
+
+    def _wrap_method(self, method: Callable, name: str) -> Callable:
+        def guarded(*args, **kwargs):
+            if name == "get":
+                extra = self._navigation_time(kwargs)
+            else:
+                extra = kwargs.get("timeout") or 0
+                extra = extra if isinstance(extra, (int, float)) else 0
+            return self._wrap(self._guard.call(lambda: method(*args, **kwargs), name, extra))
+        return guarded
+
+    def _navigation_time(self, kwargs: Dict[str, Any]) -> float:
+        """打开页面最长可能用的时间：每次加载的超时乘以尝试次数，加上重试间隔
+
+        浏览器加载缓慢但仍在进行时由其自身的超时和重试处理，看门狗只在超出这一范围后才结束浏览器。
+        """
+        target = self._target
+        timeout = kwargs.get("timeout")
+        if not isinstance(timeout, (int, float)):
+            timeout = getattr(getattr(target, "timeouts", None), "page_load", 0) or 0
+        retry = kwargs.get("retry")
+        if not isinstance(retry, int):
+            retry = getattr(target, "retry_times", 0) or 0
+        interval = kwargs.get("interval")
+        if not isinstance(interval, (int, float)):
+            interval = getattr(target, "retry_interval", 0) or 0
+        return timeout * (retry + 1) + interval * retry + NAVIGATION_SLACK
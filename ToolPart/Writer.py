@@ -0,0 +1,221 @@
+import errno
+import os
+import queue
+import threading
+from typing import Dict, Optional, Tuple
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+
+class FileTarget:
+    """按偏移写入的目标文件（同步写入）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+        self.lock = threading.Lock()
+
+    def write_at(self, offset: int, data: bytes) -> None:
+        self._write(offset, data)
+
+    def _write(self, offset: int, data: bytes) -> None:
+        view = memoryview(data)
+        with self.lock:
+            if hasattr(os, "pwrite"):
+                while view:
+                    written = os.pwrite(self.fd, view, offset)
+                    view = view[written:]
+                    offset += written
+            else:
+                os.lseek(self.fd, offset, os.SEEK_SET)
+                while view:
+                    view = view[os.write(self.fd, view):]
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        """读取已写入的数据（先等待提交的写入完成）"""
+        self.flush()
+        with self.lock:
+            if hasattr(os, "pread"):
+                return os.pread(self.fd, size, offset)
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            return os.read(self.fd, size)
+
+    def sync(self) -> None:
+        """等待写入完成并刷到磁盘，之后保存的断点信息不会超前于文件内容"""
+        self.flush()
+        with self.lock:
+            os.fsync(self.fd)
+
+    def truncate(self, size: int) -> None:
+        self.flush()
+        with self.lock:
+            os.ftruncate(self.fd, size)
+
+    def preallocate(self, size: int) -> bool:
+        """一次性为文件分配 size 字节的磁盘空间，减少碎片；平台不支持时返回 False"""
+        if not hasattr(os, "posix_fallocate") or size <= 0:
+            return False
+        self.flush()
+        try:
+            with self.lock:
+                os.posix_fallocate(self.fd, 0, size)
+            return True
+        except OSError as e:
+            # 部分文件系统（如某些网络盘）不支持预分配
+            if e.errno in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL):
+                return False
+            raise
+
+    def flush(self) -> None:
+        """等待已提交的写入全部落盘（同步写入无需等待）"""
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            with self.lock:
+                os.close(self.fd)
+
+
+class BufferPool:
+    """限制所有后台写入队列中缓冲的总字节数，满时阻塞生产者（背压）"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, size: int) -> None:
+        with self.cond:
+            # 单块超过总容量时也允许写入，避免永久阻塞
+            while self.used > 0 and self.used + size > self.capacity:
+                self.cond.wait()
+            self.used += size
+
+    def release(self, size: int) -> None:
+        with self.cond:
+            self.used -= size
+            self.cond.notify_all()
+
+
+class AsyncFileTarget(FileTarget):
+    """写入交给所在磁盘卷的后台线程执行，网络读取线程不再等待磁盘"""
+
+    def __init__(self, path: str, writer: "VolumeWriter"):
+        super().__init__(path)
+        self.writer = writer
+        self.pending = 0
+        self.pending_cond = threading.Condition()
+        self.error: Optional[BaseException] = None
+
+    def write_at(self, offset: int, data: bytes) -> None:
+        self._raise_error()
+        with self.pending_cond:
+            self.pending += 1
+        self.writer.submit(self, offset, data)
+
+    def _done(self, error: Optional[BaseException]) -> None:
+        with self.pending_cond:
+            if error is not None and self.error is None:
+                self.error = error
+            self.pending -= 1
+            self.pending_cond.notify_all()
+
+    def _raise_error(self) -> None:
+        if self.error is not None:
+            raise self.error
+
+    def flush(self) -> None:
+        with self.pending_cond:
+            while self.pending > 0:
+                self.pending_cond.wait()
+        self._raise_error()
+
+
+class VolumeWriter:
+    """某个磁盘卷专用的写入线程"""
+
+    def __init__(self, name: str, buffers: BufferPool):
+        self.buffers = buffers
+        self.queue: "queue.Queue[Tuple[AsyncFileTarget, int, bytes]]" = queue.Queue()
+        self.thread = threading.Thread(target=self._loop, name=f"writer-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, target: AsyncFileTarget, offset: int, data: bytes) -> None:
+        self.buffers.acquire(len(data))
+        self.queue.put((target, offset, data))
+
+    def _loop(self) -> None:
+        while True:
+            target, offset, data = self.queue.get()
+            error = None
+            try:
+                if target.error is None:
+                    target._write(offset, data)
+            except BaseException as e:
+                error = e
+            finally:
+                self.buffers.release(len(data))
+                target._done(error)
+
+
+class BlockStream:
+    """顺序写入缓冲：把网络读到的小块攒成按块大小对齐的大块后再提交"""
+
+    def __init__(self, target: FileTarget, offset: int, block_size: int = DEFAULT_BLOCK_SIZE):
+        self.target = target
+        self.offset = offset  # 缓冲区第一个字节对应的文件位置
+        self.block_size = block_size
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self.buffer += data
+        # 第一次提交写到下一个块边界，此后每次提交都是完整对齐的块
+        boundary = self.block_size - (self.offset % self.block_size)
+        while len(self.buffer) >= boundary:
+            self.target.write_at(self.offset, bytes(self.buffer[:boundary]))
+            del self.buffer[:boundary]
+            self.offset += boundary
+            boundary = self.block_size
+
+    def flush(self) -> None:
+        """提交缓冲区中剩余的数据"""
+        if self.buffer:
+            self.target.write_at(self.offset, bytes(self.buffer))
+            self.offset += len(self.buffer)
+            self.buffer = bytearray()
+
+    def discard(self) -> None:
+        self.buffer = bytearray()
+
+
+_writers: Dict[int, VolumeWriter] = {}
+_writers_lock = threading.Lock()
+_buffers: Optional[BufferPool] = None
+
+
+def volume_id(path: str) -> int:
+    """路径（文件或目录）所在磁盘卷的标识"""
+    directory = os.path.abspath(path)
+    if not os.path.isdir(directory):
+        directory = os.path.dirname(directory)
+    while not os.path.exists(directory):
+        directory = os.path.dirname(directory)
+    return os.stat(directory).st_dev
+
+
+def open_target(path: str, write_behind: bool = False, buffer_bytes: int = 64 * 1024 * 1024) -> FileTarget:
+    """打开下载目标文件，write_behind 为 True 时使用所在卷的后台写入线程"""
+    global _buffers
+    if not write_behind:
+        return FileTarget(path)
+
+    volume = volume_id(path)
+    with _writers_lock:
+        if _buffers is None:
+            _buffers = BufferPool(buffer_bytes)
+        writer = _writers.get(volume)
+        if writer is None:
+            writer = VolumeWriter(str(volume), _buffers)
+            _writers[volume] = writer
+    return AsyncFileTarget(path, writer)
@@ -1,10 +1,57 @@
+import argparse
+import json
+import multiprocessing
+import os
 import sys
-from PyQt5.QtWidgets import QApplication
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+def parse_time(text: str, end: bool = False) -> Optional[datetime]:
+    """解析命令行中的时间，只给出日期时 end 为 True 取当天结束"""
+    if not text:
+        return None
+    value = datetime.fromisoformat(text)
+    if end and len(text) <= 10:
+        value += timedelta(days=1, microseconds=-1)
+    return value
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Hanime视频下载器")
+    parser.add_argument("--worker", metavar="URL", help="以工作节点方式运行，连接到指定的协调节点，如 http://192.168.1.10:8770")
+    parser.add_argument("--jobs", type=int, default=1, help="工作节点同时下载的视频数")
+    parser.add_argument("--download-root", default="", help="工作节点保存视频的目录，不指定时使用协调节点的下载目录")
+    parser.add_argument("--token", default="", help="协调节点的口令（ClusterToken）")
+    parser.add_argument("--name", default="", help="工作节点名称，默认为主机名和进程号")
+    parser.add_argument("--show-browser", action="store_true", help="工作节点关闭无头模式")
+    parser.add_argument("--config", default="./config.ini", help="读取高级设置的配置文件")
+    parser.add_argument("--failure-report", action="store_true", help="汇总事件日志中的下载失败后退出")
+    parser.add_argument("--since", help="汇总的开始时间，如 2024-05-01 或 2024-05-01T20:00")
+    parser.add_argument("--until", help="汇总的结束时间，只给出日期时包含当天")
+    parser.add_argument("--log-dir", default="./logger/events", help="事件日志目录")
+    parser.add_argument("--json", action="store_true", help="以 JSON 格式输出汇总结果")
+    # 其余参数留给 Qt
+    return parser.parse_known_args()
 
-from ToolPart.GUI import HanimeDownloaderApp
 
 def main():
-    app = QApplication(sys.argv)
+    args, qt_args = parse_args()
+    if args.failure_report:
+        from ToolPart.EventLog import format_summary, summarize
+        summary = summarize(args.log_dir, parse_time(args.since), parse_time(args.until, end=True))
+        print(json.dumps(summary, ensure_ascii=False, indent=2) if args.json else format_summary(summary))
+        return
+    if args.worker:
+        from ToolPart.Cluster import run_worker
+        run_worker(args.worker, args.jobs, not args.show_browser, args.download_root,
+                   args.token, args.name, args.config)
+        return
+
+    from PyQt5.QtWidgets import QApplication
+    from ToolPart.GUI import HanimeDownloaderApp
+
+    app = QApplication(sys.argv[:1] + qt_args)
 
     # 设置应用样式
     app.setStyle("Fusion")
@@ -12,7 +59,13 @@ def main():
     window = HanimeDownloaderApp()
     window.show()
 
-    sys.exit(app.exec_())
+    code = app.exec_()
+    if window.forced_exit:
+        # 有下载线程未在退出时限内结束，不再等待它们（任务记录和已保存的断点不受影响）
+        os._exit(code)
+    sys.exit(code)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # 打包后的程序启动下载工作进程时需要
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1 @@
+# 在仓库根目录运行 pytest 时，pytest 把本文件所在目录加入 sys.path，tests/ 下的测试可以直接导入 ToolPart
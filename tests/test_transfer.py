@@ -0,0 +1,195 @@
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ToolPart.RetryPolicy import DownloadError, ErrorClass
+from ToolPart.Settings import ADVANCED_DEFAULTS
+from ToolPart import Transfer
+from ToolPart.Transfer import STATE_SUFFIX, FileTransfer
+
+DATA = random.Random(1).randbytes(2 * 1024 * 1024)
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 传输被客户端主动断开是测试的一部分，不打印异常
+        pass
+
+
+class FileServer:
+    """本地测试服务器，behavior(handler, start, end, request_index) 决定每个请求的响应"""
+
+    def __init__(self, behavior):
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                start, _, end = self.headers.get("Range", "bytes=0-")[6:].partition("-")
+                start = int(start)
+                end = int(end) + 1 if end else len(DATA)
+                server.requests.append(start)
+                try:
+                    behavior(self, start, end, len(server.requests))
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self.httpd = QuietServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d/video.mp4" % self.httpd.server_address[1]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def send_range(handler, start, end, body=None):
+    body = DATA[start:end] if body is None else body
+    handler.send_response(206)
+    handler.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(DATA)}")
+    handler.send_header("Content-Length", str(len(body)))
+    handler.send_header("ETag", '"v1"')
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def send_full(handler):
+    handler.send_response(200)
+    handler.send_header("Content-Length", str(len(DATA)))
+    handler.end_headers()
+    handler.wfile.write(DATA)
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(behavior):
+        servers.append(FileServer(behavior))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def make_transfer(url, path, is_paused=lambda: False, **settings):
+    return FileTransfer(url, str(path), {}, lambda: True, {**ADVANCED_DEFAULTS, **settings},
+                        is_paused=is_paused)
+
+
+def test_segment_ending_early_is_bounded(serve, tmp_path):
+    # 第一个分段正常，其余分段只返回空响应：重连次数用完后失败，而不是无限重连
+    def behavior(handler, start, end, index):
+        send_range(handler, start, end, b"" if start else None)
+
+    server = serve(behavior)
+    transfer = make_transfer(server.url, tmp_path / "video.mp4.part", Segments=4, SegmentMinMB=1,
+                             MaxStallRestarts=2)
+    with pytest.raises(DownloadError) as error:
+        transfer.run()
+    assert error.value.error_class == ErrorClass.CONNECT
+    assert len(server.requests) < 20
+
+
+def test_single_restart_falls_back_when_range_is_ignored(serve, tmp_path):
+    # 第一次传输一半后断开，之后服务器忽略 Range 返回完整内容：应从头重新下载，而不是接在已写入的数据之后
+    def behavior(handler, start, end, index):
+        if index == 1:
+            handler.send_response(206)
+            handler.send_header("Content-Range", f"bytes 0-{len(DATA) - 1}/{len(DATA)}")
+            handler.send_header("Content-Length", str(len(DATA)))
+            handler.end_headers()
+            handler.wfile.write(DATA[:len(DATA) // 2])
+            handler.wfile.flush()
+            handler.connection.shutdown(2)
+        else:
+            send_full(handler)
+
+    server = serve(behavior)
+    path = tmp_path / "video.mp4.part"
+    assert make_transfer(server.url, path, Segments=1).run() == len(DATA)
+    assert path.read_bytes() == DATA
+    assert server.requests[:2] == [0, len(DATA) // 2]
+
+
+def send_slowly(handler, start, end):
+    handler.send_response(206)
+    handler.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(DATA)}")
+    handler.send_header("Content-Length", str(end - start))
+    handler.send_header("ETag", '"v1"')
+    handler.end_headers()
+    for offset in range(start, end, 64 * 1024):
+        handler.wfile.write(DATA[offset:min(offset + 64 * 1024, end)])
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("segments", [1, 4])
+def test_pause_saves_state_and_resumes_byte_exact(serve, tmp_path, segments):
+    server = serve(lambda handler, start, end, index: send_slowly(handler, start, end))
+    path = tmp_path / "video.mp4.part"
+    paused = threading.Event()
+    threading.Timer(0.1, paused.set).start()
+
+    with pytest.raises(DownloadError) as error:
+        make_transfer(server.url, path, paused.is_set, Segments=segments, SegmentMinMB=1).run()
+    assert error.value.error_class == ErrorClass.PAUSED
+    assert os.path.exists(str(path) + STATE_SUFFIX)
+
+    resumed_from = len(server.requests)
+    transfer = make_transfer(server.url, path, Segments=segments, SegmentMinMB=1)
+    assert transfer.run() == len(DATA)
+    assert path.read_bytes() == DATA
+    assert not os.path.exists(str(path) + STATE_SUFFIX)
+    # 继续时各分段从保存的位置请求，不会全部从头开始
+    assert any(start > 0 for start in server.requests[resumed_from + 1:])
+
+
+def test_space_wait_closes_response_and_reopens(serve, tmp_path, monkeypatch):
+    server = serve(lambda handler, start, end, index: send_range(handler, start, end))
+    waited = []
+
+    class Reservation:
+        def release(self):
+            pass
+
+        def update(self, downloaded):
+            pass
+
+    class Tracker:
+        def reserve(self, path, size, min_free, checkpoint, log=None, before_wait=None):
+            # 模拟空间不足需要等待：等待前连接应已断开
+            before_wait()
+            waited.append(checkpoint())
+            return Reservation()
+
+    monkeypatch.setattr(Transfer, "get_space_tracker", lambda: Tracker())
+    path = tmp_path / "video.mp4.part"
+    assert make_transfer(server.url, path, Segments=1).run() == len(DATA)
+    assert path.read_bytes() == DATA
+    assert waited == [True]
+    assert server.requests == [0, 0]
+
+
+def test_space_wait_raises_paused_instead_of_blocking(serve, tmp_path, monkeypatch):
+    server = serve(lambda handler, start, end, index: send_range(handler, start, end))
+
+    class Tracker:
+        def reserve(self, path, size, min_free, checkpoint, log=None, before_wait=None):
+            return checkpoint()
+
+    monkeypatch.setattr(Transfer, "get_space_tracker", lambda: Tracker())
+    with pytest.raises(DownloadError) as error:
+        make_transfer(server.url, tmp_path / "video.mp4.part", lambda: True).run()
+    assert error.value.error_class == ErrorClass.PAUSED
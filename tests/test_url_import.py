@@ -0,0 +1,103 @@
+from ToolPart.UrlImport import describe_skipped, normalize_url, parse_import, plan_import
+
+
+def test_normalize_rewrites_scheme_and_host():
+    assert normalize_url("HTTP://Hanime1.ME/playlist?list=abc") == "https://hanime1.me/playlist?list=abc"
+    assert normalize_url("hanime1.me/watch?v=1") == "https://hanime1.me/watch?v=1"
+    assert normalize_url("  <https://hanime1.me/playlist/>  ") == "https://hanime1.me/playlist"
+
+
+def test_normalize_strips_tracking_and_fragment_and_sorts_query():
+    url = "https://hanime1.me/watch?v=123&utm_source=share&fbclid=x&si=y&b=2&a=1#comments"
+    assert normalize_url(url) == "https://hanime1.me/watch?a=1&b=2&v=123"
+
+
+def test_normalize_keeps_video_id():
+    # v= 决定是哪个视频，去掉它会让不同视频被当作重复
+    assert normalize_url("https://hanime1.me/watch?v=39000&ref=home") == "https://hanime1.me/watch?v=39000"
+    assert normalize_url("https://hanime1.me/watch?v=1") != normalize_url("https://hanime1.me/watch?v=2")
+
+
+def test_normalize_rejects_invalid():
+    assert normalize_url("") is None
+    assert normalize_url("   ") is None
+    assert normalize_url("ftp://hanime1.me/file") is None
+    assert normalize_url("not-a-url") is None
+
+
+def test_parse_import_plain_and_separated_lines():
+    text = """
+    # 注释行
+    https://hanime1.me/playlist?list=a, https://hanime1.me/playlist?list=b
+    https://hanime1.me/playlist?list=c；hanime1.me/playlist?list=d
+
+    """
+    entries, invalid = parse_import(text)
+    assert invalid == 0
+    assert [entry["url"] for entry in entries] == [
+        "https://hanime1.me/playlist?list=a",
+        "https://hanime1.me/playlist?list=b",
+        "https://hanime1.me/playlist?list=c",
+        "https://hanime1.me/playlist?list=d",
+    ]
+    assert all(entry["task_type"] == "playlist" for entry in entries)
+
+
+def test_parse_import_default_type():
+    entries, invalid = parse_import("https://hanime1.me/watch?v=1", "video")
+    assert invalid == 0
+    assert entries == [{"url": "https://hanime1.me/watch?v=1", "task_type": "video"}]
+
+
+def test_parse_import_jsonl():
+    text = "\n".join([
+        '{"url": "https://hanime1.me/watch?v=1", "type": "video"}',
+        '{"url": "https://hanime1.me/playlist?list=a"}',
+        '{"url": "https://hanime1.me/watch?v=2", "type": "album"}',
+        '{"type": "video"}',
+        '{not json',
+    ])
+    entries, invalid = parse_import(text)
+    assert entries == [
+        {"url": "https://hanime1.me/watch?v=1", "task_type": "video"},
+        {"url": "https://hanime1.me/playlist?list=a", "task_type": "playlist"},
+    ]
+    assert invalid == 3
+
+
+def test_parse_import_counts_invalid_urls():
+    entries, invalid = parse_import("https://hanime1.me/watch?v=1 not-a-url ftp://x.com/a")
+    assert len(entries) == 1
+    assert invalid == 2
+
+
+def test_plan_import_skips_duplicates_existing_and_downloaded():
+    entries, _ = parse_import("\n".join([
+        "https://hanime1.me/playlist?list=a",
+        "HTTPS://HANIME1.ME/playlist?list=a&utm_source=x",
+        "https://hanime1.me/playlist?list=b",
+        '{"url": "hanime1.me/watch?v=1&ref=share", "type": "video"}',
+        '{"url": "https://hanime1.me/watch?v=2", "type": "video"}',
+    ]))
+    existing = ["http://hanime1.me/playlist?list=b#top"]
+    # 文件记录中保存的是原始视频链接
+    downloaded = ["https://hanime1.me/watch?v=1"]
+
+    accepted, skipped = plan_import(entries, existing, downloaded)
+    assert [entry["url"] for entry in accepted] == [
+        "https://hanime1.me/playlist?list=a",
+        "https://hanime1.me/watch?v=2",
+    ]
+    assert skipped == {"duplicate": 1, "existing": 1, "downloaded": 1}
+
+
+def test_plan_import_downloaded_only_applies_to_videos():
+    entries = [{"url": "https://hanime1.me/watch?v=1", "task_type": "playlist"}]
+    accepted, skipped = plan_import(entries, [], ["https://hanime1.me/watch?v=1"])
+    assert accepted == entries
+    assert skipped["downloaded"] == 0
+
+
+def test_describe_skipped():
+    assert describe_skipped({"duplicate": 2, "existing": 0, "downloaded": 1}, invalid=3) == "重复 2 个，已下载 1 个，无效 3 个"
+    assert describe_skipped({"duplicate": 0, "existing": 0, "downloaded": 0}) == ""